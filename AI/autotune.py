@@ -0,0 +1,229 @@
+import json
+from io import BytesIO
+from math import ceil
+from logging import getLogger
+from os import cpu_count, path, replace
+from platform import machine, processor
+from time import perf_counter
+from typing import Callable, Dict, List, Optional
+import numpy as np
+import torch
+from PIL import Image  # type: ignore
+from settings import Settings  # type: ignore
+from DATABASE.database import filesense_path  # type: ignore
+from .engine import AIEngine, inference_threads
+
+logger = getLogger(__name__)
+
+AUTOTUNE_PATH = path.join(filesense_path, "autotune.json")
+AUTOTUNE_VERSION = 1
+TUNED_SETTINGS = (
+    "INFERENCE_THREADS",
+    "CAPTION_BATCH_SIZE",
+    "IMAGE_BATCH_SIZE",
+    "SEARCH_BATCH_SIZE",
+    "DECODE_WORKERS",
+)
+CAPTION_BATCH_SIZES = (1, 2, 4, 8, 16)
+IMAGE_BATCH_SIZES = (1, 2, 4, 8, 16, 32)
+TEXT_BATCH_SIZES = (1, 4, 8, 16, 32, 64)
+# the smallest batch within this share of the best throughput wins
+BATCH_TOLERANCE = 0.9
+MIN_MEASURE_SECONDS = 0.3
+
+
+def _fingerprint(ae: AIEngine) -> Dict:
+    return {
+        "version": AUTOTUNE_VERSION,
+        "cpu_count": cpu_count(),
+        "machine": machine(),
+        "processor": processor(),
+        "torch": torch.__version__,
+        "device": ae.device,
+        "backend": ae.settings.INFERENCE_BACKEND,
+        "model_identity": ae.model_identity,
+    }
+
+
+def _measure(run: Callable[[], None], items: int) -> float:
+    """Returns the items per second of `run`, after one warm-up call."""
+    run()
+    (calls, started) = (0, perf_counter())
+    while True:
+        run()
+        calls += 1
+        elapsed = perf_counter() - started
+        if elapsed >= MIN_MEASURE_SECONDS:
+            return calls * items / elapsed
+
+
+def _pick_batch_size(rates: Dict[int, float]) -> int:
+    best = max(rates.values())
+    return min(size for size, rate in rates.items() if rate >= best * BATCH_TOLERANCE)
+
+
+def _synthetic_photo(width: int = 4000, height: int = 3000) -> bytes:
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    noise = np.random.default_rng(0).integers(0, 32, (height, width, 3))
+    pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def _set_threads(ae: AIEngine, threads: int) -> None:
+    torch.set_num_threads(threads)
+    ae.settings.INFERENCE_THREADS = threads
+    if ae.onnx:
+        # ONNX Runtime sessions read their thread count when created
+        for slot in ae.slots:
+            slot.unload()
+
+
+def autotune(ae: AIEngine) -> Dict:
+    """Benchmarks the engine models on synthetic inputs on this host.
+
+    Picks the intra-op thread count on the image model, then the batch
+    size of each model, and sizes the decode pool so that decoding keeps
+    up with inference. Returns the chosen settings and the measurements.
+    """
+    preprocessor = ae.preprocessor
+    photo = _synthetic_photo()
+    image = preprocessor.decode(BytesIO(photo))
+    caption_pixels = preprocessor.caption_pixels(image)
+    image_pixels = preprocessor.image_pixels(image)
+    measurements: Dict[str, Dict] = {}
+    (default_threads, configured_threads) = (
+        torch.get_num_threads(),
+        ae.settings.INFERENCE_THREADS,
+    )
+
+    cores = cpu_count() or 1
+    # each concurrent forward pass gets a share of the cores at most
+    ae.settings.INFERENCE_THREADS = 0
+    share = inference_threads(ae.settings)
+    thread_counts = sorted({1, max(1, share // 2), share})
+    image_batch = np.stack([image_pixels] * 8)
+    measurements["threads"] = {}
+    for threads in thread_counts:
+        _set_threads(ae, threads)
+        measurements["threads"][threads] = _measure(
+            lambda: ae.embed_pixel_values(image_batch, 8), 8
+        )
+    threads = max(measurements["threads"], key=measurements["threads"].get)
+    _set_threads(ae, threads)
+    logger.info("autotune: %d inference threads", threads)
+
+    measurements["caption"] = {}
+    for batch_size in CAPTION_BATCH_SIZES:
+        batch = np.stack([caption_pixels] * batch_size)
+        measurements["caption"][batch_size] = _measure(
+            lambda: ae.caption_pixel_values(batch, batch_size), batch_size
+        )
+    measurements["image"] = {}
+    for batch_size in IMAGE_BATCH_SIZES:
+        batch = np.stack([image_pixels] * batch_size)
+        measurements["image"][batch_size] = _measure(
+            lambda: ae.embed_pixel_values(batch, batch_size), batch_size
+        )
+    measurements["text"] = {}
+    for batch_size in TEXT_BATCH_SIZES:
+        texts = ["a photo of a dog playing on the beach"] * batch_size
+        measurements["text"][batch_size] = _measure(
+            lambda: ae.generate_text_embedding(texts), batch_size
+        )
+    caption_batch_size = _pick_batch_size(measurements["caption"])
+    image_batch_size = _pick_batch_size(measurements["image"])
+
+    decode_rate = _measure(
+        lambda: preprocessor(preprocessor.decode(BytesIO(photo))), 1
+    )
+    inference_rate = 1 / (
+        1 / measurements["caption"][caption_batch_size]
+        + 1 / measurements["image"][image_batch_size]
+    )
+    measurements["decode"] = {"decode": decode_rate, "inference": inference_rate}
+    # decoding on the pipeline thread is enough while it outpaces inference,
+    # and worker processes only help with a core to spare for them
+    decode_workers = 0
+    if decode_rate < inference_rate:
+        decode_workers = min(ceil(inference_rate / decode_rate), cores - 1)
+
+    # apply_autotune decides which of the results are used
+    _set_threads(ae, default_threads)
+    ae.settings.INFERENCE_THREADS = configured_threads
+    return {
+        "config": {
+            "INFERENCE_THREADS": threads,
+            "CAPTION_BATCH_SIZE": caption_batch_size,
+            "IMAGE_BATCH_SIZE": image_batch_size,
+            "SEARCH_BATCH_SIZE": _pick_batch_size(measurements["text"]),
+            "DECODE_WORKERS": decode_workers,
+        },
+        "measurements": measurements,
+    }
+
+
+def load_autotune(ae: AIEngine) -> Optional[Dict[str, int]]:
+    """Returns the persisted settings if they were tuned for this host."""
+    try:
+        with open(AUTOTUNE_PATH) as f:
+            tuned = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if tuned.get("fingerprint") != _fingerprint(ae):
+        return None
+    return tuned.get("config")
+
+
+def save_autotune(ae: AIEngine, tuned: Dict) -> None:
+    tmp_path = f"{AUTOTUNE_PATH}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"fingerprint": _fingerprint(ae), **tuned}, f, indent=2)
+    replace(tmp_path, AUTOTUNE_PATH)
+
+
+def apply_autotune(ae: AIEngine, config: Dict[str, int]) -> List[str]:
+    """Applies the tuned settings that were not configured explicitly.
+
+    The engine settings are updated in place; the indexer and the search
+    batcher default to them. Returns the names of the applied settings.
+    """
+    configured = Settings().model_fields_set
+    applied = []
+    for name in TUNED_SETTINGS:
+        if name not in config or name in configured:
+            continue
+        setattr(ae.settings, name, config[name])
+        applied.append(name)
+    if "INFERENCE_THREADS" in applied:
+        _set_threads(ae, config["INFERENCE_THREADS"])
+    return applied
+
+
+def tune_engine(ae: AIEngine, force: bool = False) -> bool:
+    """Benchmarks the engine and persists the result when it is due.
+
+    Tuning takes minutes on a CPU, so it only runs when forced, or on the
+    first start on a host when AUTOTUNE is enabled; a change of host or
+    models counts as a new host. The server runs it once, before its
+    workers start, so that the benchmark has the cores to itself.
+    Returns whether the engine was benchmarked.
+    """
+    if not force and (load_autotune(ae) is not None or not ae.settings.AUTOTUNE):
+        return False
+    logger.info("autotune: benchmarking models, this runs once per host")
+    save_autotune(ae, autotune(ae))
+    return True
+
+
+def apply_persisted_autotune(ae: AIEngine) -> None:
+    """Applies the persisted tuning of this host, if there is any."""
+    config = load_autotune(ae)
+    if config is None:
+        return
+    applied = apply_autotune(ae, config)
+    if applied:
+        logger.info(
+            "autotune: %s", ", ".join(f"{name}={config[name]}" for name in applied)
+        )
@@ -0,0 +1,130 @@
+from concurrent.futures import Future
+from queue import Empty, Queue
+from threading import Thread
+from time import monotonic
+from typing import (
+    BinaryIO,
+    Callable,
+    Generic,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+import numpy as np
+from PIL import Image  # type: ignore
+from settings import Settings  # type: ignore
+from .engine import AIEngine
+from .query_cache import QueryEmbeddingCache, normalize_query
+from .scheduler import InferenceScheduler, get_scheduler
+
+I = TypeVar("I")
+O = TypeVar("O")
+
+
+class MicroBatcher(Generic[I, O]):
+    """Coalesces concurrent single-item calls into batched forward passes.
+
+    The first queued item opens a batch that collects whatever else
+    arrives within `max_wait` seconds, up to `max_batch_size` items. The
+    batch runs in one call of `run_batch` on the batcher thread and each
+    caller gets its own result, or the exception the batch raised.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[I]], Sequence[O]],
+        max_batch_size: int,
+        max_wait: float,
+    ) -> None:
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.__queue: Queue = Queue()
+        Thread(target=self.__loop, daemon=True).start()
+
+    def submit(self, item: I) -> O:
+        future: Future = Future()
+        self.__queue.put((item, future))
+        return future.result()
+
+    def __collect(self) -> List[Tuple[I, Future]]:
+        batch = [self.__queue.get()]
+        deadline = monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self.__queue.get(timeout=remaining))
+                else:
+                    batch.append(self.__queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def __loop(self) -> None:
+        while True:
+            batch = self.__collect()
+            try:
+                results = self.run_batch([item for item, _ in batch])
+            except BaseException as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+class SearchQueryBatcher(object):
+    """Embeds the queries of concurrent search requests in shared batches.
+
+    Image queries are decoded and preprocessed on the calling thread, so
+    only the ViT forward pass is shared. Text queries that were embedded
+    before are answered from `text_cache` without touching the model.
+    The batches run in the interactive lane of the inference scheduler;
+    when it is full, the queries of the batch fail with
+    `InferenceQueueFullError`.
+    """
+
+    def __init__(
+        self,
+        ae: AIEngine,
+        settings: Optional[Settings] = None,
+        scheduler: Optional[InferenceScheduler] = None,
+    ) -> None:
+        self.ae = ae
+        settings = settings or ae.settings
+        self.scheduler = scheduler or get_scheduler(settings)
+        max_wait = settings.SEARCH_BATCH_WAIT_MS / 1000
+        self.text_cache = QueryEmbeddingCache(settings.TEXT_QUERY_CACHE_SIZE)
+        self.__text_batcher: MicroBatcher[str, List[float]] = MicroBatcher(
+            self.__embed_texts, settings.SEARCH_BATCH_SIZE, max_wait
+        )
+        self.__image_batcher: MicroBatcher[np.ndarray, List[float]] = MicroBatcher(
+            self.__embed_pixel_values, settings.SEARCH_BATCH_SIZE, max_wait
+        )
+
+    def embed_text(self, text: str) -> List[float]:
+        query = normalize_query(text)
+        embedding = self.text_cache.get(self.ae.model_identity, query)
+        if embedding is None:
+            embedding = self.__text_batcher.submit(query)
+            self.text_cache.put(self.ae.model_identity, query, embedding)
+        return embedding
+
+    def embed_image(self, image: Union[str, BinaryIO, Image.Image]) -> List[float]:
+        preprocessor = self.ae.preprocessor
+        pixel_values = preprocessor.image_pixels(preprocessor.decode(image))
+        return self.__image_batcher.submit(pixel_values)
+
+    def __embed_texts(self, texts: List[str]) -> List[List[float]]:
+        return self.scheduler.submit(self.ae.generate_text_embedding, texts).result()
+
+    def __embed_pixel_values(self, pixel_values: List[np.ndarray]) -> List[List[float]]:
+        return (
+            self.scheduler.submit(self.ae.embed_pixel_values, np.stack(pixel_values))
+            .result()
+            .tolist()
+        )
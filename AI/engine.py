@@ -1,13 +1,22 @@
-import nltk  # type: ignore
+import numpy as np
 from dill import load as dillload  # type: ignore
-from os import path
+from hashlib import blake2b
+from logging import getLogger
+from os import cpu_count, getpid, makedirs, path, replace
+from threading import Thread
+from time import sleep
+from typing import BinaryIO, List, Optional, Tuple, Union
 from PIL import Image  # type: ignore
 from settings import Settings  # type: ignore
 import torch.nn.functional as F
-import torchvision.transforms as T  # type: ignore
 from torch.cuda import is_available
-from torch import no_grad, sum, clamp, load
+from torch import no_grad, sum, clamp, load, from_numpy, nn, qint8
+from torch import set_num_interop_threads, set_num_threads
+from torch import __version__ as torch_version
+from torch.ao.quantization import quantize_dynamic
+from torch.jit import load as jit_load, save as jit_save
 from transformers import (  # type: ignore
+    BlipConfig,
     BlipProcessor,
     BlipForConditionalGeneration,
     AutoModel,
@@ -20,7 +29,38 @@ from error import (  # type: ignore
     ImageEmbeddingGenerationError,
     TextEmbeddingGenerationError,
 )
-from .model import Encoder, Decoder  # type: ignore
+from DATABASE.database import filesense_path  # type: ignore
+from .loader import ModelSlot, release_memory  # type: ignore
+from .model import Encoder, Decoder, freeze_captioner, trim_at_end  # type: ignore
+from .onnx_backend import (  # type: ignore
+    OnnxCaptioner,
+    OnnxImageEncoder,
+    OnnxTextEncoder,
+    export_caption_model,
+    export_image_model,
+    export_text_model,
+)
+from .preprocess import ImagePreprocessor  # type: ignore
+from .weights import fingerprint_files, load_pretrained  # type: ignore
+
+logger = getLogger(__name__)
+
+CAPTION_MAX_LENGTH = 80
+INFERENCE_BACKENDS = ("torch", "onnx")
+INFERENCE_PRECISIONS = ("fp32", "int8")
+
+
+def inference_threads(settings: Settings) -> int:
+    """Returns the intra-op thread count of each forward pass.
+
+    Every server worker runs up to INFERENCE_WORKERS forward passes at the
+    same time, so unless INFERENCE_THREADS is set they split the cores
+    instead of oversubscribing them.
+    """
+    if settings.INFERENCE_THREADS > 0:
+        return settings.INFERENCE_THREADS
+    streams = max(1, settings.WEB_WORKERS) * max(1, settings.INFERENCE_WORKERS)
+    return max(1, (cpu_count() or 1) // streams)
 
 
 class AIEngine(object):
@@ -30,140 +70,456 @@ class AIEngine(object):
         return cls.instance
 
     def __init__(self) -> None:
+        # AIEngine() is called wherever the engine is needed; load once
+        if getattr(self, "settings", None) is not None:
+            return
         try:
-            nltk.download("punkt")
             self.settings = Settings()
-            with open(
-                path.join(
-                    self.settings.ROOT_DIR, "AI", "model-exp-caption", "vocab.pkl"
-                ),
-                "rb",
-            ) as f:
-                self.vocab = dillload(f)
-            embed_size = 256
-            hidden_size = 512
-            vocab_size = len(self.vocab)
-            self.device = "cuda" if is_available() else "cpu"
-            self.encoder = Encoder(embed_size)
-            self.decoder = Decoder(embed_size, hidden_size, vocab_size)
-            self.encoder.eval()
-            self.decoder.eval()
-            self.encoder.load_state_dict(
-                load(
-                    path.join(
-                        self.settings.ROOT_DIR, "AI", "model-exp-caption", "encoder.pkl"
-                    ),
-                    map_location=self.device,
+            if self.settings.INFERENCE_BACKEND not in INFERENCE_BACKENDS:
+                raise ValueError(
+                    f"Unknown inference backend {self.settings.INFERENCE_BACKEND}"
                 )
-            )
-            self.decoder.load_state_dict(
-                load(
-                    path.join(
-                        self.settings.ROOT_DIR, "AI", "model-exp-caption", "decoder.pkl"
-                    ),
-                    map_location=self.device,
+            if self.settings.INFERENCE_PRECISION not in INFERENCE_PRECISIONS:
+                raise ValueError(
+                    f"Unknown inference precision {self.settings.INFERENCE_PRECISION}"
                 )
+            self.onnx = self.settings.INFERENCE_BACKEND == "onnx"
+            self.quantize = self.settings.INFERENCE_PRECISION == "int8"
+            # dynamically quantized kernels only exist for the CPU
+            self.device = "cuda" if is_available() and not self.quantize else "cpu"
+            set_num_threads(inference_threads(self.settings))
+            if self.settings.INFERENCE_INTEROP_THREADS > 0:
+                try:
+                    set_num_interop_threads(self.settings.INFERENCE_INTEROP_THREADS)
+                except RuntimeError:
+                    # can only be set before the first inter-op parallel work
+                    pass
+            self.image_extractor = AutoImageProcessor.from_pretrained(
+                self.__model_path("model-image"), local_files_only=True
             )
-            self.encoder.to(self.device)
-            self.decoder.to(self.device)
-            self.caption_model = BlipForConditionalGeneration.from_pretrained(
-                path.join(self.settings.ROOT_DIR, "AI", "model-caption"),
-                local_files_only=True,
-            ).to(self.device)
-            self.caption_processor = BlipProcessor.from_pretrained(
-                path.join(self.settings.ROOT_DIR, "AI", "model-caption"),
-                local_files_only=True,
+            self.caption_extractor = AutoImageProcessor.from_pretrained(
+                self.__model_path("model-caption"), local_files_only=True
             )
-            self.image_model = AutoModel.from_pretrained(
-                path.join(self.settings.ROOT_DIR, "AI", "model-image"),
-                local_files_only=True,
-            ).to(self.device)
-            self.image_extractor = AutoImageProcessor.from_pretrained(
-                path.join(self.settings.ROOT_DIR, "AI", "model-image"),
-                local_files_only=True,
+            self.preprocessor = ImagePreprocessor.from_processors(
+                self.caption_extractor,
+                self.image_extractor,
+                self.settings.MAX_DECODE_PIXELS,
             )
-            self.text_model = AutoModel.from_pretrained(
-                path.join(self.settings.ROOT_DIR, "AI", "model-text"),
-                local_files_only=True,
-            ).to(self.device)
-            self.text_tokenizer = AutoTokenizer.from_pretrained(
-                path.join(self.settings.ROOT_DIR, "AI", "model-text"),
-                local_files_only=True,
+            self.model_identity = self.__get_model_identity()
+            if self.onnx:
+                self.caption_slot = ModelSlot(
+                    "caption", self.__load_onnx_caption_model
+                )
+                self.image_slot = ModelSlot("image", self.__load_onnx_image_model)
+                self.text_slot = ModelSlot("text", self.__load_onnx_text_model)
+            else:
+                self.caption_slot = ModelSlot("caption", self.__load_caption_model)
+                self.image_slot = ModelSlot("image", self.__load_image_model)
+                self.text_slot = ModelSlot("text", self.__load_text_model)
+            self.experimental_slot = ModelSlot(
+                "experimental", self.__load_experimental_model
             )
+            if self.settings.MODEL_IDLE_TTL > 0:
+                Thread(target=self.__reap_idle_models, daemon=True).start()
         except Exception as e:
             raise AIEngineInitializationError(message=str(e))
 
+    @property
+    def slots(self) -> List[ModelSlot]:
+        return [
+            self.caption_slot,
+            self.image_slot,
+            self.text_slot,
+            self.experimental_slot,
+        ]
+
+    def __model_path(self, model_dir: str) -> str:
+        return path.join(self.settings.ROOT_DIR, "AI", model_dir)
+
+    def __load_caption_model(self):
+        caption_model = self.__load_pretrained(
+            BlipForConditionalGeneration,
+            BlipForConditionalGeneration._from_config,
+            "model-caption",
+        )
+        caption_model.text_decoder = self.__quantize(caption_model.text_decoder)
+        caption_processor = BlipProcessor.from_pretrained(
+            self.__model_path("model-caption"), local_files_only=True
+        )
+        return (caption_model, caption_processor)
+
+    def __load_image_model(self):
+        image_model = self.__load_pretrained(
+            AutoModel, AutoModel.from_config, "model-image"
+        )
+        return self.__quantize(image_model)
+
+    def __load_text_model(self):
+        text_model = self.__load_pretrained(
+            AutoModel, AutoModel.from_config, "model-text"
+        )
+        text_model = self.__quantize(text_model)
+        text_tokenizer = AutoTokenizer.from_pretrained(
+            self.__model_path("model-text"), local_files_only=True
+        )
+        return (text_model, text_tokenizer)
+
+    def __load_pretrained(self, model_cls, build, model_dir: str) -> nn.Module:
+        # mapped weights stay shared only while they are used in place on
+        # the CPU; moving them to a GPU copies them anyway
+        model = load_pretrained(
+            model_cls,
+            build,
+            self.__model_path(model_dir),
+            mmap=self.settings.MMAP_WEIGHTS and self.device == "cpu",
+        ).to(self.device)
+        model.eval()
+        return model
+
+    def __quantize(self, model: nn.Module) -> nn.Module:
+        """Swaps the Linear layers of the model for dynamic int8 ones.
+
+        ONNX exports are quantized by ONNX Runtime instead, after being
+        exported from the fp32 model.
+        """
+        if not self.quantize or self.onnx:
+            return model
+        return quantize_dynamic(model, {nn.Linear}, dtype=qint8, inplace=True)
+
+    def __onnx_path(self, name: str) -> str:
+        # exports are redone whenever the models behind them change
+        return path.join(filesense_path, "onnx", self.model_identity, f"{name}.onnx")
+
+    def __load_onnx_caption_model(self):
+        vision_path = self.__onnx_path("caption-vision")
+        decoder_path = self.__onnx_path("caption-decoder")
+        if not (path.exists(vision_path) and path.exists(decoder_path)):
+            (caption_model, _) = self.__load_caption_model()
+            export_caption_model(
+                caption_model,
+                self.preprocessor.caption_shape,
+                vision_path,
+                decoder_path,
+                quantize_decoder=self.quantize,
+            )
+            del caption_model
+        caption_processor = BlipProcessor.from_pretrained(
+            self.__model_path("model-caption"), local_files_only=True
+        )
+        text_config = BlipConfig.from_pretrained(
+            self.__model_path("model-caption"), local_files_only=True
+        ).text_config
+        captioner = OnnxCaptioner(
+            vision_path,
+            decoder_path,
+            text_config.bos_token_id,
+            text_config.sep_token_id,
+            text_config.pad_token_id,
+            inference_threads(self.settings),
+        )
+        return (captioner, caption_processor)
+
+    def __load_onnx_image_model(self):
+        onnx_path = self.__onnx_path("image")
+        if not path.exists(onnx_path):
+            export_image_model(
+                self.__load_image_model(),
+                self.preprocessor.image_shape,
+                onnx_path,
+                quantize=self.quantize,
+            )
+        return OnnxImageEncoder(onnx_path, inference_threads(self.settings))
+
+    def __load_onnx_text_model(self):
+        onnx_path = self.__onnx_path("text")
+        if not path.exists(onnx_path):
+            (text_model, _) = self.__load_text_model()
+            export_text_model(text_model, onnx_path, quantize=self.quantize)
+            del text_model
+        text_tokenizer = AutoTokenizer.from_pretrained(
+            self.__model_path("model-text"), local_files_only=True
+        )
+        return (
+            OnnxTextEncoder(onnx_path, inference_threads(self.settings)),
+            text_tokenizer,
+        )
+
+    def __load_experimental_model(self):
+        """Loads the frozen TorchScript captioner, building it on first use.
+
+        The build is cached next to the other derived models and keyed by
+        the checkpoint files, the torch version and the device.
+        """
+        model_path = self.__model_path("model-exp-caption")
+        with open(path.join(model_path, "vocab.pkl"), "rb") as f:
+            vocab = dillload(f)
+        digest = blake2b(f"{torch_version}:{self.device};".encode(), digest_size=16)
+        fingerprint_files(digest, model_path)
+        frozen_path = path.join(
+            filesense_path, "torchscript", f"experimental-{digest.hexdigest()}.pt"
+        )
+        if not path.exists(frozen_path):
+            (encoder, decoder) = self.__build_experimental_model(len(vocab))
+            makedirs(path.dirname(frozen_path), exist_ok=True)
+            tmp_path = f"{frozen_path}.{getpid()}.tmp"
+            jit_save(freeze_captioner(encoder, decoder), tmp_path)
+            replace(tmp_path, frozen_path)
+        return (jit_load(frozen_path, map_location=self.device), vocab)
+
+    def __build_experimental_model(self, vocab_size: int):
+        model_path = self.__model_path("model-exp-caption")
+        embed_size = 256
+        hidden_size = 512
+        encoder = Encoder(embed_size, pretrained=False)
+        decoder = Decoder(embed_size, hidden_size, vocab_size)
+        encoder.eval()
+        decoder.eval()
+        encoder.load_state_dict(
+            load(path.join(model_path, "encoder.pkl"), map_location=self.device)
+        )
+        decoder.load_state_dict(
+            load(path.join(model_path, "decoder.pkl"), map_location=self.device)
+        )
+        encoder.to(self.device)
+        decoder.to(self.device)
+        return (encoder, decoder)
+
+    def __reap_idle_models(self) -> None:
+        ttl = self.settings.MODEL_IDLE_TTL
+        while True:
+            sleep(min(ttl / 2, 30.0))
+            unloaded = [slot.name for slot in self.slots if slot.unload(ttl)]
+            if unloaded:
+                release_memory()
+                logger.info("unloaded idle models: %s", ", ".join(unloaded))
+
     def generate_caption(self, image_path: str) -> str:
+        return self.generate_captions([image_path], batch_size=1)[0]
+
+    def generate_captions(
+        self,
+        images: List[Union[str, BinaryIO, Image.Image]],
+        batch_size: Optional[int] = None,
+    ) -> List[str]:
         try:
-            raw_image = Image.open(image_path).convert("RGB")
-            inputs = self.caption_processor(
-                images=raw_image,
-                return_tensors="pt",
-            ).to(self.device)
-            outputs = self.caption_model.generate(**inputs, max_length=80)
-            caption = self.caption_processor.decode(
-                outputs[0], skip_special_tokens=True, max_length=100
-            )
-            return caption
+            batch_size = batch_size or self.settings.CAPTION_BATCH_SIZE
+            captions: List[str] = []
+            for start in range(0, len(images), batch_size):
+                pixel_values = np.stack(
+                    [
+                        self.preprocessor.caption_pixels(
+                            self.preprocessor.decode(image)
+                        )
+                        for image in images[start : start + batch_size]
+                    ]
+                )
+                captions.extend(self.caption_pixel_values(pixel_values, batch_size))
+            return captions
+        except Exception as e:
+            raise CaptionGenerationError(message=str(e))
+
+    def caption_pixel_values(
+        self, pixel_values: np.ndarray, batch_size: Optional[int] = None
+    ) -> List[str]:
+        try:
+            batch_size = batch_size or self.settings.CAPTION_BATCH_SIZE
+            captions: List[str] = []
+            with self.caption_slot.acquire() as (caption_model, caption_processor):
+                for start in range(0, len(pixel_values), batch_size):
+                    batch = pixel_values[start : start + batch_size]
+                    with no_grad():
+                        outputs = caption_model.generate(
+                            pixel_values=(
+                                batch
+                                if self.onnx
+                                else from_numpy(batch).to(self.device)
+                            ),
+                            max_length=CAPTION_MAX_LENGTH,
+                        )
+                    captions.extend(
+                        caption_processor.batch_decode(
+                            outputs, skip_special_tokens=True
+                        )
+                    )
+            return captions
         except Exception as e:
             raise CaptionGenerationError(message=str(e))
 
+    def preprocess_images(
+        self, images: List[Union[str, BinaryIO, Image.Image]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Decodes each image once into the caption and image model inputs."""
+        caption_pixels = np.empty(
+            (len(images), *self.preprocessor.caption_shape), dtype=np.float32
+        )
+        image_pixels = np.empty(
+            (len(images), *self.preprocessor.image_shape), dtype=np.float32
+        )
+        for (i, image) in enumerate(images):
+            decoded = self.preprocessor.decode(image)
+            self.preprocessor.caption_pixels(decoded, out=caption_pixels[i])
+            self.preprocessor.image_pixels(decoded, out=image_pixels[i])
+        return (caption_pixels, image_pixels)
+
+    def generate_captions_with_embeddings(
+        self,
+        images: List[Union[str, BinaryIO, Image.Image]],
+        chunk_size: Optional[int] = None,
+    ) -> Tuple[List[str], List[List[float]], np.ndarray]:
+        """Captions and embeds images, decoding and reading each one once.
+
+        Returns the captions, the text embeddings of the captions and the
+        image embeddings. Images are preprocessed `chunk_size` at a time to
+        bound the memory held by their pixels.
+        """
+        chunk_size = chunk_size or self.settings.INDEX_CHUNK_SIZE
+        captions: List[str] = []
+        caption_embeddings: List[List[float]] = []
+        image_embeddings: List[np.ndarray] = []
+        for start in range(0, len(images), chunk_size):
+            (caption_pixels, image_pixels) = self.preprocess_images(
+                images[start : start + chunk_size]
+            )
+            chunk_captions = self.caption_pixel_values(caption_pixels)
+            captions.extend(chunk_captions)
+            caption_embeddings.extend(self.generate_text_embedding(chunk_captions))
+            image_embeddings.append(self.embed_pixel_values(image_pixels))
+        if not image_embeddings:
+            return (captions, caption_embeddings, np.empty((0, 0), dtype=np.float32))
+        return (captions, caption_embeddings, np.concatenate(image_embeddings))
+
     def generate_experimental_caption(self, image_path: str) -> str:
+        return self.generate_experimental_captions([image_path], batch_size=1)[0]
+
+    def generate_experimental_captions(
+        self,
+        images: List[Union[str, BinaryIO, Image.Image]],
+        batch_size: Optional[int] = None,
+    ) -> List[str]:
         try:
-            raw_image = Image.open(image_path)
-            transformed_image = self.__get_transformed_image(raw_image)
-            extracted_features = self.encoder(transformed_image).unsqueeze(1)
-            text_output = self.decoder.sample(extracted_features)
-            caption = self.__clean_sentence(text_output)
-            return caption
+            batch_size = batch_size or self.settings.CAPTION_BATCH_SIZE
+            captions: List[str] = []
+            with self.experimental_slot.acquire() as (captioner, vocab):
+                for start in range(0, len(images), batch_size):
+                    pixel_values = np.stack(
+                        [
+                            self.preprocessor.experimental_pixels(
+                                self.preprocessor.decode(image)
+                            )
+                            for image in images[start : start + batch_size]
+                        ]
+                    )
+                    with no_grad():
+                        token_ids = captioner(from_numpy(pixel_values).to(self.device))
+                    captions.extend(
+                        self.__clean_sentence(text_output, vocab)
+                        for text_output in trim_at_end(token_ids.tolist())
+                    )
+            return captions
         except Exception as e:
             raise CaptionGenerationError(message=str(e))
 
     def generate_text_embedding(self, text: list):
         try:
-            encoded_input = self.text_tokenizer(
-                text, padding=True, truncation=True, return_tensors="pt"
-            )
-            with no_grad():
-                model_output = self.text_model(**encoded_input.to(self.device))
-            sentence_embedding = self.__mean_pooling(
-                model_output, encoded_input["attention_mask"].to(self.device)
-            )
+            with self.text_slot.acquire() as (text_model, text_tokenizer):
+                if self.onnx:
+                    encoded_input = text_tokenizer(
+                        text, padding=True, truncation=True, return_tensors="np"
+                    )
+                    model_output = (from_numpy(text_model(encoded_input)),)
+                    attention_mask = from_numpy(encoded_input["attention_mask"])
+                else:
+                    encoded_input = text_tokenizer(
+                        text, padding=True, truncation=True, return_tensors="pt"
+                    )
+                    with no_grad():
+                        model_output = text_model(**encoded_input.to(self.device))
+                    attention_mask = encoded_input["attention_mask"].to(self.device)
+            sentence_embedding = self.__mean_pooling(model_output, attention_mask)
             sentence_embedding = F.normalize(sentence_embedding, p=2, dim=1)
             return sentence_embedding.tolist()
         except Exception as e:
             raise TextEmbeddingGenerationError(message=str(e))
 
     def generate_image_embedding(self, image_path: str, image: Image = None):
-        try:
-            if image is None:
-                raw_image = Image.open(image_path).convert("RGB")
-            else:
-                raw_image = Image.open(image).convert("RGB")
-            transformation_chain = T.Compose(
-                [
-                    T.Resize(int((256 / 224) * self.image_extractor.size["height"])),
-                    T.CenterCrop(self.image_extractor.size["height"]),
-                    T.ToTensor(),
-                    T.Normalize(
-                        mean=self.image_extractor.image_mean,
-                        std=self.image_extractor.image_std,
-                    ),
-                ]
-            )
+        image_embeddings = self.generate_image_embeddings(
+            [image_path if image is None else image], batch_size=1
+        )
+        return image_embeddings[0].tolist()
 
-            image_transformed = transformation_chain(raw_image).unsqueeze(0)
+    def generate_image_embeddings(
+        self,
+        images: List[Union[str, BinaryIO, Image.Image]],
+        batch_size: Optional[int] = None,
+    ) -> np.ndarray:
+        try:
+            batch_size = batch_size or self.settings.IMAGE_BATCH_SIZE
+            image_embeddings: Optional[np.ndarray] = None
+            for start in range(0, len(images), batch_size):
+                pixel_values = np.stack(
+                    [
+                        self.preprocessor.image_pixels(self.preprocessor.decode(image))
+                        for image in images[start : start + batch_size]
+                    ]
+                )
+                batch_embeddings = self.embed_pixel_values(pixel_values, batch_size)
+                if image_embeddings is None:
+                    image_embeddings = np.empty(
+                        (len(images), batch_embeddings.shape[1]), dtype=np.float32
+                    )
+                image_embeddings[start : start + len(pixel_values)] = batch_embeddings
+            if image_embeddings is None:
+                return np.empty((0, 0), dtype=np.float32)
+            return image_embeddings
+        except Exception as e:
+            raise ImageEmbeddingGenerationError(message=str(e))
 
-            with no_grad():
-                image_embedding = (
-                    self.image_model(image_transformed.to(self.device))
-                    .last_hidden_state[:, 0]
-                    .cpu()
+    def embed_pixel_values(
+        self, pixel_values: np.ndarray, batch_size: Optional[int] = None
+    ) -> np.ndarray:
+        try:
+            batch_size = batch_size or self.settings.IMAGE_BATCH_SIZE
+            with self.image_slot.acquire() as image_model:
+                hidden_size = (
+                    image_model.hidden_size
+                    if self.onnx
+                    else image_model.config.hidden_size
+                )
+                image_embeddings = np.empty(
+                    (len(pixel_values), hidden_size), dtype=np.float32
                 )
-                return image_embedding[0].tolist()
+                for start in range(0, len(pixel_values), batch_size):
+                    batch = pixel_values[start : start + batch_size]
+                    if self.onnx:
+                        image_embeddings[start : start + batch_size] = image_model(
+                            batch
+                        )
+                    else:
+                        with no_grad():
+                            image_embeddings[start : start + batch_size] = (
+                                image_model(from_numpy(batch).to(self.device))
+                                .last_hidden_state[:, 0]
+                                .cpu()
+                                .numpy()
+                            )
+            return image_embeddings
         except Exception as e:
             raise ImageEmbeddingGenerationError(message=str(e))
 
+    def __get_model_identity(self) -> str:
+        """Fingerprints the caption, text and image models and their settings.
+
+        Results cached under one identity are never served once any of
+        these models is replaced.
+        """
+        digest = blake2b(f"max_length={CAPTION_MAX_LENGTH}".encode(), digest_size=16)
+        if self.quantize:
+            digest.update(b"precision=int8;")
+        for model_dir in ("model-caption", "model-text", "model-image"):
+            model_path = path.join(self.settings.ROOT_DIR, "AI", model_dir)
+            fingerprint_files(digest, model_path, f"{model_dir}/")
+        return digest.hexdigest()
+
     def __mean_pooling(self, model_output, attention_mask):
         token_embeddings = model_output[0]
         input_mask_expanded = (
@@ -173,37 +529,35 @@ class AIEngine(object):
             input_mask_expanded.sum(1), min=1e-9
         )
 
-    def __clean_sentence(self, text) -> str:
+    def __clean_sentence(self, text, vocab) -> str:
         cleaned_list = []
         for index in text:
             if index == 1:
                 continue
-            cleaned_list.append(self.vocab.idx2word[index])
+            cleaned_list.append(vocab.idx2word[index])
         cleaned_list = cleaned_list[1:-1]
         sentence = " ".join(cleaned_list)
         sentence = sentence.capitalize()
         return sentence
 
-    def __get_transformed_image(self, image):
-        transform_image = T.Compose(
-            [
-                T.Resize(256),
-                T.RandomCrop(224),
-                T.RandomHorizontalFlip(),
-                T.ToTensor(),
-                T.Normalize(
-                    (0.485, 0.456, 0.406),
-                    (0.229, 0.224, 0.225),
-                ),
-            ]
-        )
-        transformed_image = transform_image(image).unsqueeze(0).to(self.device)
-        return transformed_image
+    def convert_weights(self) -> None:
+        """Converts the model checkpoints to safetensors ahead of their use.
+
+        The server runs this before starting several workers, which then
+        all map the same converted files.
+        """
+        if self.onnx or not self.settings.MMAP_WEIGHTS:
+            return
+        for slot in (self.caption_slot, self.image_slot, self.text_slot):
+            with slot.acquire():
+                pass
+        self.release_models()
 
     def release_models(self) -> None:
-        self.caption_model = None
-        self.caption_processor = None
-        self.image_model = None
-        self.image_extractor = None
-        self.text_model = None
-        self.text_tokenizer = None
+        """Unloads every model that is not in use and frees its memory.
+
+        Models are loaded again on their next use.
+        """
+        for slot in self.slots:
+            slot.unload()
+        release_memory()
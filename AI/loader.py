@@ -0,0 +1,73 @@
+import ctypes
+import ctypes.util
+import gc
+from contextlib import contextmanager
+from sys import platform
+from threading import Lock
+from time import monotonic
+from typing import Callable, Generic, Iterator, Optional, TypeVar
+from torch.cuda import empty_cache, is_available
+
+T = TypeVar("T")
+
+
+def release_memory() -> None:
+    """Returns the memory of dropped models to the operating system.
+
+    Dropping the last reference frees the tensors, but glibc keeps the
+    freed heap and CUDA keeps its cached blocks unless asked to let go.
+    """
+    gc.collect()
+    if is_available():
+        empty_cache()
+    if platform.startswith("linux"):
+        try:
+            ctypes.CDLL(ctypes.util.find_library("c")).malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+class ModelSlot(Generic[T]):
+    """Holds a model that is loaded on first use and can be unloaded.
+
+    `acquire` loads the model under a lock, so concurrent first uses load
+    it once, and marks it in use; a model in use is never unloaded.
+    """
+
+    def __init__(self, name: str, load: Callable[[], T]) -> None:
+        self.name = name
+        self.__load = load
+        self.__lock = Lock()
+        self.__value: Optional[T] = None
+        self.__users = 0
+        self.__last_used = monotonic()
+
+    @property
+    def loaded(self) -> bool:
+        return self.__value is not None
+
+    @contextmanager
+    def acquire(self) -> Iterator[T]:
+        with self.__lock:
+            if self.__value is None:
+                self.__value = self.__load()
+            self.__users += 1
+            value = self.__value
+        try:
+            yield value
+        finally:
+            with self.__lock:
+                self.__users -= 1
+                self.__last_used = monotonic()
+
+    def unload(self, idle_for: float = 0.0) -> bool:
+        """Drops the model if it is unused and idle for `idle_for` seconds."""
+        with self.__lock:
+            if (
+                self.__value is None
+                or self.__users > 0
+                or monotonic() - self.__last_used < idle_for
+            ):
+                return False
+            self.__value = None
+        return True
@@ -1,12 +1,19 @@
+from typing import List
 import torch
 import torch.nn as nn
-import torchvision.models as models  # type: ignore
 
 
 class Encoder(nn.Module):
-    def __init__(self, embed_size):
+    def __init__(self, embed_size, pretrained=True):
         super(Encoder, self).__init__()
-        resnet = models.resnet50(pretrained=True)
+        # only needed when the frozen captioner is built, not on startup
+        import torchvision.models as models  # type: ignore
+
+        # inference loads every weight from encoder.pkl; only training
+        # starts from the ImageNet weights
+        resnet = models.resnet50(
+            weights=models.ResNet50_Weights.IMAGENET1K_V1 if pretrained else None
+        )
 
         for param in list(resnet.parameters())[:-6]:
             param.requires_grad_(False)
@@ -56,18 +63,104 @@ class Decoder(nn.Module):
         return output
 
     def sample(self, inputs, states=None, max_len=20):
-        output = []
-        (h, c) = (
-            torch.randn(self.num_layers, 1, self.hidden_size).to(inputs.device),
-            torch.randn(self.num_layers, 1, self.hidden_size).to(inputs.device),
+        return self.sample_batch(inputs, states, max_len)[0]
+
+    def sample_batch(
+        self, inputs, states=None, max_len=20, end_index=1
+    ) -> List[List[int]]:
+        """Greedy-decodes the captions of a batch of image features.
+
+        `inputs` holds one feature row per image, shaped (batch, 1, embed).
+        The LSTM starts from zero states, as in training. Finished rows are
+        masked until every row has produced `end_index`, and the token ids
+        are copied off the device once, without the end token.
+        """
+        batch_size = inputs.size(0)
+        tokens = torch.full(
+            (batch_size, max_len), end_index, dtype=torch.long, device=inputs.device
+        )
+        finished = torch.zeros(batch_size, dtype=torch.bool, device=inputs.device)
+        for step in range(max_len):
+            x, states = self.lstm(inputs, states)
+            predict = self.fc(x.squeeze(1)).argmax(dim=1)
+            predict = predict.masked_fill(finished, end_index)
+            tokens[:, step] = predict
+            finished |= predict == end_index
+            if bool(finished.all()):
+                break
+            inputs = self.word_embedding(predict).unsqueeze(1)
+        return trim_at_end(tokens.tolist(), end_index)
+
+
+def trim_at_end(token_rows: List[List[int]], end_index: int = 1) -> List[List[int]]:
+    return [
+        row[: row.index(end_index)] if end_index in row else row
+        for row in token_rows
+    ]
+
+
+def fold_batch_norm(linear: nn.Linear, batch_norm: nn.BatchNorm1d) -> nn.Linear:
+    """Returns a Linear computing `batch_norm(linear(x))` in eval mode."""
+    scale = batch_norm.weight / torch.sqrt(batch_norm.running_var + batch_norm.eps)
+    folded = nn.Linear(linear.in_features, linear.out_features)
+    with torch.no_grad():
+        folded.weight.copy_(linear.weight * scale[:, None])
+        folded.bias.copy_(
+            (linear.bias - batch_norm.running_mean) * scale + batch_norm.bias
         )
-        for i in range(max_len):
+    return folded.to(linear.weight.device)
+
+
+class FrozenCaptioner(nn.Module):
+    """Inference-only Encoder/Decoder pair, compiled with TorchScript.
+
+    The BatchNorm after the embedding is folded into its Linear and the
+    dropouts are left out. `forward` greedy-decodes like
+    `Decoder.sample_batch` and returns the token ids padded with
+    `end_index`, so the whole caption runs in one TorchScript call.
+    """
+
+    def __init__(
+        self, encoder: Encoder, decoder: Decoder, max_len: int = 20, end_index: int = 1
+    ) -> None:
+        super(FrozenCaptioner, self).__init__()
+        self.resnet = encoder.resnet
+        self.embed = fold_batch_norm(encoder.embed, encoder.batch_norm)
+        self.word_embedding = decoder.word_embedding
+        self.lstm = decoder.lstm
+        self.fc = decoder.fc
+        self.num_layers = decoder.num_layers
+        self.hidden_size = decoder.hidden_size
+        self.max_len = max_len
+        self.end_index = end_index
+
+    def forward(self, images: torch.Tensor) -> torch.Tensor:
+        features = self.resnet(images).flatten(1)
+        inputs = self.embed(features).unsqueeze(1)
+        batch_size = images.size(0)
+        h = torch.zeros(
+            self.num_layers, batch_size, self.hidden_size, device=images.device
+        )
+        c = torch.zeros_like(h)
+        tokens = torch.full(
+            (batch_size, self.max_len),
+            self.end_index,
+            dtype=torch.long,
+            device=images.device,
+        )
+        finished = torch.zeros(batch_size, dtype=torch.bool, device=images.device)
+        for step in range(self.max_len):
             x, (h, c) = self.lstm(inputs, (h, c))
-            x = self.fc(x)
-            x = x.squeeze(1)
-            predict = x.argmax(dim=1)
-            if predict.item() == 1:
+            predict = self.fc(x.squeeze(1)).argmax(dim=1)
+            predict = predict.masked_fill(finished, self.end_index)
+            tokens[:, step] = predict
+            finished = finished | (predict == self.end_index)
+            if bool(finished.all()):
                 break
-            output.append(predict.item())
-            inputs = self.word_embedding(predict.unsqueeze(0))
-        return output
+            inputs = self.word_embedding(predict).unsqueeze(1)
+        return tokens
+
+
+def freeze_captioner(encoder: Encoder, decoder: Decoder) -> torch.jit.ScriptModule:
+    captioner = FrozenCaptioner(encoder.eval(), decoder.eval()).eval()
+    return torch.jit.freeze(torch.jit.script(captioner))
@@ -0,0 +1,258 @@
+from inspect import signature
+from os import getpid, makedirs, path, remove, replace
+from typing import Dict, Mapping, Sequence, Tuple
+import numpy as np
+import torch
+from torch import nn
+
+ONNX_OPSET = 17
+# torch 2.5 added the dynamo exporter, and later releases made it the
+# default; the TorchScript-based one handles the dynamic axes used here
+_EXPORT_OPTIONS = (
+    {"dynamo": False} if "dynamo" in signature(torch.onnx.export).parameters else {}
+)
+
+
+class _TextEncoder(nn.Module):
+    def __init__(self, text_model: nn.Module) -> None:
+        super().__init__()
+        self.text_model = text_model
+
+    def forward(self, input_ids, token_type_ids, attention_mask):
+        return self.text_model(
+            input_ids=input_ids,
+            token_type_ids=token_type_ids,
+            attention_mask=attention_mask,
+        )[0]
+
+
+class _ImageEncoder(nn.Module):
+    def __init__(self, image_model: nn.Module) -> None:
+        super().__init__()
+        self.image_model = image_model
+
+    def forward(self, pixel_values):
+        return self.image_model(pixel_values).last_hidden_state[:, 0]
+
+
+class _CaptionVisionEncoder(nn.Module):
+    def __init__(self, vision_model: nn.Module) -> None:
+        super().__init__()
+        self.vision_model = vision_model
+
+    def forward(self, pixel_values):
+        return self.vision_model(pixel_values=pixel_values)[0]
+
+
+class _CaptionDecoderStep(nn.Module):
+    """Returns the logits of the next token of each caption."""
+
+    def __init__(self, text_decoder: nn.Module) -> None:
+        super().__init__()
+        self.text_decoder = text_decoder
+
+    def forward(self, input_ids, image_embeds):
+        return self.text_decoder(
+            input_ids=input_ids,
+            encoder_hidden_states=image_embeds,
+            use_cache=False,
+            return_dict=False,
+        )[0][:, -1]
+
+
+def _export(
+    module: nn.Module,
+    args: Tuple[torch.Tensor, ...],
+    input_names: Sequence[str],
+    output_names: Sequence[str],
+    dynamic_axes: Dict[str, Dict[int, str]],
+    onnx_path: str,
+    quantize: bool = False,
+) -> None:
+    makedirs(path.dirname(onnx_path), exist_ok=True)
+    # a half-written export must never be picked up as a finished one
+    tmp_path = f"{onnx_path}.{getpid()}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            module.eval(),
+            args,
+            tmp_path,
+            input_names=list(input_names),
+            output_names=list(output_names),
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET,
+            **_EXPORT_OPTIONS,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic  # type: ignore
+
+        fp32_path = tmp_path
+        tmp_path = f"{onnx_path}.{getpid()}.int8.tmp"
+        # the weights of the MatMuls exported from Linear layers
+        quantize_dynamic(
+            fp32_path,
+            tmp_path,
+            op_types_to_quantize=["MatMul"],
+            weight_type=QuantType.QInt8,
+        )
+        remove(fp32_path)
+    replace(tmp_path, onnx_path)
+
+
+def _device(module: nn.Module) -> torch.device:
+    return next(module.parameters()).device
+
+
+def export_text_model(
+    text_model: nn.Module, onnx_path: str, quantize: bool = False
+) -> None:
+    device = _device(text_model)
+    dummy = torch.ones((2, 8), dtype=torch.long, device=device)
+    names = ["input_ids", "token_type_ids", "attention_mask"]
+    _export(
+        _TextEncoder(text_model),
+        (dummy, torch.zeros_like(dummy), dummy),
+        names,
+        ["token_embeddings"],
+        {
+            **{name: {0: "batch", 1: "sequence"} for name in names},
+            "token_embeddings": {0: "batch", 1: "sequence"},
+        },
+        onnx_path,
+        quantize,
+    )
+
+
+def export_image_model(
+    image_model: nn.Module,
+    image_shape: Tuple[int, int, int],
+    onnx_path: str,
+    quantize: bool = False,
+) -> None:
+    dummy = torch.zeros((2, *image_shape), device=_device(image_model))
+    _export(
+        _ImageEncoder(image_model),
+        (dummy,),
+        ["pixel_values"],
+        ["image_embeddings"],
+        {"pixel_values": {0: "batch"}, "image_embeddings": {0: "batch"}},
+        onnx_path,
+        quantize,
+    )
+
+
+def export_caption_model(
+    caption_model: nn.Module,
+    caption_shape: Tuple[int, int, int],
+    vision_path: str,
+    decoder_path: str,
+    quantize_decoder: bool = False,
+) -> None:
+    device = _device(caption_model)
+    pixel_values = torch.zeros((2, *caption_shape), device=device)
+    _export(
+        _CaptionVisionEncoder(caption_model.vision_model),
+        (pixel_values,),
+        ["pixel_values"],
+        ["image_embeds"],
+        {"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+        vision_path,
+    )
+    with torch.no_grad():
+        image_embeds = caption_model.vision_model(pixel_values=pixel_values)[0]
+    input_ids = torch.full(
+        (2, 3), caption_model.config.text_config.bos_token_id, device=device
+    )
+    _export(
+        _CaptionDecoderStep(caption_model.text_decoder),
+        (input_ids, image_embeds),
+        ["input_ids", "image_embeds"],
+        ["logits"],
+        {
+            "input_ids": {0: "batch", 1: "sequence"},
+            "image_embeds": {0: "batch"},
+            "logits": {0: "batch"},
+        },
+        decoder_path,
+        quantize_decoder,
+    )
+
+
+def load_session(onnx_path: str, threads: int = 0, interop_threads: int = 0):
+    # onnxruntime is only needed when the ONNX backend is selected
+    import onnxruntime  # type: ignore
+
+    options = onnxruntime.SessionOptions()
+    # 0 leaves the choice to ONNX Runtime
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = interop_threads
+    options.graph_optimization_level = (
+        onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    )
+    return onnxruntime.InferenceSession(
+        onnx_path, options, providers=["CPUExecutionProvider"]
+    )
+
+
+class OnnxTextEncoder(object):
+    def __init__(self, onnx_path: str, threads: int = 0) -> None:
+        self.session = load_session(onnx_path, threads)
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def __call__(self, encoded_input: Mapping[str, np.ndarray]) -> np.ndarray:
+        """Returns the token embeddings of the tokenized text."""
+        feed = {
+            name: np.asarray(encoded_input[name], dtype=np.int64)
+            for name in self.input_names
+            if name in encoded_input
+        }
+        if "token_type_ids" in self.input_names and "token_type_ids" not in feed:
+            feed["token_type_ids"] = np.zeros_like(feed["input_ids"])
+        return self.session.run(None, feed)[0]
+
+
+class OnnxImageEncoder(object):
+    def __init__(self, onnx_path: str, threads: int = 0) -> None:
+        self.session = load_session(onnx_path, threads)
+        self.hidden_size = self.session.get_outputs()[0].shape[-1]
+
+    def __call__(self, pixel_values: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {"pixel_values": pixel_values})[0]
+
+
+class OnnxCaptioner(object):
+    """Greedy BLIP captioning on an exported vision encoder and decoder.
+
+    The decoder is exported without a key/value cache, so every step runs
+    over the whole caption so far.
+    """
+
+    def __init__(
+        self,
+        vision_path: str,
+        decoder_path: str,
+        bos_token_id: int,
+        eos_token_id: int,
+        pad_token_id: int,
+        threads: int = 0,
+    ) -> None:
+        self.vision_session = load_session(vision_path, threads)
+        self.decoder_session = load_session(decoder_path, threads)
+        self.bos_token_id = bos_token_id
+        self.eos_token_id = eos_token_id
+        self.pad_token_id = pad_token_id
+
+    def generate(self, pixel_values: np.ndarray, max_length: int) -> np.ndarray:
+        image_embeds = self.vision_session.run(None, {"pixel_values": pixel_values})[
+            0
+        ]
+        input_ids = np.full((len(pixel_values), 1), self.bos_token_id, np.int64)
+        finished = np.zeros(len(pixel_values), dtype=bool)
+        while input_ids.shape[1] < max_length and not finished.all():
+            logits = self.decoder_session.run(
+                None, {"input_ids": input_ids, "image_embeds": image_embeds}
+            )[0]
+            next_ids = np.where(finished, self.pad_token_id, logits.argmax(-1))
+            input_ids = np.concatenate([input_ids, next_ids[:, None]], axis=1)
+            finished |= next_ids == self.eos_token_id
+        return input_ids
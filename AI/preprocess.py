@@ -0,0 +1,180 @@
+from typing import BinaryIO, Optional, Sequence, Tuple, Union
+import numpy as np
+from PIL import Image  # type: ignore
+from error import ImageTooLargeError  # type: ignore
+
+# inference transform of the experimental captioner's ResNet encoder
+EXPERIMENTAL_RESIZE = 256
+EXPERIMENTAL_SIZE = 224
+EXPERIMENTAL_MEAN = (0.485, 0.456, 0.406)
+EXPERIMENTAL_STD = (0.229, 0.224, 0.225)
+
+
+def decode_image(
+    image: Union[str, BinaryIO, Image.Image],
+    min_size: Optional[int] = None,
+    max_pixels: Optional[int] = None,
+) -> Image.Image:
+    """Decodes an image to RGB, no smaller than `min_size` on either side.
+
+    JPEGs are decoded straight at the smallest DCT scale that keeps both
+    sides at least `min_size`, other formats are box-reduced by an integer
+    factor right after decoding. Animated images yield their first frame.
+    Images above `max_pixels` are rejected before their pixels are decoded.
+    """
+    if isinstance(image, Image.Image):
+        return image if image.mode == "RGB" else image.convert("RGB")
+    opened = Image.open(image)
+    if getattr(opened, "is_animated", False):
+        opened.seek(0)
+    if min_size is not None and opened.format == "JPEG":
+        opened.draft("RGB", (min_size, min_size))
+    (width, height) = opened.size
+    if max_pixels is not None and width * height > max_pixels:
+        raise ImageTooLargeError(
+            message=f"{width}x{height} image exceeds {max_pixels} pixels"
+        )
+    # palette images can only be reduced once converted
+    decoded = opened if opened.mode == "RGB" else opened.convert("RGB")
+    if min_size is not None:
+        factor = min(width, height) // min_size
+        if factor >= 2:
+            decoded = decoded.reduce(factor)
+    return decoded
+
+
+def dhash(image: Image.Image, size: int = 8) -> int:
+    """Difference hash of an image, 64 bits for the default size.
+
+    Each bit compares two horizontally adjacent pixels of a tiny grayscale
+    thumbnail, so resized and re-encoded copies of an image land within a
+    few bits of each other.
+    """
+    thumbnail = image.convert("L").resize((size + 1, size), Image.BOX)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _to_chw(
+    image: Image.Image,
+    mean: np.ndarray,
+    std: np.ndarray,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    pixels = np.asarray(image, dtype=np.float32).transpose(2, 0, 1)
+    if out is None:
+        out = np.empty(pixels.shape, dtype=np.float32)
+    np.divide(pixels, 255.0, out=out)
+    out -= mean
+    out /= std
+    return out
+
+
+def _resize_center_crop(image: Image.Image, resize: int, crop: int) -> Image.Image:
+    """Bilinear shorter-side resize to `resize`, then a `crop` square."""
+    (width, height) = image.size
+    if width <= height:
+        size = (resize, int(resize * height / width))
+    else:
+        size = (int(resize * width / height), resize)
+    resized = image.resize(size, Image.BILINEAR)
+    left = int(round((size[0] - crop) / 2.0))
+    top = int(round((size[1] - crop) / 2.0))
+    return resized.crop((left, top, left + crop, top + crop))
+
+
+class ImagePreprocessor(object):
+    """Builds the inputs of every model from one decoded image.
+
+    Produces the same pixels as the BLIP processor (square bicubic resize),
+    the ViT transform chain (bilinear shorter-side resize, center crop) and
+    the evaluation transform of the experimental captioner using only PIL
+    and numpy. It holds plain parameters, so it pickles
+    cheaply into decode worker processes.
+    """
+
+    def __init__(
+        self,
+        caption_size: int,
+        caption_mean: Sequence[float],
+        caption_std: Sequence[float],
+        caption_resample: int,
+        image_size: int,
+        image_mean: Sequence[float],
+        image_std: Sequence[float],
+        max_pixels: Optional[int] = None,
+    ) -> None:
+        self.caption_size = caption_size
+        self.caption_mean = np.array(caption_mean, dtype=np.float32)[:, None, None]
+        self.caption_std = np.array(caption_std, dtype=np.float32)[:, None, None]
+        self.caption_resample = caption_resample
+        self.image_size = image_size
+        self.image_resize = int((256 / 224) * image_size)
+        self.image_mean = np.array(image_mean, dtype=np.float32)[:, None, None]
+        self.image_std = np.array(image_std, dtype=np.float32)[:, None, None]
+        self.max_pixels = max_pixels
+        self.experimental_mean = np.array(EXPERIMENTAL_MEAN, dtype=np.float32)[
+            :, None, None
+        ]
+        self.experimental_std = np.array(EXPERIMENTAL_STD, dtype=np.float32)[
+            :, None, None
+        ]
+
+    @classmethod
+    def from_processors(
+        cls, caption_extractor, image_extractor, max_pixels: Optional[int] = None
+    ):
+        return cls(
+            caption_extractor.size["height"],
+            caption_extractor.image_mean,
+            caption_extractor.image_std,
+            int(caption_extractor.resample),
+            image_extractor.size["height"],
+            image_extractor.image_mean,
+            image_extractor.image_std,
+            max_pixels,
+        )
+
+    @property
+    def decode_size(self) -> int:
+        """Smallest side a decoded image needs for every model input."""
+        return max(self.caption_size, self.image_resize, EXPERIMENTAL_RESIZE)
+
+    @property
+    def caption_shape(self) -> Tuple[int, int, int]:
+        return (3, self.caption_size, self.caption_size)
+
+    @property
+    def image_shape(self) -> Tuple[int, int, int]:
+        return (3, self.image_size, self.image_size)
+
+    @property
+    def experimental_shape(self) -> Tuple[int, int, int]:
+        return (3, EXPERIMENTAL_SIZE, EXPERIMENTAL_SIZE)
+
+    def decode(self, image: Union[str, BinaryIO, Image.Image]) -> Image.Image:
+        return decode_image(image, self.decode_size, self.max_pixels)
+
+    def caption_pixels(
+        self, image: Image.Image, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        resized = image.resize(
+            (self.caption_size, self.caption_size), self.caption_resample
+        )
+        return _to_chw(resized, self.caption_mean, self.caption_std, out)
+
+    def image_pixels(
+        self, image: Image.Image, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        cropped = _resize_center_crop(image, self.image_resize, self.image_size)
+        return _to_chw(cropped, self.image_mean, self.image_std, out)
+
+    def experimental_pixels(
+        self, image: Image.Image, out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        cropped = _resize_center_crop(image, EXPERIMENTAL_RESIZE, EXPERIMENTAL_SIZE)
+        return _to_chw(cropped, self.experimental_mean, self.experimental_std, out)
+
+    def __call__(self, image: Image.Image) -> Tuple[np.ndarray, np.ndarray]:
+        return (self.caption_pixels(image), self.image_pixels(image))
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Optional, Tuple
+
+
+def normalize_query(query: str) -> str:
+    # the MiniLM tokenizer is uncased and splits on whitespace, so queries
+    # differing only in case or spacing get the same embedding
+    return " ".join(query.split()).lower()
+
+
+class QueryEmbeddingCache(object):
+    """Thread-safe LRU cache of the embeddings of search queries.
+
+    Entries are keyed by the normalized query and the identity of the
+    models, and the least recently used one is dropped once `max_size`
+    queries are cached. A `max_size` of 0 disables the cache.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__lock = Lock()
+        self.__entries: OrderedDict[Tuple[str, str], Tuple[float, ...]] = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, model_identity: str, query: str) -> Optional[List[float]]:
+        key = (model_identity, query)
+        with self.__lock:
+            embedding = self.__entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+        return list(embedding)
+
+    def put(self, model_identity: str, query: str, embedding: List[float]) -> None:
+        if self.max_size <= 0:
+            return
+        key = (model_identity, query)
+        with self.__lock:
+            self.__entries[key] = tuple(embedding)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.__entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
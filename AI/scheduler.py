@@ -0,0 +1,169 @@
+import asyncio
+from collections import deque
+from concurrent.futures import Future
+from math import ceil
+from threading import Condition, Lock, Thread
+from time import perf_counter
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+from settings import Settings  # type: ignore
+from error import InferenceQueueFullError  # type: ignore
+
+INTERACTIVE = 0
+BULK = 1
+
+_Task = Tuple[Future, Callable, tuple, dict]
+
+
+class InferenceScheduler(object):
+    """Runs model inference on dedicated worker threads, by priority.
+
+    Work is queued in an interactive lane (API requests, searches) and a
+    bulk lane (indexing). Idle workers always take interactive work first,
+    and bulk work never occupies more than `workers - 1` of them, so a
+    search waits for a free worker rather than for an indexing batch.
+    A single worker runs bulk work too; a search then waits for at most
+    the one bulk task in progress, as queued bulk work is taken after it.
+
+    Each lane is bounded. A full interactive lane rejects new work with
+    `InferenceQueueFullError`, carrying a Retry-After estimate; a full
+    bulk lane blocks the submitting indexer instead.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_interactive: int = 64,
+        max_bulk: int = 4,
+    ) -> None:
+        self.workers = max(1, workers)
+        self.bulk_workers = max(1, self.workers - 1)
+        self.__limits = {INTERACTIVE: max_interactive, BULK: max_bulk}
+        self.__lanes: Dict[int, Deque[_Task]] = {INTERACTIVE: deque(), BULK: deque()}
+        self.__condition = Condition()
+        self.__bulk_running = 0
+        self.__stopped = False
+        # moving average of the interactive task run time, for Retry-After
+        self.__interactive_seconds = 0.1
+        for i in range(self.workers):
+            Thread(target=self.__work, name=f"inference-{i}", daemon=True).start()
+
+    def queued(self, priority: int) -> int:
+        with self.__condition:
+            return len(self.__lanes[priority])
+
+    def retry_after(self) -> int:
+        """Seconds until the queued interactive work is likely done."""
+        with self.__condition:
+            return self.__retry_after()
+
+    def submit(
+        self,
+        fn: Callable,
+        *args: Any,
+        priority: int = INTERACTIVE,
+        block: bool = False,
+        **kwargs: Any,
+    ) -> Future:
+        future: Future = Future()
+        with self.__condition:
+            lane = self.__lanes[priority]
+            while len(lane) >= self.__limits[priority] and not self.__stopped:
+                if not block:
+                    raise InferenceQueueFullError(retry_after=self.__retry_after())
+                self.__condition.wait()
+            if self.__stopped:
+                raise RuntimeError("inference scheduler is shut down")
+            lane.append((future, fn, args, kwargs))
+            self.__condition.notify_all()
+        return future
+
+    def call(self, fn: Callable, *args: Any, priority: int = BULK, **kwargs: Any):
+        """Runs `fn` on a worker and waits for it, blocking while saturated."""
+        return self.submit(fn, *args, priority=priority, block=True, **kwargs).result()
+
+    async def run(
+        self, fn: Callable, *args: Any, priority: int = INTERACTIVE, **kwargs: Any
+    ):
+        """Runs `fn` on a worker without blocking the event loop."""
+        return await asyncio.wrap_future(
+            self.submit(fn, *args, priority=priority, **kwargs)
+        )
+
+    def shutdown(self) -> None:
+        with self.__condition:
+            self.__stopped = True
+            for lane in self.__lanes.values():
+                while lane:
+                    lane.popleft()[0].cancel()
+            self.__condition.notify_all()
+
+    def __retry_after(self) -> int:
+        queued = len(self.__lanes[INTERACTIVE])
+        return max(1, ceil(queued * self.__interactive_seconds / self.workers))
+
+    def __next_task(self) -> Optional[Tuple[int, _Task]]:
+        if self.__lanes[INTERACTIVE]:
+            return (INTERACTIVE, self.__lanes[INTERACTIVE].popleft())
+        if self.__lanes[BULK] and self.__bulk_running < self.bulk_workers:
+            self.__bulk_running += 1
+            return (BULK, self.__lanes[BULK].popleft())
+        return None
+
+    def __work(self) -> None:
+        while True:
+            with self.__condition:
+                task = self.__next_task()
+                while task is None:
+                    if self.__stopped:
+                        return
+                    self.__condition.wait()
+                    task = self.__next_task()
+                # a lane has room again
+                self.__condition.notify_all()
+            (priority, (future, fn, args, kwargs)) = task
+            start = perf_counter()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            with self.__condition:
+                if priority == BULK:
+                    self.__bulk_running -= 1
+                else:
+                    self.__interactive_seconds = (
+                        0.8 * self.__interactive_seconds
+                        + 0.2 * (perf_counter() - start)
+                    )
+                self.__condition.notify_all()
+
+
+_scheduler: Optional[InferenceScheduler] = None
+_scheduler_lock = Lock()
+
+
+def get_scheduler(settings: Optional[Settings] = None) -> InferenceScheduler:
+    """Returns the process-wide scheduler, creating it on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            settings = settings or Settings()
+            _scheduler = InferenceScheduler(
+                settings.INFERENCE_WORKERS,
+                settings.INTERACTIVE_QUEUE_SIZE,
+                settings.BULK_QUEUE_SIZE,
+            )
+        return _scheduler
+
+
+def shutdown_scheduler() -> None:
+    """Shuts the process-wide scheduler down.
+
+    The next `get_scheduler` call starts a new one, so a later lifespan of
+    the app in the same process gets a working scheduler.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        (scheduler, _scheduler) = (_scheduler, None)
+    if scheduler is not None:
+        scheduler.shutdown()
@@ -0,0 +1,94 @@
+from hashlib import blake2b
+from os import getpid, listdir, makedirs, path, replace, stat
+from typing import Callable, Dict
+import torch
+from torch import nn
+from safetensors.torch import load_file, save_file  # type: ignore
+from transformers import AutoConfig  # type: ignore
+from transformers.modeling_utils import no_init_weights  # type: ignore
+from DATABASE.database import filesense_path  # type: ignore
+
+SAFETENSORS_DIR = path.join(filesense_path, "safetensors")
+
+
+def fingerprint_files(digest, model_path: str, prefix: str = "") -> None:
+    """Adds the name, size and modification time of each file to `digest`.
+
+    A fine-tuned checkpoint of the same architecture has the same file
+    sizes as the original, so the modification time tells them apart.
+    """
+    for name in sorted(listdir(model_path)):
+        file_stat = stat(path.join(model_path, name))
+        digest.update(
+            f"{prefix}{name}:{file_stat.st_size}:{file_stat.st_mtime_ns};".encode()
+        )
+
+
+def safetensors_path(model_path: str) -> str:
+    """Returns where the converted weights of a model directory are kept.
+
+    The name fingerprints the files of the directory, so replacing the
+    model leads to a new conversion instead of stale weights.
+    """
+    digest = blake2b(digest_size=8)
+    fingerprint_files(digest, model_path)
+    return path.join(
+        SAFETENSORS_DIR,
+        f"{path.basename(path.normpath(model_path))}-{digest.hexdigest()}.safetensors",
+    )
+
+
+def save_safetensors(model: nn.Module, weights_path: str) -> None:
+    """Saves the state dict of a loaded model as safetensors.
+
+    The keys are the model's own, so loading needs no checkpoint prefix
+    handling. Tied weights are stored once per key; `load_safetensors`
+    ties them again.
+    """
+    makedirs(path.dirname(weights_path), exist_ok=True)
+    (state_dict, seen) = ({}, set())
+    for (name, tensor) in model.state_dict().items():
+        tensor = tensor.detach().cpu().contiguous()
+        if tensor.untyped_storage().data_ptr() in seen:
+            # safetensors refuses tensors that share memory
+            tensor = tensor.clone()
+        seen.add(tensor.untyped_storage().data_ptr())
+        state_dict[name] = tensor
+    # a half-written conversion must never be picked up as a finished one
+    tmp_path = f"{weights_path}.{getpid()}.tmp"
+    save_file(state_dict, tmp_path, metadata={"format": "pt"})
+    replace(tmp_path, weights_path)
+
+
+def load_safetensors(build: Callable, model_path: str, weights_path: str) -> nn.Module:
+    """Builds a model from its config and maps its weights from disk.
+
+    The parameters are the memory-mapped tensors themselves rather than
+    copies, so their pages live in the page cache and are shared by
+    every process that maps the same file.
+    """
+    config = AutoConfig.from_pretrained(model_path, local_files_only=True)
+    with no_init_weights():
+        model = build(config)
+    state_dict: Dict[str, torch.Tensor] = load_file(weights_path)
+    model.load_state_dict(state_dict, assign=True)
+    model.tie_weights()
+    return model
+
+
+def load_pretrained(
+    model_cls, build: Callable, model_path: str, mmap: bool = True
+) -> nn.Module:
+    """Loads a pretrained model, from mapped safetensors when possible.
+
+    The first load converts the pickled checkpoint of the directory; later
+    loads, in this or any other process, map the converted file.
+    """
+    if not mmap:
+        return model_cls.from_pretrained(model_path, local_files_only=True)
+    weights_path = safetensors_path(model_path)
+    if not path.exists(weights_path):
+        model = model_cls.from_pretrained(model_path, local_files_only=True)
+        save_safetensors(model, weights_path)
+        del model
+    return load_safetensors(build, model_path, weights_path)
@@ -1,6 +1,7 @@
+from os import path
 from sqlalchemy.orm import Session
 from . import models, schemas
-from typing import Optional
+from typing import List, Optional, Tuple
 
 
 def get_index_path(db: Session, index_id: str):
@@ -25,6 +26,8 @@ def get_all_index(db: Session):
 
 def delete_index(db: Session, index_id: str):
     db.query(models.Index).filter(models.Index.index_id == index_id).delete()
+    db.query(models.IndexFile).filter(models.IndexFile.index_id == index_id).delete()
+    db.query(models.IndexJob).filter(models.IndexJob.index_id == index_id).delete()
     db.commit()
 
 
@@ -62,9 +65,174 @@ def get_indexed_indexes(db: Session):
     return db.query(models.Index).filter(models.Index.index_status == 0).all()
 
 
+def get_indexing_indexes(db: Session):
+    return db.query(models.Index).filter(models.Index.index_status == 1).all()
+
+
 def check_index_exist(db: Session, index_id: str):
     return (
         True
         if db.query(models.Index).filter(models.Index.index_id == index_id).first()
         else False
     )
+
+
+def get_index_files(db: Session, index_id: str):
+    return (
+        db.query(models.IndexFile).filter(models.IndexFile.index_id == index_id).all()
+    )
+
+
+def get_index_files_by_path(db: Session, index_id: str, file_paths: List[str]):
+    return (
+        db.query(models.IndexFile)
+        .filter(
+            models.IndexFile.index_id == index_id,
+            models.IndexFile.file_path.in_(file_paths),
+        )
+        .all()
+    )
+
+
+def get_index_files_under(db: Session, index_id: str, directory: str):
+    return (
+        db.query(models.IndexFile)
+        .filter(
+            models.IndexFile.index_id == index_id,
+            models.IndexFile.file_path.startswith(
+                path.join(directory, ""), autoescape=True
+            ),
+        )
+        .all()
+    )
+
+
+def upsert_index_files(db: Session, index_files: List[schemas.IndexFileCreate]):
+    for index_file in index_files:
+        db_index_file = (
+            db.query(models.IndexFile)
+            .filter(
+                models.IndexFile.index_id == index_file.index_id,
+                models.IndexFile.file_path == index_file.file_path,
+            )
+            .first()
+        )
+        if db_index_file is None:
+            db.add(models.IndexFile(**index_file.model_dump()))
+        else:
+            db_index_file.file_size = index_file.file_size
+            db_index_file.file_mtime = index_file.file_mtime
+            db_index_file.content_hash = index_file.content_hash
+            db_index_file.vector_id = index_file.vector_id
+    db.commit()
+
+
+def update_index_files_stat(
+    db: Session, index_id: str, file_stats: List[Tuple[str, int, float]]
+):
+    for file_path, file_size, file_mtime in file_stats:
+        db.query(models.IndexFile).filter(
+            models.IndexFile.index_id == index_id,
+            models.IndexFile.file_path == file_path,
+        ).update(
+            {
+                models.IndexFile.file_size: file_size,
+                models.IndexFile.file_mtime: file_mtime,
+            }
+        )
+    db.commit()
+
+
+def delete_index_files(db: Session, index_id: str, file_paths: List[str]):
+    db.query(models.IndexFile).filter(
+        models.IndexFile.index_id == index_id,
+        models.IndexFile.file_path.in_(file_paths),
+    ).delete()
+    db.commit()
+
+
+def create_job(db: Session, job: schemas.IndexJobCreate):
+    db_job = models.IndexJob(**job.model_dump())
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+
+def get_job(db: Session, job_id: str):
+    return db.query(models.IndexJob).filter(models.IndexJob.job_id == job_id).first()
+
+
+def get_job_status(db: Session, job_id: str):
+    return (
+        db.query(models.IndexJob.job_status)
+        .filter(models.IndexJob.job_id == job_id)
+        .scalar()
+    )
+
+
+def get_index_jobs(db: Session, index_id: str):
+    return (
+        db.query(models.IndexJob)
+        .filter(models.IndexJob.index_id == index_id)
+        .order_by(models.IndexJob.id)
+        .all()
+    )
+
+
+def get_latest_index_job(db: Session, index_id: str):
+    return (
+        db.query(models.IndexJob)
+        .filter(models.IndexJob.index_id == index_id)
+        .order_by(models.IndexJob.id.desc())
+        .first()
+    )
+
+
+def get_unfinished_jobs(db: Session, job_statuses: List[int]):
+    return (
+        db.query(models.IndexJob)
+        .filter(models.IndexJob.job_status.in_(job_statuses))
+        .order_by(models.IndexJob.id)
+        .all()
+    )
+
+
+def update_job_state(
+    db: Session, job_id: str, job_status: int, error: Optional[str] = None
+):
+    db.query(models.IndexJob).filter(models.IndexJob.job_id == job_id).update(
+        {models.IndexJob.job_status: job_status, models.IndexJob.error: error}
+    )
+    db.commit()
+
+
+def update_index_jobs_state(
+    db: Session, index_id: str, job_statuses: List[int], job_status: int
+):
+    db.query(models.IndexJob).filter(
+        models.IndexJob.index_id == index_id,
+        models.IndexJob.job_status.in_(job_statuses),
+    ).update({models.IndexJob.job_status: job_status}, synchronize_session=False)
+    db.commit()
+
+
+def update_job_progress(
+    db: Session,
+    job_id: str,
+    files_done: int,
+    files_failed: int,
+    files_cached: int = 0,
+    files_deduplicated: int = 0,
+    progress: Optional[str] = None,
+):
+    db.query(models.IndexJob).filter(models.IndexJob.job_id == job_id).update(
+        {
+            models.IndexJob.files_done: files_done,
+            models.IndexJob.files_failed: files_failed,
+            models.IndexJob.files_cached: files_cached,
+            models.IndexJob.files_deduplicated: files_deduplicated,
+            models.IndexJob.progress: progress,
+        }
+    )
+    db.commit()
@@ -1,7 +1,7 @@
 from re import sub
 from pathlib import Path
 from os import path, name as os_name, mkdir
-from sqlalchemy import create_engine
+from sqlalchemy import MetaData, create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -22,3 +22,27 @@ engine = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+
+def add_missing_columns(metadata: MetaData) -> None:
+    """Adds model columns that existing tables were created without.
+
+    `create_all` only creates missing tables, so columns added to a model
+    later are appended here, using their scalar default for existing rows.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = (
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" '
+                    f"{column.type.compile(engine.dialect)}"
+                )
+                if column.default is not None and column.default.is_scalar:
+                    ddl += f" DEFAULT {column.default.arg!r}"
+                connection.execute(text(ddl))
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Float, Integer, String, UniqueConstraint
 from .database import Base
 
 
@@ -9,3 +10,42 @@ class Index(Base):
     index_id = Column(String, unique=True, index=True)
     index_path = Column(String, unique=True, index=True)
     index_status = Column(Integer, index=True)
+
+
+class IndexFile(Base):
+    __tablename__ = "index_file"
+    __table_args__ = (UniqueConstraint("index_id", "file_path"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    index_id = Column(String, index=True)
+    file_path = Column(String, index=True)
+    file_size = Column(Integer)
+    file_mtime = Column(Float)
+    content_hash = Column(String, index=True)
+    vector_id = Column(String)
+
+
+class IndexJob(Base):
+    __tablename__ = "index_job"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, unique=True, index=True)
+    index_id = Column(String, index=True)
+    job_type = Column(String)
+    job_status = Column(Integer, index=True)
+    files_done = Column(Integer, default=0)
+    files_failed = Column(Integer, default=0)
+    files_cached = Column(Integer, default=0)
+    files_deduplicated = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+    # JSON snapshot of the running pipeline, read by every server worker
+    progress = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def skip_ratio(self) -> float:
+        """Share of the files of the job that skipped model inference."""
+        if not self.files_done:
+            return 0.0
+        return (self.files_cached + self.files_deduplicated) / self.files_done
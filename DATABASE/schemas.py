@@ -1,3 +1,5 @@
+from datetime import datetime
+from typing import Optional
 from pydantic import BaseModel
 
 
@@ -16,3 +18,42 @@ class Index(IndexBase):
 
     class Config:
         from_attributes = True
+
+
+class IndexFileBase(BaseModel):
+    index_id: str
+    file_path: str
+    file_size: int
+    file_mtime: float
+    content_hash: str
+    vector_id: str
+
+
+class IndexFileCreate(IndexFileBase):
+    pass
+
+
+class IndexJobBase(BaseModel):
+    job_id: str
+    index_id: str
+    job_type: str
+    job_status: int
+
+
+class IndexJobCreate(IndexJobBase):
+    pass
+
+
+class IndexJob(IndexJobBase):
+    id: int
+    files_done: int
+    files_failed: int
+    files_cached: int
+    files_deduplicated: int
+    skip_ratio: float
+    error: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,164 @@
+import sqlite3
+from os import path
+from threading import Lock
+from time import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from settings import Settings  # type: ignore
+from DATABASE.database import filesense_path  # type: ignore
+
+_QUERY_CHUNK_SIZE = 500
+
+
+class CachedEmbedding(NamedTuple):
+    caption: str
+    caption_embedding: List[float]
+    image_embedding: List[float]
+
+
+class EmbeddingCache(object):
+    """Disk-backed cache of captions and embeddings keyed by file content.
+
+    Entries are keyed by the content hash of an image and the identity of
+    the models that produced them, so a photo found in several indexed
+    folders goes through inference once. The least recently used entries
+    are evicted once the stored results grow past `max_bytes`.
+    """
+
+    def __init__(self, db_path: str, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.__lock = Lock()
+        self.__conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache ("
+            "cache_key TEXT PRIMARY KEY, caption TEXT, caption_embedding BLOB, "
+            "image_embedding BLOB, size INTEGER, last_used REAL)"
+        )
+        self.__conn.execute(
+            "CREATE INDEX IF NOT EXISTS embedding_cache_last_used "
+            "ON embedding_cache (last_used)"
+        )
+        self.__conn.commit()
+        self.__size = self.__conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embedding_cache"
+        ).fetchone()[0]
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    def get(self, model_identity: str, file_hash: str) -> Optional[CachedEmbedding]:
+        return self.get_many(model_identity, [file_hash]).get(file_hash)
+
+    def get_many(
+        self, model_identity: str, file_hashes: Iterable[str]
+    ) -> Dict[str, CachedEmbedding]:
+        keys = {
+            _cache_key(model_identity, file_hash): file_hash
+            for file_hash in file_hashes
+        }
+        key_list = list(keys)
+        found: Dict[str, CachedEmbedding] = {}
+        with self.__lock:
+            for start in range(0, len(key_list), _QUERY_CHUNK_SIZE):
+                chunk = key_list[start : start + _QUERY_CHUNK_SIZE]
+                rows = self.__conn.execute(
+                    "SELECT cache_key, caption, caption_embedding, image_embedding "
+                    f"FROM embedding_cache WHERE cache_key IN ({_params(chunk)})",
+                    chunk,
+                )
+                for (key, caption, caption_embedding, image_embedding) in rows:
+                    found[keys[key]] = CachedEmbedding(
+                        caption,
+                        np.frombuffer(caption_embedding, dtype=np.float32).tolist(),
+                        np.frombuffer(image_embedding, dtype=np.float32).tolist(),
+                    )
+            if found:
+                used = [_cache_key(model_identity, file_hash) for file_hash in found]
+                self.__conn.execute(
+                    "UPDATE embedding_cache SET last_used = ? "
+                    f"WHERE cache_key IN ({_params(used)})",
+                    [time(), *used],
+                )
+                self.__conn.commit()
+        return found
+
+    def put_many(
+        self, model_identity: str, results: Sequence[Tuple[str, CachedEmbedding]]
+    ) -> None:
+        rows = {}
+        for file_hash, result in results:
+            caption_embedding = np.asarray(result.caption_embedding, np.float32)
+            image_embedding = np.asarray(result.image_embedding, np.float32)
+            size = len(result.caption) + caption_embedding.nbytes
+            rows[_cache_key(model_identity, file_hash)] = (
+                result.caption,
+                caption_embedding.tobytes(),
+                image_embedding.tobytes(),
+                size + image_embedding.nbytes,
+            )
+        if not rows:
+            return
+        with self.__lock:
+            keys = list(rows)
+            # replaced entries no longer count towards the size
+            for (size,) in self.__conn.execute(
+                "SELECT size FROM embedding_cache "
+                f"WHERE cache_key IN ({_params(keys)})",
+                keys,
+            ):
+                self.__size -= size
+            now = time()
+            self.__conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache VALUES (?, ?, ?, ?, ?, ?)",
+                [(key, *row, now) for key, row in rows.items()],
+            )
+            self.__size += sum(row[3] for row in rows.values())
+            self.__evict()
+            self.__conn.commit()
+
+    def __evict(self) -> None:
+        while self.__size > self.max_bytes:
+            rows = self.__conn.execute(
+                "SELECT cache_key, size FROM embedding_cache "
+                "ORDER BY last_used LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self.__size = 0
+                return
+            evicted = []
+            for key, size in rows:
+                if self.__size <= self.max_bytes:
+                    break
+                evicted.append(key)
+                self.__size -= size
+            self.__conn.execute(
+                f"DELETE FROM embedding_cache WHERE cache_key IN ({_params(evicted)})",
+                evicted,
+            )
+
+
+def _cache_key(model_identity: str, file_hash: str) -> str:
+    return f"{model_identity}:{file_hash}"
+
+
+def _params(values: Sequence) -> str:
+    return ", ".join("?" * len(values))
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = Lock()
+
+
+def get_embedding_cache(settings: Settings) -> Optional[EmbeddingCache]:
+    global _cache
+    if settings.EMBEDDING_CACHE_SIZE_MB <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(
+                path.join(filesense_path, "embedding_cache.sqlite3"),
+                settings.EMBEDDING_CACHE_SIZE_MB * 1024 * 1024,
+            )
+        return _cache
@@ -0,0 +1,57 @@
+from hashlib import blake2b, sha1
+from os import stat
+from typing import Iterable, List, NamedTuple, Tuple
+from DATABASE import models  # type: ignore
+
+
+class FileEntry(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+
+
+def stat_entry(file_path: str) -> FileEntry:
+    file_stat = stat(file_path)
+    return FileEntry(file_path, file_stat.st_size, file_stat.st_mtime)
+
+
+def vector_id(file_path: str) -> str:
+    return sha1(file_path.encode("utf-8")).hexdigest()
+
+
+def content_hash(data: bytes) -> str:
+    return blake2b(data, digest_size=16).hexdigest()
+
+
+def file_content_hash(file_path: str) -> str:
+    digest = blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def diff_catalog(
+    entries: Iterable[FileEntry], catalog: Iterable[models.IndexFile]
+) -> Tuple[List[FileEntry], List[FileEntry], List[models.IndexFile]]:
+    """Compares a filesystem scan against the catalog of an index.
+
+    Returns the entries that must be (re)embedded, the entries whose content
+    is unchanged but whose size/mtime must be refreshed in the catalog, and
+    the catalog rows of files that no longer exist. A file whose mtime moved
+    but whose content hash still matches is not embedded again.
+    """
+    remaining = {row.file_path: row for row in catalog}
+    changed: List[FileEntry] = []
+    touched: List[FileEntry] = []
+    for entry in entries:
+        row = remaining.pop(entry.path, None)
+        if row is None or row.file_size != entry.size:
+            changed.append(entry)
+        elif row.file_mtime != entry.mtime:
+            try:
+                same_content = file_content_hash(entry.path) == row.content_hash
+            except OSError:
+                continue
+            (touched if same_content else changed).append(entry)
+    return (changed, touched, list(remaining.values()))
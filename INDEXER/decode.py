@@ -0,0 +1,129 @@
+import atexit
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from math import prod
+from multiprocessing import get_context, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from os import _exit, getppid
+from queue import Queue
+from threading import Lock, Thread
+from time import sleep
+from typing import Dict, List, Tuple
+import numpy as np
+from AI.preprocess import ImagePreprocessor, dhash  # type: ignore
+from .catalog import content_hash
+
+_worker: Dict[str, object] = {}
+
+
+def _slot_views(
+    buffer: memoryview, preprocessor: ImagePreprocessor
+) -> Tuple[np.ndarray, np.ndarray]:
+    caption_pixels = np.ndarray(
+        preprocessor.caption_shape, dtype=np.float32, buffer=buffer
+    )
+    image_pixels = np.ndarray(
+        preprocessor.image_shape,
+        dtype=np.float32,
+        buffer=buffer,
+        offset=caption_pixels.nbytes,
+    )
+    return (caption_pixels, image_pixels)
+
+
+def _exit_with_parent(parent_pid: int) -> None:
+    # the server can be killed without running its atexit hooks
+    while getppid() == parent_pid:
+        sleep(1)
+    _exit(0)
+
+
+def _init_worker(preprocessor: ImagePreprocessor, slot_names: List[str]) -> None:
+    Thread(target=_exit_with_parent, args=(getppid(),), daemon=True).start()
+    slots = []
+    for slot_name in slot_names:
+        slot = SharedMemory(name=slot_name)
+        # attaching registers the block with the resource tracker, which
+        # would unlink it when this worker exits; the parent owns it
+        resource_tracker.unregister(slot._name, "shared_memory")  # type: ignore
+        slots.append(slot)
+    _worker["preprocessor"] = preprocessor
+    _worker["slots"] = slots
+
+
+def _decode_into_slot(file_path: str, slot: int) -> Tuple[str, int]:
+    preprocessor: ImagePreprocessor = _worker["preprocessor"]  # type: ignore
+    slots: List[SharedMemory] = _worker["slots"]  # type: ignore
+    with open(file_path, "rb") as f:
+        data = f.read()
+    image = preprocessor.decode(BytesIO(data))
+    (caption_pixels, image_pixels) = _slot_views(slots[slot].buf, preprocessor)
+    preprocessor.caption_pixels(image, out=caption_pixels)
+    preprocessor.image_pixels(image, out=image_pixels)
+    return (content_hash(data), dhash(image))
+
+
+class DecodePool(object):
+    """Decodes and preprocesses images in worker processes.
+
+    Workers write the model inputs straight into shared-memory slots owned
+    by this process; only the file path, the slot number and the content
+    and perceptual hashes cross the process boundary, never the pixels.
+    """
+
+    def __init__(self, preprocessor: ImagePreprocessor, workers: int) -> None:
+        self.preprocessor = preprocessor
+        self.capacity = workers * 2
+        slot_size = 4 * (
+            prod(preprocessor.caption_shape) + prod(preprocessor.image_shape)
+        )
+        self.__slots = [
+            SharedMemory(create=True, size=slot_size) for _ in range(self.capacity)
+        ]
+        self.__free_slots: Queue = Queue()
+        for slot in range(self.capacity):
+            self.__free_slots.put(slot)
+        self.__executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(preprocessor, [slot.name for slot in self.__slots]),
+        )
+
+    def submit(self, file_path: str) -> Tuple[int, Future]:
+        slot = self.__free_slots.get()
+        try:
+            return (slot, self.__executor.submit(_decode_into_slot, file_path, slot))
+        except BaseException:
+            self.__free_slots.put(slot)
+            raise
+
+    def collect(
+        self, slot: int, future: Future
+    ) -> Tuple[str, int, np.ndarray, np.ndarray]:
+        try:
+            (file_hash, image_hash) = future.result()
+            (caption_pixels, image_pixels) = _slot_views(
+                self.__slots[slot].buf, self.preprocessor
+            )
+            return (file_hash, image_hash, caption_pixels.copy(), image_pixels.copy())
+        finally:
+            self.__free_slots.put(slot)
+
+    def close(self) -> None:
+        self.__executor.shutdown(cancel_futures=True)
+        for slot in self.__slots:
+            slot.close()
+            slot.unlink()
+
+
+_pools: Dict[int, DecodePool] = {}
+_pools_lock = Lock()
+
+
+def get_decode_pool(preprocessor: ImagePreprocessor, workers: int) -> DecodePool:
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = DecodePool(preprocessor, workers)
+            atexit.register(_pools[workers].close)
+        return _pools[workers]
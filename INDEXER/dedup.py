@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+from .cache import CachedEmbedding
+
+HASH_BITS = 64
+
+
+class NearDuplicateIndex(object):
+    """Finds an earlier image whose dHash is within `threshold` bits.
+
+    Hashes are split into threshold + 1 bands. Two hashes within the
+    threshold agree exactly on at least one band, so only images sharing a
+    band are compared. The index holds the `capacity` most recently added
+    images together with their captions and embeddings.
+    """
+
+    def __init__(self, threshold: int, capacity: int) -> None:
+        self.threshold = threshold
+        self.capacity = capacity
+        band_count = min(threshold + 1, HASH_BITS)
+        edges = [HASH_BITS * band // band_count for band in range(band_count + 1)]
+        self.__bands: List[Tuple[int, int]] = [
+            (start, (1 << (end - start)) - 1) for start, end in zip(edges, edges[1:])
+        ]
+        self.__buckets: List[Dict[int, Set[int]]] = [{} for _ in self.__bands]
+        self.__representatives: OrderedDict[int, str] = OrderedDict()
+        self.__results: Dict[str, CachedEmbedding] = {}
+
+    def find(self, image_hash: int) -> Optional[str]:
+        """Returns the file hash of a near-duplicate added earlier, if any."""
+        for (shift, mask), buckets in zip(self.__bands, self.__buckets):
+            for candidate in buckets.get((image_hash >> shift) & mask, ()):
+                if bin(candidate ^ image_hash).count("1") <= self.threshold:
+                    return self.__representatives[candidate]
+        return None
+
+    def add(self, image_hash: int, file_hash: str) -> None:
+        if image_hash in self.__representatives:
+            return
+        self.__representatives[image_hash] = file_hash
+        for (shift, mask), buckets in zip(self.__bands, self.__buckets):
+            buckets.setdefault((image_hash >> shift) & mask, set()).add(image_hash)
+        while len(self.__representatives) > self.capacity:
+            (evicted_hash, evicted_file_hash) = self.__representatives.popitem(
+                last=False
+            )
+            self.__results.pop(evicted_file_hash, None)
+            for (shift, mask), buckets in zip(self.__bands, self.__buckets):
+                band = (evicted_hash >> shift) & mask
+                buckets[band].discard(evicted_hash)
+                if not buckets[band]:
+                    del buckets[band]
+
+    def set_result(self, file_hash: str, result: CachedEmbedding) -> None:
+        # float32 arrays take a fraction of the memory of float lists
+        self.__results[file_hash] = CachedEmbedding(
+            result.caption,
+            np.asarray(result.caption_embedding, np.float32),
+            np.asarray(result.image_embedding, np.float32),
+        )
+
+    def get_result(self, file_hash: str) -> Optional[CachedEmbedding]:
+        result = self.__results.get(file_hash)
+        if result is None:
+            return None
+        return CachedEmbedding(
+            result.caption,
+            result.caption_embedding.tolist(),
+            result.image_embedding.tolist(),
+        )
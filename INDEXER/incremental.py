@@ -0,0 +1,141 @@
+from os import path
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional
+from sqlalchemy.orm import Session
+from AI.engine import AIEngine  # type: ignore
+from DATABASE import crud, models  # type: ignore
+from VECTORSTORE.vectorstore import VectorStore  # type: ignore
+from .catalog import FileEntry, diff_catalog, stat_entry
+from .pipeline import IndexingPipeline
+from .progress import PipelineStats
+from .scanner import is_image_path, iter_image_entry
+
+_QUERY_CHUNK_SIZE = 500
+
+_index_locks: Dict[str, Lock] = {}
+_index_locks_lock = Lock()
+
+
+def index_lock(index_id: str) -> Lock:
+    """Returns the lock held while a job or a watcher syncs the index.
+
+    Two pipelines on one catalog would insert the same files twice.
+    """
+    with _index_locks_lock:
+        return _index_locks.setdefault(index_id, Lock())
+
+
+def discard_index(db: Session, vs: VectorStore, index_id: str) -> None:
+    """Removes what a sync committed after its index was deleted.
+
+    Upserts create missing collections, so the last commit of a sync that
+    raced the deletion of its index would otherwise leave them behind.
+    """
+    try:
+        vs.delete_collection(index_id)
+    except ValueError:
+        pass
+    crud.delete_index(db, index_id)
+
+
+def apply_changes(
+    db: Session,
+    vs: VectorStore,
+    ae: AIEngine,
+    index_id: str,
+    changed: Iterable[FileEntry],
+    touched: List[FileEntry],
+    removed: List[models.IndexFile],
+    on_commit: Optional[Callable[[PipelineStats], None]] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+) -> PipelineStats:
+    # chunked like the lookups of sync_paths, below SQLite's variable limit
+    for start in range(0, len(removed), _QUERY_CHUNK_SIZE):
+        chunk = removed[start : start + _QUERY_CHUNK_SIZE]
+        vs.delete_from_collections([row.vector_id for row in chunk], index_id)
+        crud.delete_index_files(db, index_id, [row.file_path for row in chunk])
+    if touched:
+        crud.update_index_files_stat(
+            db, index_id, [(entry.path, entry.size, entry.mtime) for entry in touched]
+        )
+    return IndexingPipeline(
+        ae, vs, index_id, db=db, on_commit=on_commit, cancelled=cancelled
+    ).run(changed)
+
+
+def sync_directory(
+    db: Session,
+    vs: VectorStore,
+    ae: AIEngine,
+    index_id: str,
+    directory: str,
+    on_commit: Optional[Callable[[PipelineStats], None]] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+) -> PipelineStats:
+    """Indexes every file of the directory the catalog does not hold yet.
+
+    Files committed by an earlier, interrupted run are skipped, so this is
+    also how indexing resumes.
+    """
+    catalog = crud.get_index_files(db, index_id)
+    if not catalog:
+        # indexes built before the file catalog existed have no stable
+        # vector ids, so they are rebuilt from scratch
+        try:
+            vs.delete_collection(index_id)
+        except ValueError:
+            pass
+        # nothing to diff against, so stream the scan straight into the pipeline
+        return apply_changes(
+            db,
+            vs,
+            ae,
+            index_id,
+            iter_image_entry(directory),
+            [],
+            [],
+            on_commit,
+            cancelled,
+        )
+    (changed, touched, removed) = diff_catalog(iter_image_entry(directory), catalog)
+    return apply_changes(
+        db, vs, ae, index_id, changed, touched, removed, on_commit, cancelled
+    )
+
+
+def sync_paths(
+    db: Session,
+    vs: VectorStore,
+    ae: AIEngine,
+    index_id: str,
+    file_paths: List[str],
+    dir_paths: List[str],
+    cancelled: Optional[Callable[[], bool]] = None,
+) -> PipelineStats:
+    """Brings the catalog and vectors of the given paths in line with disk.
+
+    Paths may have been created, modified or deleted; directories cover
+    every file below them.
+    """
+    catalog: List[models.IndexFile] = []
+    entries: List[FileEntry] = []
+    for start in range(0, len(file_paths), _QUERY_CHUNK_SIZE):
+        catalog.extend(
+            crud.get_index_files_by_path(
+                db, index_id, file_paths[start : start + _QUERY_CHUNK_SIZE]
+            )
+        )
+    for file_path in file_paths:
+        if is_image_path(file_path) and path.isfile(file_path):
+            try:
+                entries.append(stat_entry(file_path))
+            except OSError:
+                continue
+    for dir_path in dir_paths:
+        catalog.extend(crud.get_index_files_under(db, index_id, dir_path))
+        if path.isdir(dir_path):
+            entries.extend(iter_image_entry(dir_path))
+    (changed, touched, removed) = diff_catalog(entries, catalog)
+    return apply_changes(
+        db, vs, ae, index_id, changed, touched, removed, cancelled=cancelled
+    )
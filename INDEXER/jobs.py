@@ -0,0 +1,248 @@
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps
+from logging import getLogger
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Optional, Set
+from uuid import uuid4
+from sqlalchemy.orm import Session
+from settings import Settings  # type: ignore
+from AI.engine import AIEngine  # type: ignore
+from DATABASE import crud, models, schemas  # type: ignore
+from DATABASE.database import SessionLocal  # type: ignore
+from error import IndexingCancelledError  # type: ignore
+from VECTORSTORE.vectorstore import VectorStore  # type: ignore
+from .incremental import discard_index, index_lock, sync_directory
+from .leader import LeaderLock
+from .progress import PipelineStats
+from .watcher import IndexWatcher
+
+logger = getLogger(__name__)
+
+JOB_FAILED = -1
+JOB_COMPLETED = 0
+JOB_RUNNING = 1
+JOB_QUEUED = 2
+JOB_CANCELLED = -2
+# how long deleting an index waits for its running job to stop
+CANCEL_TIMEOUT = 30.0
+
+
+class JobRunner(object):
+    """Runs the indexing jobs recorded in the job table.
+
+    A job is stored before it is queued and its progress, with a snapshot
+    of the pipeline stats, is checkpointed after every committed chunk, so
+    jobs that a stopped server left queued or running are picked up again
+    by `resume`. Resumed jobs diff the directory against the file catalog
+    and skip files already committed.
+    At most MAX_CONCURRENT_JOBS jobs run at the same time.
+
+    With several server workers, only the holder of `leader` runs jobs;
+    the other workers just record the jobs they are asked for, and the
+    leader picks them up from the job table within JOB_POLL_INTERVAL.
+
+    Jobs are cancelled through the job table as well: a running job checks
+    its row before every commit, and once cancelled removes whatever it
+    committed after its index was deleted.
+    """
+
+    def __init__(
+        self,
+        ae: AIEngine,
+        vs: VectorStore,
+        settings: Optional[Settings] = None,
+        watcher: Optional[IndexWatcher] = None,
+        leader: Optional[LeaderLock] = None,
+    ) -> None:
+        self.ae = ae
+        self.vs = vs
+        self.watcher = watcher
+        self.leader = leader
+        self.settings = settings or ae.settings
+        self.__submitted: Set[str] = set()
+        # index id -> set once the job running for that index has stopped
+        self.__running: Dict[str, Event] = {}
+        self.__lock = Lock()
+        self.__stop = Event()
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max(1, self.settings.MAX_CONCURRENT_JOBS),
+            thread_name_prefix="index-job",
+        )
+
+    def submit(self, index_id: str, job_type: str) -> str:
+        db = SessionLocal()
+        try:
+            job = crud.create_job(
+                db,
+                schemas.IndexJobCreate(
+                    job_id=uuid4().hex,
+                    index_id=index_id,
+                    job_type=job_type,
+                    job_status=JOB_QUEUED,
+                ),
+            )
+            job_id = job.job_id
+        finally:
+            db.close()
+        if self.is_leader:
+            self.__enqueue(job_id)
+        return job_id
+
+    @property
+    def is_leader(self) -> bool:
+        return self.leader is None or self.leader.is_leader
+
+    def start(self, on_elected: Optional[Callable[[], None]] = None) -> None:
+        """Resumes the jobs once this process is elected to run them.
+
+        `on_elected` runs first, for the other work of the leader.
+        """
+        Thread(target=self.__lead, args=(on_elected,), daemon=True).start()
+
+    def resume(self) -> None:
+        db = SessionLocal()
+        try:
+            jobs = crud.get_unfinished_jobs(db, [JOB_RUNNING, JOB_QUEUED])
+            job_index_ids = {job.index_id for job in jobs}
+            # indexes left indexing by a server that predates the job table
+            orphan_index_ids = [
+                index.index_id
+                for index in crud.get_indexing_indexes(db)
+                if index.index_id not in job_index_ids
+            ]
+            job_ids = [job.job_id for job in jobs]
+        finally:
+            db.close()
+        for job_id in job_ids:
+            self.__enqueue(job_id)
+        for index_id in orphan_index_ids:
+            self.submit(index_id, "index")
+
+    def cancel(self, index_id: str, timeout: float = CANCEL_TIMEOUT) -> None:
+        """Cancels the jobs of an index and waits for one running here."""
+        db = SessionLocal()
+        try:
+            crud.update_index_jobs_state(
+                db, index_id, [JOB_QUEUED, JOB_RUNNING], JOB_CANCELLED
+            )
+        finally:
+            db.close()
+        with self.__lock:
+            stopped = self.__running.get(index_id)
+        if stopped is not None:
+            stopped.wait(timeout)
+
+    def shutdown(self) -> None:
+        self.__stop.set()
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+        if self.leader is not None:
+            self.leader.release()
+
+    def __enqueue(self, job_id: str) -> None:
+        with self.__lock:
+            if job_id in self.__submitted:
+                return
+            self.__submitted.add(job_id)
+        self.__executor.submit(self.__run, job_id)
+
+    def __lead(self, on_elected: Optional[Callable[[], None]]) -> None:
+        interval = self.settings.JOB_POLL_INTERVAL
+        while not (self.leader is None or self.leader.acquire()):
+            # the leader may exit, then another worker takes over
+            if self.__stop.wait(interval):
+                return
+        if on_elected is not None:
+            on_elected()
+        self.resume()
+        while not self.__stop.wait(interval):
+            db = SessionLocal()
+            try:
+                job_ids = [
+                    job.job_id for job in crud.get_unfinished_jobs(db, [JOB_QUEUED])
+                ]
+            finally:
+                db.close()
+            for job_id in job_ids:
+                self.__enqueue(job_id)
+
+    def __run(self, job_id: str) -> None:
+        db = SessionLocal()
+        try:
+            job = crud.get_job(db, job_id)
+            if job is None or job.job_status == JOB_CANCELLED:
+                return
+            index = crud.get_index_path(db, job.index_id)
+            if index is None:
+                crud.update_job_state(db, job_id, JOB_FAILED, "Index does not exist")
+                return
+            stopped = Event()
+            with self.__lock:
+                self.__running[index.index_id] = stopped
+            try:
+                self.__index(db, job, index)
+            finally:
+                with self.__lock:
+                    self.__running.pop(index.index_id, None)
+                stopped.set()
+        finally:
+            db.close()
+
+    def __index(self, db: Session, job: models.IndexJob, index: models.Index) -> None:
+        job_id = job.job_id
+        # files committed before an interruption are not embedded again
+        (files_done, files_failed, files_cached, files_deduplicated) = (
+            job.files_done,
+            job.files_failed or 0,
+            job.files_cached or 0,
+            job.files_deduplicated or 0,
+        )
+
+        def checkpoint(stats: PipelineStats) -> None:
+            crud.update_job_progress(
+                db,
+                job_id,
+                files_done + stats.processed,
+                files_failed + stats.failed,
+                files_cached + stats.cached,
+                files_deduplicated + stats.deduplicated,
+                dumps(stats.snapshot()),
+            )
+
+        def cancelled() -> bool:
+            # deleting the index deletes the job row as well
+            return crud.get_job_status(db, job_id) in (JOB_CANCELLED, None)
+
+        crud.update_job_state(db, job_id, JOB_RUNNING)
+        crud.update_index_state(db, index.index_id, 1)
+        # a watcher flush of the index that is under way finishes first;
+        # later ones wait for the index to be indexed again
+        with index_lock(index.index_id):
+            try:
+                stats = sync_directory(
+                    db,
+                    self.vs,
+                    self.ae,
+                    index.index_id,
+                    index.index_path,
+                    checkpoint,
+                    cancelled,
+                )
+            except IndexingCancelledError:
+                # only deleting its index cancels a job
+                discard_index(db, self.vs, index.index_id)
+                return
+            except Exception as e:
+                logger.exception("indexing job %s failed", job_id)
+                crud.update_job_state(
+                    db, job_id, JOB_FAILED, f"{type(e).__name__}: {e}"
+                )
+                crud.update_index_state(db, index.index_id, -1)
+                return
+            if cancelled():
+                discard_index(db, self.vs, index.index_id)
+                return
+        checkpoint(stats)
+        crud.update_job_state(db, job_id, JOB_COMPLETED)
+        crud.update_index_state(db, index.index_id, 0)
+        if self.watcher is not None:
+            self.watcher.watch(index.index_id, index.index_path)
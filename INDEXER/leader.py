@@ -0,0 +1,49 @@
+from os import name as os_name, path
+from typing import IO, Optional
+from DATABASE.database import filesense_path  # type: ignore
+
+LEADER_LOCK_PATH = path.join(filesense_path, "indexer.lock")
+
+
+class LeaderLock(object):
+    """Elects the one server process that runs indexing jobs and watchers.
+
+    The leader holds an exclusive lock on a file for as long as it lives;
+    the operating system releases it when the process exits, so another
+    worker can take over after a crash.
+    """
+
+    def __init__(self, lock_path: str = LEADER_LOCK_PATH) -> None:
+        self.lock_path = lock_path
+        self.__file: Optional[IO] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.__file is not None
+
+    def acquire(self) -> bool:
+        """Takes the lock if it is free; never waits for it."""
+        if self.__file is not None:
+            return True
+        lock_file = open(self.lock_path, "a+")
+        try:
+            if os_name == "nt":
+                import msvcrt
+
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self.__file = lock_file
+        return True
+
+    def release(self) -> None:
+        if self.__file is not None:
+            # closing the file drops the lock
+            self.__file.close()
+            self.__file = None
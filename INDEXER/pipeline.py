@@ -0,0 +1,368 @@
+from collections import deque
+from concurrent.futures import Future
+from io import BytesIO
+from logging import getLogger
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from time import perf_counter
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+import numpy as np
+from sqlalchemy.orm import Session
+from settings import Settings  # type: ignore
+from AI.engine import AIEngine  # type: ignore
+from AI.preprocess import dhash  # type: ignore
+from AI.scheduler import BULK, get_scheduler  # type: ignore
+from DATABASE import crud, schemas  # type: ignore
+from error import IndexingCancelledError  # type: ignore
+from VECTORSTORE.vectorstore import VectorStore  # type: ignore
+from .cache import CachedEmbedding, get_embedding_cache
+from .catalog import FileEntry, content_hash, vector_id
+from .decode import DecodePool, get_decode_pool
+from .dedup import NearDuplicateIndex
+from .progress import PipelineStats
+
+logger = getLogger(__name__)
+
+_DONE = object()
+
+
+class DecodedImage(NamedTuple):
+    entry: FileEntry
+    file_hash: str
+    image_hash: Optional[int]
+    # caption and image model inputs; None when served from the cache
+    pixels: Optional[Tuple[np.ndarray, np.ndarray]]
+    cached: Optional[CachedEmbedding]
+
+
+class IndexingPipeline(object):
+    """Streams images through scan -> decode -> caption/embed -> upsert.
+
+    Each stage runs on its own thread and hands work to the next one through
+    a bounded queue, so only a few chunks of decoded images and embeddings
+    are alive at any time. Every chunk is committed to the vector store as
+    soon as it is embedded. When a database session is given, the file
+    catalog of the index is updated together with each committed chunk.
+    `on_commit` is called with the running stats after every commit.
+    `cancelled` is asked before every commit; once it returns True, the
+    pipeline stops and `run` raises `IndexingCancelledError`.
+    Files that cannot be read or decoded are logged and counted as failed.
+    Without `settings`, those of the engine are used, tuned ones included.
+
+    Images whose content was embedded before, in this or any other index,
+    are served from the embedding cache instead of going through the
+    models; on the in-process decode path they are not even decoded.
+    When DEDUP_HAMMING_THRESHOLD is set, images within that many bits of
+    the dHash of an image processed shortly before in the same run reuse
+    its results as well.
+
+    Model calls run in the bulk lane of the inference scheduler, so search
+    requests are served ahead of them; while the lane is full, the
+    pipeline waits and the bounded queues hold back the earlier stages.
+    """
+
+    def __init__(
+        self,
+        ae: AIEngine,
+        vs: VectorStore,
+        collection_name: str,
+        settings: Optional[Settings] = None,
+        db: Optional[Session] = None,
+        on_commit: Optional[Callable[[PipelineStats], None]] = None,
+        cancelled: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        self.ae = ae
+        self.vs = vs
+        self.db = db
+        self.on_commit = on_commit
+        self.cancelled = cancelled
+        self.collection_name = collection_name
+        self.settings = settings or ae.settings
+        self.stats = PipelineStats()
+        self.cache = get_embedding_cache(self.settings)
+        self.scheduler = get_scheduler(self.settings)
+        self.dedup = None
+        if self.settings.DEDUP_HAMMING_THRESHOLD is not None:
+            self.dedup = NearDuplicateIndex(
+                self.settings.DEDUP_HAMMING_THRESHOLD, self.settings.DEDUP_WINDOW
+            )
+        self.__stop = Event()
+        self.__errors: List[BaseException] = []
+        self.__entry_queue: Queue = Queue(maxsize=self.settings.INDEX_QUEUE_SIZE)
+        self.__image_queue: Queue = Queue(maxsize=self.settings.INDEX_QUEUE_SIZE)
+        self.__chunk_queue: Queue = Queue(maxsize=2)
+
+    def run(self, entries: Iterable[FileEntry]) -> PipelineStats:
+        stages = [
+            Thread(target=self.__guard, args=(self.__scan, entries)),
+            Thread(target=self.__guard, args=(self.__decode,)),
+            Thread(target=self.__guard, args=(self.__embed,)),
+            Thread(target=self.__guard, args=(self.__upsert,)),
+        ]
+        for stage in stages:
+            stage.daemon = True
+            stage.start()
+        for stage in stages:
+            stage.join()
+        if self.__errors:
+            raise self.__errors[0]
+        return self.stats
+
+    def __guard(self, stage: Callable[..., None], *args: Any) -> None:
+        try:
+            stage(*args)
+        except BaseException as e:
+            self.__errors.append(e)
+            self.__stop.set()
+
+    def __put(self, queue: Queue, item: Any) -> bool:
+        while not self.__stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def __get(self, queue: Queue) -> Any:
+        while not self.__stop.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                continue
+        return _DONE
+
+    def __scan(self, entries: Iterable[FileEntry]) -> None:
+        for entry in entries:
+            self.stats.scanned += 1
+            if not self.__put(self.__entry_queue, entry):
+                return
+        self.stats.scan_done = True
+        self.__put(self.__entry_queue, _DONE)
+
+    def __decode(self) -> None:
+        if self.settings.DECODE_WORKERS > 0:
+            self.__decode_in_pool(
+                get_decode_pool(self.ae.preprocessor, self.settings.DECODE_WORKERS)
+            )
+            return
+        while True:
+            entry = self.__get(self.__entry_queue)
+            if entry is _DONE:
+                break
+            start = perf_counter()
+            (image_hash, pixels, cached) = (None, None, None)
+            try:
+                with open(entry.path, "rb") as f:
+                    data = f.read()
+                file_hash = content_hash(data)
+                if self.cache is not None:
+                    cached = self.cache.get(self.ae.model_identity, file_hash)
+                if cached is None:
+                    image = self.ae.preprocessor.decode(BytesIO(data))
+                    pixels = self.ae.preprocessor(image)
+                    image_hash = dhash(image)
+            except Exception as e:
+                logger.warning("skipping %s: %s", entry.path, e)
+                self.stats.failed += 1
+                continue
+            if cached is None:
+                self.stats.stages["decode"].add(1, perf_counter() - start)
+            if not self.__put(
+                self.__image_queue,
+                DecodedImage(entry, file_hash, image_hash, pixels, cached),
+            ):
+                return
+        self.__put(self.__image_queue, _DONE)
+
+    def __decode_in_pool(self, pool: DecodePool) -> None:
+        in_flight: Deque[Tuple[FileEntry, int, Future]] = deque()
+        exhausted = False
+        try:
+            while in_flight or not exhausted:
+                while not exhausted and len(in_flight) < pool.capacity:
+                    entry = self.__get(self.__entry_queue)
+                    if entry is _DONE:
+                        exhausted = True
+                        break
+                    in_flight.append((entry, *pool.submit(entry.path)))
+                if not in_flight:
+                    break
+                (entry, slot, future) = in_flight.popleft()
+                # the workers run ahead, so only time spent waiting on them
+                # counts against the decode stage
+                start = perf_counter()
+                try:
+                    (file_hash, image_hash, *pixels) = pool.collect(slot, future)
+                except Exception as e:
+                    logger.warning("skipping %s: %s", entry.path, e)
+                    self.stats.failed += 1
+                    continue
+                self.stats.stages["decode"].add(1, perf_counter() - start)
+                if not self.__put(
+                    self.__image_queue,
+                    DecodedImage(entry, file_hash, image_hash, tuple(pixels), None),
+                ):
+                    return
+            self.__put(self.__image_queue, _DONE)
+        finally:
+            # the pool outlives this run, so hand every slot back to it
+            for _, slot, future in in_flight:
+                try:
+                    pool.collect(slot, future)
+                except Exception:
+                    pass
+
+    def __embed(self) -> None:
+        done = False
+        while not done:
+            chunk = []
+            while len(chunk) < self.settings.INDEX_CHUNK_SIZE:
+                item = self.__get(self.__image_queue)
+                if item is _DONE:
+                    done = True
+                    break
+                chunk.append(item)
+            if chunk and not self.__stop.is_set():
+                results = self.__caption_and_embed(chunk)
+                entries = [(item.entry, item.file_hash) for item in chunk]
+                captions = [results[file_hash].caption for _, file_hash in entries]
+                caption_embeddings = [
+                    results[file_hash].caption_embedding for _, file_hash in entries
+                ]
+                image_embeddings = [
+                    results[file_hash].image_embedding for _, file_hash in entries
+                ]
+                if not self.__put(
+                    self.__chunk_queue,
+                    (entries, captions, caption_embeddings, image_embeddings),
+                ):
+                    return
+        self.__put(self.__chunk_queue, _DONE)
+
+    def __caption_and_embed(
+        self, chunk: List[DecodedImage]
+    ) -> Dict[str, CachedEmbedding]:
+        results = {
+            item.file_hash: item.cached for item in chunk if item.cached is not None
+        }
+        if self.cache is not None:
+            results.update(
+                self.cache.get_many(
+                    self.ae.model_identity,
+                    [item.file_hash for item in chunk if item.file_hash not in results],
+                )
+            )
+        self.stats.cached += sum(1 for item in chunk if item.file_hash in results)
+        misses: Dict[str, DecodedImage] = {}
+        duplicates: Dict[str, str] = {}
+        for item in chunk:
+            if item.file_hash in results or item.file_hash in misses:
+                continue
+            if self.dedup is not None and item.image_hash is not None:
+                representative = self.dedup.find(item.image_hash)
+                if representative is None:
+                    self.dedup.add(item.image_hash, item.file_hash)
+                elif representative in misses:
+                    duplicates[item.file_hash] = representative
+                    continue
+                else:
+                    result = results.get(representative)
+                    if result is None:
+                        result = self.dedup.get_result(representative)
+                    # the result of the representative may have left the
+                    # window already; then the image is embedded on its own
+                    if result is not None:
+                        results[item.file_hash] = result
+                        duplicates[item.file_hash] = representative
+                        continue
+            misses[item.file_hash] = item
+        self.stats.deduplicated += sum(
+            1 for item in chunk if item.file_hash in duplicates
+        )
+        if misses:
+            results.update(self.__infer(list(misses.values())))
+        for file_hash, representative in duplicates.items():
+            if file_hash not in results:
+                results[file_hash] = results[representative]
+        return results
+
+    def __infer(self, items: List[DecodedImage]) -> Dict[str, CachedEmbedding]:
+        start = perf_counter()
+        captions = self.scheduler.call(
+            self.ae.caption_pixel_values,
+            np.stack([item.pixels[0] for item in items]),
+            priority=BULK,
+        )
+        caption_embeddings = self.scheduler.call(
+            self.ae.generate_text_embedding, captions, priority=BULK
+        )
+        self.stats.stages["caption"].add(len(items), perf_counter() - start)
+        start = perf_counter()
+        image_embeddings = self.scheduler.call(
+            self.ae.embed_pixel_values,
+            np.stack([item.pixels[1] for item in items]),
+            priority=BULK,
+        ).tolist()
+        self.stats.stages["embed"].add(len(items), perf_counter() - start)
+        computed = [
+            (item.file_hash, CachedEmbedding(*result))
+            for item, result in zip(
+                items, zip(captions, caption_embeddings, image_embeddings)
+            )
+        ]
+        if self.cache is not None:
+            self.cache.put_many(self.ae.model_identity, computed)
+        if self.dedup is not None:
+            for file_hash, result in computed:
+                self.dedup.set_result(file_hash, result)
+        return dict(computed)
+
+    def __upsert(self) -> None:
+        while True:
+            chunk = self.__get(self.__chunk_queue)
+            if chunk is _DONE:
+                break
+            (entries, captions, caption_embeddings, image_embeddings) = chunk
+            # upserting into a deleted index would create its collections again
+            if self.cancelled is not None and self.cancelled():
+                raise IndexingCancelledError()
+            start = perf_counter()
+            id_list = [vector_id(entry.path) for entry, _ in entries]
+            self.vs.upsert_to_collections(
+                id_list,
+                captions,
+                caption_embeddings,
+                image_embeddings,
+                [{"path": entry.path} for entry, _ in entries],
+                self.collection_name,
+            )
+            if self.db is not None:
+                crud.upsert_index_files(
+                    self.db,
+                    [
+                        schemas.IndexFileCreate(
+                            index_id=self.collection_name,
+                            file_path=entry.path,
+                            file_size=entry.size,
+                            file_mtime=entry.mtime,
+                            content_hash=file_hash,
+                            vector_id=file_vector_id,
+                        )
+                        for (entry, file_hash), file_vector_id in zip(entries, id_list)
+                    ],
+                )
+            self.stats.stages["upsert"].add(len(entries), perf_counter() - start)
+            self.stats.processed += len(entries)
+            if self.on_commit is not None:
+                self.on_commit(self.stats)
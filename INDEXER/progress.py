@@ -0,0 +1,67 @@
+from time import monotonic
+from typing import Optional
+
+STAGES = ("decode", "caption", "embed", "upsert")
+
+
+class StageMeter(object):
+    """Counts the images a pipeline stage handled and the time it was busy.
+
+    Time spent blocked on the neighbouring queues is not counted, so the
+    stage with the lowest rate is the bottleneck of the pipeline.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.busy = 0.0
+
+    def add(self, count: int, seconds: float) -> None:
+        self.count += count
+        self.busy += seconds
+
+    @property
+    def rate(self) -> Optional[float]:
+        return self.count / self.busy if self.busy > 0 else None
+
+
+class PipelineStats(object):
+    def __init__(self) -> None:
+        self.scanned = 0
+        self.processed = 0
+        self.failed = 0
+        self.cached = 0
+        self.deduplicated = 0
+        self.scan_done = False
+        self.started = monotonic()
+        self.stages = {stage: StageMeter() for stage in STAGES}
+
+    def snapshot(self) -> dict:
+        elapsed = monotonic() - self.started
+        finished = self.processed + self.failed
+        rate = finished / elapsed if elapsed > 0 else None
+        eta = None
+        if self.scan_done and rate:
+            eta = round((self.scanned - finished) / rate, 1)
+        return {
+            "scanned": self.scanned,
+            "processed": self.processed,
+            "failed": self.failed,
+            "cached": self.cached,
+            "deduplicated": self.deduplicated,
+            "scan_done": self.scan_done,
+            "elapsed": round(elapsed, 1),
+            "rate": _round(rate),
+            "eta": eta,
+            "stages": {
+                stage: {
+                    "count": meter.count,
+                    "busy": round(meter.busy, 2),
+                    "rate": _round(meter.rate),
+                }
+                for stage, meter in self.stages.items()
+            },
+        }
+
+
+def _round(rate: Optional[float]) -> Optional[float]:
+    return round(rate, 2) if rate is not None else None
@@ -0,0 +1,61 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from os import scandir
+from typing import Iterator, List, Optional, Set, Tuple
+from settings import Settings  # type: ignore
+from .catalog import FileEntry
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".ppm", ".gif", ".tiff", ".bmp")
+
+
+def is_image_path(file_path: str) -> bool:
+    return file_path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def scan_directory(directory: str) -> Tuple[List[FileEntry], List[str]]:
+    """Lists the images directly inside `directory` and its subdirectories.
+
+    Uses the file type and stat data cached on each `os.DirEntry`, so on
+    most platforms a directory costs a single `readdir` pass.
+    """
+    entries: List[FileEntry] = []
+    subdirectories: List[str] = []
+    try:
+        with scandir(directory) as dir_entries:
+            for dir_entry in dir_entries:
+                try:
+                    if dir_entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(dir_entry.path)
+                    elif is_image_path(dir_entry.name) and dir_entry.is_file():
+                        file_stat = dir_entry.stat()
+                        entries.append(
+                            FileEntry(
+                                dir_entry.path, file_stat.st_size, file_stat.st_mtime
+                            )
+                        )
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return (entries, subdirectories)
+
+
+def iter_image_entry(
+    directory: str, workers: Optional[int] = None
+) -> Iterator[FileEntry]:
+    workers = workers or Settings().SCAN_WORKERS
+    if workers <= 1:
+        pending_directories = [directory]
+        while pending_directories:
+            (entries, subdirectories) = scan_directory(pending_directories.pop())
+            yield from entries
+            pending_directories.extend(subdirectories)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: Set[Future] = {executor.submit(scan_directory, directory)}
+        while pending:
+            (done, pending) = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                (entries, subdirectories) = future.result()
+                for subdirectory in subdirectories:
+                    pending.add(executor.submit(scan_directory, subdirectory))
+                yield from entries
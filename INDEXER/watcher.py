@@ -0,0 +1,334 @@
+import ctypes
+import ctypes.util
+from logging import getLogger
+from os import close, fsdecode, path, read, walk
+from select import select
+from struct import calcsize, unpack_from
+from sys import platform
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from settings import Settings  # type: ignore
+from AI.engine import AIEngine  # type: ignore
+from DATABASE import crud  # type: ignore
+from DATABASE.database import SessionLocal  # type: ignore
+from error import IndexingCancelledError  # type: ignore
+from VECTORSTORE.vectorstore import VectorStore  # type: ignore
+from .incremental import discard_index, index_lock, sync_directory, sync_paths
+from .scanner import iter_image_entry
+
+logger = getLogger(__name__)
+
+# emit(path, is_dir); a path of None asks for a full rescan of the directory
+EmitCallback = Callable[[Optional[str], bool], None]
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (
+    IN_MODIFY
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+_EVENT_HEADER = "iIII"
+_EVENT_HEADER_SIZE = calcsize(_EVENT_HEADER)
+
+
+class InotifyBackend(object):
+    """Recursive inotify watch of a directory tree (Linux only)."""
+
+    def __init__(self, directory: str, emit: EmitCallback) -> None:
+        self.directory = directory
+        self.emit = emit
+        self.__libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.__fd = self.__libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.__watches: Dict[int, str] = {}
+        try:
+            self.__add_tree(directory)
+        except OSError:
+            close(self.__fd)
+            raise
+
+    def __add_watch(self, directory: str) -> None:
+        wd = self.__libc.inotify_add_watch(
+            self.__fd, directory.encode("utf-8", "surrogateescape"), _WATCH_MASK
+        )
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed: {directory}")
+        self.__watches[wd] = directory
+
+    def __add_tree(self, directory: str) -> None:
+        for root, _, _ in walk(directory):
+            self.__add_watch(root)
+
+    def run(self, stop: Event) -> None:
+        try:
+            while not stop.is_set():
+                (readable, _, _) = select([self.__fd], [], [], 0.5)
+                if readable:
+                    self.__handle(read(self.__fd, 64 * 1024))
+        finally:
+            close(self.__fd)
+
+    def __handle(self, buffer: bytes) -> None:
+        offset = 0
+        while offset + _EVENT_HEADER_SIZE <= len(buffer):
+            (wd, mask, _, name_len) = unpack_from(_EVENT_HEADER, buffer, offset)
+            name = buffer[
+                offset + _EVENT_HEADER_SIZE : offset + _EVENT_HEADER_SIZE + name_len
+            ].split(b"\0", 1)[0]
+            offset += _EVENT_HEADER_SIZE + name_len
+            if mask & IN_Q_OVERFLOW:
+                self.emit(None, True)
+                continue
+            if mask & IN_IGNORED:
+                self.__watches.pop(wd, None)
+                continue
+            parent = self.__watches.get(wd)
+            if parent is None or not name:
+                continue
+            event_path = path.join(parent, fsdecode(name))
+            is_dir = bool(mask & IN_ISDIR)
+            if is_dir and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self.__add_tree(event_path)
+                except OSError:
+                    self.emit(None, True)
+            self.emit(event_path, is_dir)
+
+
+class PollingBackend(object):
+    """Periodically diffs a stat snapshot of the directory tree."""
+
+    def __init__(self, directory: str, emit: EmitCallback, interval: float) -> None:
+        self.directory = directory
+        self.emit = emit
+        self.interval = interval
+        # taken here, so changes made once the watch is set up are not lost
+        self.__snapshot = self.__take_snapshot()
+
+    def __take_snapshot(self) -> Dict[str, Tuple[int, float]]:
+        return {
+            entry.path: (entry.size, entry.mtime)
+            for entry in iter_image_entry(self.directory)
+        }
+
+    def run(self, stop: Event) -> None:
+        while not stop.wait(self.interval):
+            snapshot = self.__take_snapshot()
+            for file_path in snapshot.keys() ^ self.__snapshot.keys():
+                self.emit(file_path, False)
+            for file_path in snapshot.keys() & self.__snapshot.keys():
+                if snapshot[file_path] != self.__snapshot[file_path]:
+                    self.emit(file_path, False)
+            self.__snapshot = snapshot
+
+
+class WatchedIndex(object):
+    def __init__(self, index_id: str, directory: str) -> None:
+        self.index_id = index_id
+        self.directory = directory
+        self.stop = Event()
+        self.lock = Lock()
+        # held while the pending events are synced to the index
+        self.flushing = Lock()
+        self.pending: Dict[str, Tuple[float, bool]] = {}
+        self.rescan = False
+
+    def emit(self, event_path: Optional[str], is_dir: bool) -> None:
+        with self.lock:
+            if event_path is None:
+                self.rescan = True
+                return
+            (_, was_dir) = self.pending.get(event_path, (0.0, False))
+            self.pending[event_path] = (monotonic(), is_dir or was_dir)
+
+    def pop_ready(self, debounce: float) -> Tuple[List[str], List[str], bool]:
+        """Returns paths that have been quiet for `debounce` seconds."""
+        with self.lock:
+            now = monotonic()
+            ready = [
+                (event_path, is_dir)
+                for event_path, (last_event, is_dir) in self.pending.items()
+                if now - last_event >= debounce
+            ]
+            for event_path, _ in ready:
+                del self.pending[event_path]
+            rescan = self.rescan and not self.pending
+            if rescan:
+                self.rescan = False
+            file_paths = [event_path for event_path, is_dir in ready if not is_dir]
+            dir_paths = [event_path for event_path, is_dir in ready if is_dir]
+            return (file_paths, dir_paths, rescan)
+
+
+class IndexWatcher(object):
+    """Keeps indexed directories live by applying filesystem events.
+
+    Events are debounced per path and then synced against the file catalog
+    of the index, so only created, modified, moved or deleted files are
+    embedded again or removed from the vector store.
+
+    A flush holds the lock of its index, so it never runs next to a job of
+    the same index; while one runs, the events stay pending. Indexes whose
+    row is gone, e.g. deleted through another server worker, are dropped.
+    """
+
+    def __init__(
+        self, ae: AIEngine, vs: VectorStore, settings: Optional[Settings] = None
+    ) -> None:
+        self.ae = ae
+        self.vs = vs
+        self.settings = settings or ae.settings
+        self.__indexes: Dict[str, WatchedIndex] = {}
+        self.__lock = Lock()
+        self.__stop = Event()
+        self.__flusher = Thread(target=self.__flush_loop, daemon=True)
+        self.__flusher.start()
+
+    def watch_all(self) -> None:
+        db = SessionLocal()
+        try:
+            for index in crud.get_indexed_indexes(db):
+                self.watch(index.index_id, index.index_path)
+        finally:
+            db.close()
+
+    def watch(self, index_id: str, directory: str) -> None:
+        with self.__lock:
+            if index_id in self.__indexes or not path.isdir(directory):
+                return
+            watched = WatchedIndex(index_id, directory)
+            backend = self.__create_backend(watched)
+            Thread(target=backend.run, args=(watched.stop,), daemon=True).start()
+            self.__indexes[index_id] = watched
+
+    def is_watching(self, index_id: str) -> bool:
+        with self.__lock:
+            return index_id in self.__indexes
+
+    def unwatch(self, index_id: str) -> None:
+        """Stops watching the index and waits for a flush under way.
+
+        The flush stops before its next commit, so once this returns, it
+        no longer writes to the index.
+        """
+        watched = self.__drop(index_id)
+        if watched is not None:
+            with watched.flushing:
+                pass
+
+    def __drop(self, index_id: str) -> Optional[WatchedIndex]:
+        with self.__lock:
+            watched = self.__indexes.pop(index_id, None)
+        if watched is not None:
+            watched.stop.set()
+        return watched
+
+    def stop(self) -> None:
+        self.__stop.set()
+        with self.__lock:
+            for watched in self.__indexes.values():
+                watched.stop.set()
+            self.__indexes.clear()
+
+    def __create_backend(self, watched: WatchedIndex):
+        backend = self.settings.WATCH_BACKEND
+        if backend in ("auto", "inotify") and platform.startswith("linux"):
+            try:
+                return InotifyBackend(watched.directory, watched.emit)
+            except OSError as e:
+                if backend == "inotify":
+                    raise e
+                logger.warning(
+                    "%s: inotify unavailable, polling (%s)", watched.directory, e
+                )
+        return PollingBackend(
+            watched.directory, watched.emit, self.settings.WATCH_POLL_INTERVAL
+        )
+
+    def __flush_loop(self) -> None:
+        while not self.__stop.wait(min(0.5, self.settings.WATCH_DEBOUNCE)):
+            with self.__lock:
+                indexes = list(self.__indexes.values())
+            for watched in indexes:
+                try:
+                    self.__flush(watched)
+                except Exception:
+                    logger.exception("failed to update index of %s", watched.directory)
+
+    def __flush(self, watched: WatchedIndex) -> None:
+        with watched.flushing:
+            if watched.stop.is_set():
+                return
+            lock = index_lock(watched.index_id)
+            # leave events pending while a job (re)indexes the directory
+            if not lock.acquire(blocking=False):
+                return
+            db = SessionLocal()
+            try:
+                self.__sync(db, watched)
+            finally:
+                db.close()
+                lock.release()
+
+    def __sync(self, db: Session, watched: WatchedIndex) -> None:
+        status = crud.get_index_status(db, watched.index_id)
+        if status is None:
+            self.__drop(watched.index_id)
+            return
+        if status != 0:
+            return
+        (file_paths, dir_paths, rescan) = watched.pop_ready(
+            self.settings.WATCH_DEBOUNCE
+        )
+
+        def cancelled() -> bool:
+            return (
+                watched.stop.is_set()
+                or crud.get_index_status(db, watched.index_id) is None
+            )
+
+        try:
+            if rescan:
+                sync_directory(
+                    db,
+                    self.vs,
+                    self.ae,
+                    watched.index_id,
+                    watched.directory,
+                    cancelled=cancelled,
+                )
+            elif file_paths or dir_paths:
+                sync_paths(
+                    db,
+                    self.vs,
+                    self.ae,
+                    watched.index_id,
+                    file_paths,
+                    dir_paths,
+                    cancelled,
+                )
+        except IndexingCancelledError:
+            pass
+        if crud.get_index_status(db, watched.index_id) is None:
+            # the index was deleted while the sync committed to it
+            self.__drop(watched.index_id)
+            discard_index(db, self.vs, watched.index_id)
@@ -3,6 +3,7 @@ from os import path, mkdir
 from typing import Dict, Sequence, Tuple, List
 from error import VectorstoreInitializationError  # type: ignore
 from chromadb import PersistentClient, Collection
+from chromadb.config import Settings as ChromaSettings
 
 
 class VectorStore(object):
@@ -16,7 +17,11 @@ class VectorStore(object):
             filesense_path = path.join(Path.home(), ".filesense")
             if not path.exists(filesense_path):
                 mkdir(filesense_path)
-            self.client = PersistentClient(path=path.join(filesense_path))
+            # no telemetry requests on startup; the app runs offline
+            self.client = PersistentClient(
+                path=path.join(filesense_path),
+                settings=ChromaSettings(anonymized_telemetry=False),
+            )
         except Exception as e:
             raise VectorstoreInitializationError(message=str(e))
 
@@ -61,6 +66,13 @@ class VectorStore(object):
             documents=caption_list,
         )
 
+    def delete_from_collections(self, id_list: List[str], collection_name: str):
+        (text_collection, image_collection) = self.__get_or_create_collection(
+            collection_name
+        )
+        text_collection.delete(ids=id_list)
+        image_collection.delete(ids=id_list)
+
     def get_img_path_list(
         self, collection: Collection, query_emb: List[float], limit: int
     ) -> List[str]:
@@ -0,0 +1,101 @@
+from io import BytesIO
+from typing import Any, Dict, Optional, Sequence, Tuple
+import numpy as np
+import orjson  # type: ignore
+from fastapi import HTTPException, status as HTTPStatus
+from fastapi.responses import Response
+
+JSON_MEDIA_TYPE = "application/json"
+NPY_MEDIA_TYPE = "application/x-npy"
+NPZ_MEDIA_TYPE = "application/x-npz"
+RAW_MEDIA_TYPE = "application/octet-stream"
+EMBEDDING_DTYPES = {"float32": np.dtype("<f4"), "float16": np.dtype("<f2")}
+# the formats of an endpoint that returns one embedding matrix
+ARRAY_MEDIA_TYPES = (NPY_MEDIA_TYPE, RAW_MEDIA_TYPE)
+
+
+def negotiate(accept: Optional[str], offered: Sequence[str]) -> Tuple[str, np.dtype]:
+    """Picks the response format of an embedding endpoint from Accept.
+
+    Binary formats are only sent when asked for; anything else, including
+    no Accept header, gets JSON. A `dtype=float16` parameter on a binary
+    media type halves its size, e.g. `application/x-npy; dtype=float16`.
+    """
+    choices = []
+    for (position, part) in enumerate((accept or "").split(",")):
+        (media_type, *params) = [param.strip() for param in part.split(";")]
+        options = {}
+        for param in params:
+            (name, _, value) = param.partition("=")
+            options[name.strip().lower()] = value.strip().strip('"').lower()
+        try:
+            quality = float(options.get("q", 1))
+        except ValueError:
+            continue
+        if quality > 0:
+            choices.append((-quality, position, media_type.lower(), options))
+    for (_, _, media_type, options) in sorted(choices):
+        if media_type in offered:
+            dtype = options.get("dtype", "float32")
+            if dtype not in EMBEDDING_DTYPES:
+                raise HTTPException(
+                    status_code=HTTPStatus.HTTP_406_NOT_ACCEPTABLE,
+                    detail={"error": f"Unsupported embedding dtype {dtype}"},
+                )
+            return (media_type, EMBEDDING_DTYPES[dtype])
+        if media_type in (JSON_MEDIA_TYPE, "application/*", "*/*"):
+            break
+    return (JSON_MEDIA_TYPE, EMBEDDING_DTYPES["float32"])
+
+
+def json_response(content: Dict[str, Any]) -> Response:
+    """Serializes the content without validating it against a model.
+
+    Numpy arrays are written by orjson directly, without going through
+    a list of Python floats.
+    """
+    return Response(
+        orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY),
+        media_type=JSON_MEDIA_TYPE,
+    )
+
+
+def array_response(array: Any, media_type: str, dtype: np.dtype) -> Response:
+    """Sends an embedding matrix as .npy or as raw little-endian values.
+
+    Raw values carry their shape and dtype in the X-Embedding-Shape and
+    X-Embedding-Dtype headers.
+    """
+    array = np.ascontiguousarray(array, dtype=dtype)
+    if media_type == NPY_MEDIA_TYPE:
+        buffer = BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        body = buffer.getvalue()
+    else:
+        body = array.tobytes()
+    return Response(
+        body,
+        media_type=media_type,
+        headers={
+            "X-Embedding-Shape": ",".join(str(size) for size in array.shape),
+            "X-Embedding-Dtype": array.dtype.name,
+        },
+    )
+
+
+def arrays_response(arrays: Dict[str, np.ndarray]) -> Response:
+    """Sends several arrays as one .npz archive, keyed by their names."""
+    buffer = BytesIO()
+    np.savez(buffer, **arrays)
+    return Response(buffer.getvalue(), media_type=NPZ_MEDIA_TYPE)
+
+
+def embeddings_response(embeddings: Any, media_type: str, dtype: np.dtype) -> Response:
+    if media_type == JSON_MEDIA_TYPE:
+        return json_response({"embeddings": embeddings, "error": None})
+    return array_response(embeddings, media_type, dtype)
+
+
+def binary_responses(*media_types: str) -> Dict[int, Dict[str, Any]]:
+    """Documents the binary formats of an endpoint in its OpenAPI schema."""
+    return {200: {"content": {media_type: {} for media_type in media_types}}}
@@ -1,7 +1,8 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
+from uuid import UUID
 from pydantic import BaseModel
 
-from DATABASE.schemas import Index  # type: ignore
+from DATABASE.schemas import Index, IndexJob  # type: ignore
 
 IndexStatusDict = {
     -1: "FAILED",
@@ -9,6 +10,14 @@ IndexStatusDict = {
     1: "INDEXING",
 }
 
+JobStatusDict = {
+    -2: "CANCELLED",
+    -1: "FAILED",
+    0: "COMPLETED",
+    1: "RUNNING",
+    2: "QUEUED",
+}
+
 
 class BaseResponse(BaseModel):
     error: Optional[str]
@@ -53,38 +62,17 @@ class GetCaptionWithEmbeddingsResponse(BaseResponse):
     image_embeddings: Optional[List[List[float]]]
 
 
-class CreateIndexingTaskRequest(BaseModel):
-    folder_path: str
-
-
-class GetIndexingTaskRequest(BaseModel):
-    task_id: str
-
-
-class TaskData(BaseResponse):
-    status: str
-    caption_embeddings: Optional[List[List[float]]]
-    image_embeddings: Optional[List[List[float]]]
-    file_paths: Optional[List[str]]
-    folder_path: str
-
-
-class GetIndexingTaskResponse(BaseResponse):
-    task_id: str
-    status: str
-    data: Optional[TaskData]
-
-
 class IndexDirRequest(BaseModel):
     dir_path: str
 
 
-class CreateIndexingTaskResponse(BaseResponse):
-    task_id: Optional[str]
+class ReindexDirRequest(BaseModel):
+    index_id: str
 
 
 class IndexDirResponse(BaseResponse):
     index_id: Optional[str]
+    job_id: Optional[str] = None
 
 
 class GetAllIndexResponse(BaseResponse):
@@ -96,6 +84,36 @@ class GetIndexStatusResponse(BaseResponse):
     status_name: Optional[str]
 
 
+class GetJobResponse(BaseResponse):
+    data: Optional[IndexJob]
+    status_name: Optional[str]
+
+
+class GetIndexJobsResponse(BaseResponse):
+    data: Optional[List[IndexJob]]
+
+
+class QueryCacheStats(BaseModel):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    hit_rate: Optional[float]
+
+
+class GetQueryCacheStatsResponse(BaseResponse):
+    data: Optional[QueryCacheStats]
+
+
+class IndexedCollection(BaseModel):
+    # the fields of chromadb's Collection, without importing chromadb
+    name: str
+    id: UUID
+    metadata: Optional[Dict[str, Any]] = None
+    tenant: Optional[str] = None
+    database: Optional[str] = None
+
+
 class SearchByTextRequest(BaseSearchRequest):
     search_string: str
 
@@ -0,0 +1,146 @@
+"""Measures how long the server takes to start and to answer its first requests.
+
+    python benchmarks/bench_cold_start.py [--runs 5] [--index-id <index_id>]
+        [--query "a dog on the beach"]
+
+Every run starts a fresh Python process and reports, from its spawn:
+
+- import: importing `main` (measured in a process of its own)
+- ping: the first successful GET /api/ping
+- embedding: the first text embedding, the model work of a search
+- search: the first search of --index-id, when one is given
+
+The first run also pays for reading the models from disk into the page
+cache; the median over the runs is what a relaunch of the app sees.
+Autotuning is disabled so that a first start on this host does not skew
+the numbers.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+from os import path
+from statistics import median
+from time import perf_counter, sleep
+from typing import Dict, List, Optional
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+ROOT_DIR = path.dirname(path.dirname(path.realpath(__file__)))
+TIMEOUT = 600.0
+
+# "dev" keeps ensure_exit from stopping a server without the desktop app
+IMPORT_SCRIPT = """
+import sys
+from time import perf_counter
+sys.argv.append("dev")
+started = perf_counter()
+import main
+print(perf_counter() - started)
+"""
+SERVE_SCRIPT = """
+import sys
+import uvicorn
+sys.argv.append("dev")
+uvicorn.run("main:app", host="127.0.0.1", port=int(sys.argv[1]), log_level="error")
+"""
+
+
+def environment() -> Dict[str, str]:
+    return {**os.environ, "AUTOTUNE": "false"}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import() -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        cwd=ROOT_DIR,
+        env=environment(),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def wait_for(request: Request, started: float) -> float:
+    """Retries until the server is up; returns the seconds since `started`."""
+    while perf_counter() - started < TIMEOUT:
+        try:
+            with urlopen(request, timeout=TIMEOUT) as response:
+                response.read()
+            return perf_counter() - started
+        except HTTPError:
+            raise
+        except (ConnectionError, URLError):
+            # the server is not listening yet
+            sleep(0.01)
+    raise TimeoutError(request.full_url)
+
+
+def measure_server(index_id: Optional[str], query: str) -> Dict[str, float]:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}/api"
+    started = perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-c", SERVE_SCRIPT, str(port)],
+        cwd=ROOT_DIR,
+        env=environment(),
+    )
+    try:
+        result = {"ping": wait_for(Request(f"{base_url}/ping"), started)}
+        result["embedding"] = wait_for(
+            Request(
+                f"{base_url}/aiengine/get_text_embeddings",
+                data=json.dumps({"text": [query]}).encode(),
+                headers={"Content-Type": "application/json"},
+            ),
+            started,
+        )
+        if index_id is not None:
+            params = urlencode({"index_name": index_id, "search_string": query})
+            result["search"] = wait_for(
+                Request(f"{base_url}/common/search_by_text?{params}"), started
+            )
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--index-id")
+    parser.add_argument("--query", default="a dog on the beach")
+    args = parser.parse_args()
+
+    runs: Dict[str, List[float]] = {}
+    for run in range(args.runs):
+        result = {"import": measure_import()}
+        result.update(measure_server(args.index_id, args.query))
+        for (name, seconds) in result.items():
+            runs.setdefault(name, []).append(seconds)
+        print(
+            f"run {run + 1}: "
+            + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in result.items())
+        )
+
+    print(f"{'stage':<12}{'first':>10}{'median':>10}{'min':>10}")
+    for (name, seconds) in runs.items():
+        print(
+            f"{name:<12}{seconds[0]:>9.2f}s{median(seconds):>9.2f}s"
+            f"{min(seconds):>9.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
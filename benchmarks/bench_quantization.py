@@ -0,0 +1,161 @@
+"""Compares fp32 and dynamic int8 inference of the AI engine on CPU.
+
+    python benchmarks/bench_quantization.py <image_dir> [--limit 200] [--top-k 10]
+        [--backend torch|onnx]
+
+Captions, image embeddings and caption embeddings are computed for a
+sample of the images in <image_dir> at both precisions. The script reports
+the throughput of each stage, the size of the model weights and how much
+of the top-k retrieval results int8 keeps:
+
+- image search: the nearest images of each image by image embedding
+- text search: the nearest captions of each fp32 caption used as a query
+"""
+import argparse
+import io
+import os
+import sys
+from os import path
+from time import perf_counter
+from typing import Dict, List
+
+import numpy as np
+import torch
+
+ROOT_DIR = path.dirname(path.dirname(path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from AI.engine import AIEngine  # type: ignore  # noqa: E402
+from DATABASE.database import filesense_path  # type: ignore  # noqa: E402
+from INDEXER.scanner import iter_image_entry  # type: ignore  # noqa: E402
+
+
+def load_engine(backend: str, precision: str) -> AIEngine:
+    os.environ["INFERENCE_BACKEND"] = backend
+    os.environ["INFERENCE_PRECISION"] = precision
+    # AIEngine is a singleton; the benchmark needs one engine per precision
+    engine = object.__new__(AIEngine)
+    engine.__init__()
+    return engine
+
+
+def weights_size(engine: AIEngine) -> int:
+    if engine.onnx:
+        export_dir = path.join(filesense_path, "onnx", engine.model_identity)
+        return sum(
+            path.getsize(path.join(export_dir, name))
+            for name in os.listdir(export_dir)
+        )
+    size = 0
+    with engine.caption_slot.acquire() as (caption_model, _):
+        size += _state_dict_size(caption_model)
+    with engine.image_slot.acquire() as image_model:
+        size += _state_dict_size(image_model)
+    with engine.text_slot.acquire() as (text_model, _):
+        size += _state_dict_size(text_model)
+    return size
+
+
+def _state_dict_size(model: torch.nn.Module) -> int:
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def run(engine: AIEngine, images: List[str]) -> Dict:
+    # loads every model (and exports it for ONNX) outside of the timings
+    engine.generate_captions(images[:1])
+    engine.generate_image_embeddings(images[:1])
+    engine.generate_text_embedding(["warm up"])
+    result: Dict = {"size": weights_size(engine), "seconds": {}}
+    started = perf_counter()
+    result["captions"] = engine.generate_captions(images)
+    result["seconds"]["caption"] = perf_counter() - started
+    started = perf_counter()
+    result["image_embeddings"] = engine.generate_image_embeddings(images)
+    result["seconds"]["image embedding"] = perf_counter() - started
+    started = perf_counter()
+    result["caption_embeddings"] = np.array(
+        engine.generate_text_embedding(result["captions"]), dtype=np.float32
+    )
+    result["seconds"]["text embedding"] = perf_counter() - started
+    return result
+
+
+def top_k(queries: np.ndarray, corpus: np.ndarray, k: int, skip_self: bool):
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    corpus = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    similarity = queries @ corpus.T
+    if skip_self:
+        np.fill_diagonal(similarity, -np.inf)
+    return np.argsort(-similarity, axis=1)[:, :k]
+
+
+def overlap(expected: np.ndarray, actual: np.ndarray) -> float:
+    return float(
+        np.mean(
+            [
+                len(set(e) & set(a)) / len(e)
+                for e, a in zip(expected.tolist(), actual.tolist())
+            ]
+        )
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("image_dir")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--backend", choices=("torch", "onnx"), default="torch")
+    args = parser.parse_args()
+
+    images = sorted(entry.path for entry in iter_image_entry(args.image_dir))
+    images = images[: args.limit]
+    if len(images) <= args.top_k:
+        parser.error(f"need more than {args.top_k} images, found {len(images)}")
+    k = args.top_k
+
+    fp32 = run(load_engine(args.backend, "fp32"), images)
+    int8_engine = load_engine(args.backend, "int8")
+    int8 = run(int8_engine, images)
+
+    print(
+        f"{len(images)} images, {args.backend} backend, "
+        f"{torch.get_num_threads()} threads"
+    )
+    print(f"{'stage':<16}{'fp32 /s':>10}{'int8 /s':>10}{'speedup':>10}")
+    for stage, seconds in fp32["seconds"].items():
+        fp32_rate = len(images) / seconds
+        int8_rate = len(images) / int8["seconds"][stage]
+        print(
+            f"{stage:<16}{fp32_rate:>10.1f}{int8_rate:>10.1f}"
+            f"{int8_rate / fp32_rate:>9.2f}x"
+        )
+    print(
+        f"{'weights':<16}{fp32['size'] / 2**20:>8.1f}MB"
+        f"{int8['size'] / 2**20:>8.1f}MB{int8['size'] / fp32['size']:>9.2f}x"
+    )
+
+    image_overlap = overlap(
+        top_k(fp32["image_embeddings"], fp32["image_embeddings"], k, True),
+        top_k(int8["image_embeddings"], int8["image_embeddings"], k, True),
+    )
+    # the fp32 captions stand in for the text queries of a search
+    queries = np.array(
+        int8_engine.generate_text_embedding(fp32["captions"]), dtype=np.float32
+    )
+    text_overlap = overlap(
+        top_k(fp32["caption_embeddings"], fp32["caption_embeddings"], k, False),
+        top_k(queries, int8["caption_embeddings"], k, False),
+    )
+    same_captions = np.mean(
+        [a == b for a, b in zip(fp32["captions"], int8["captions"])]
+    )
+    print(f"image search top-{k} overlap  {image_overlap:.3f}")
+    print(f"text search top-{k} overlap   {text_overlap:.3f}")
+    print(f"identical captions          {same_captions:.3f}")
+
+
+if __name__ == "__main__":
+    main()
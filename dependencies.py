@@ -1,7 +1,9 @@
+from fastapi import HTTPException, Request, status as HTTPStatus
 from DATABASE import models  # type: ignore
-from DATABASE.database import SessionLocal, engine  # type: ignore
+from DATABASE.database import SessionLocal, add_missing_columns, engine  # type: ignore
 
 models.Base.metadata.create_all(bind=engine)
+add_missing_columns(models.Base.metadata)
 
 
 def get_db():
@@ -10,3 +12,13 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def wait_for_startup(r: Request):
+    """Holds requests until the models and stores have been loaded."""
+    r.app.state.ready.wait()
+    if r.app.state.startup_error is not None:
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"error": r.app.state.startup_error},
+        )
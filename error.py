@@ -26,3 +26,22 @@ class VectorstoreInitializationError(Exception):
     def __init__(self, message="VECTORSTORE INITIALIZATION ERROR") -> None:
         self.message = message
         super().__init__(self.message)
+
+
+class ImageTooLargeError(Exception):
+    def __init__(self, message="IMAGE EXCEEDS THE DECODE PIXEL BUDGET") -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+class InferenceQueueFullError(Exception):
+    def __init__(self, message="INFERENCE QUEUE IS FULL", retry_after=1) -> None:
+        self.message = message
+        self.retry_after = retry_after
+        super().__init__(self.message)
+
+
+class IndexingCancelledError(Exception):
+    def __init__(self, message="INDEXING WAS CANCELLED") -> None:
+        self.message = message
+        super().__init__(self.message)
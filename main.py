@@ -2,23 +2,22 @@ import uvicorn
 from re import sub
 from os import path
 from sys import argv
-from typing import Dict
+from logging import INFO, basicConfig, getLogger
+from multiprocessing import freeze_support
 from fastapi import FastAPI
 from settings import Settings  # type: ignore
 from os import name as os_name
-from AI.engine import AIEngine  # type: ignore
+from threading import Event, Thread
+from AI.scheduler import get_scheduler, shutdown_scheduler  # type: ignore
 from contextlib import asynccontextmanager
 from fastapi.staticfiles import StaticFiles
 from fastapi.openapi.utils import get_openapi
-from VECTORSTORE.vectorstore import VectorStore  # type: ignore
+from INDEXER.leader import LeaderLock  # type: ignore
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
 from routers import aiengine, database, vectorstore, common  # type: ignore
 from fastapi.responses import RedirectResponse, JSONResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
-from api_schema import (  # type: ignore
-    TaskData,
-)
 
 global reload_state
 if "dev" not in argv:
@@ -29,14 +28,76 @@ else:
     reload_state = True
 
 settings = Settings()
+# the engine and the indexer report through module loggers
+basicConfig(level=INFO)
+logger = getLogger(__name__)
+
+
+def start_services(app: FastAPI) -> None:
+    """Loads the engine, the vector store and the indexer in the background.
+
+    torch, transformers and chromadb are imported here rather than with
+    this module, so the server answers /api/ping while they load; the
+    routers that need them wait for `app.state.ready`.
+    """
+    try:
+        from AI.engine import AIEngine  # type: ignore
+        from AI.autotune import apply_persisted_autotune  # type: ignore
+        from AI.batcher import SearchQueryBatcher  # type: ignore
+        from VECTORSTORE.vectorstore import VectorStore  # type: ignore
+        from INDEXER.jobs import JobRunner  # type: ignore
+        from INDEXER.watcher import IndexWatcher  # type: ignore
+
+        app.state.ai_engine = AIEngine()
+        apply_persisted_autotune(app.state.ai_engine)
+        app.state.vectorstore = VectorStore()
+        app.state.query_batcher = SearchQueryBatcher(
+            app.state.ai_engine, scheduler=app.state.scheduler
+        )
+        if settings.WATCH_ENABLED:
+            app.state.watcher = IndexWatcher(
+                app.state.ai_engine, app.state.vectorstore
+            )
+        # with several workers, one of them runs the jobs and the watchers
+        app.state.job_runner = JobRunner(
+            app.state.ai_engine,
+            app.state.vectorstore,
+            watcher=app.state.watcher,
+            leader=LeaderLock(),
+        )
+        app.state.job_runner.start(
+            on_elected=app.state.watcher.watch_all if app.state.watcher else None
+        )
+    except Exception as e:
+        logger.exception("failed to start the services")
+        app.state.startup_error = str(e)
+    app.state.ready.set()
+    if app.state.startup_error is None:
+        # searches are the first requests of the app and need the text model
+        try:
+            app.state.ai_engine.generate_text_embedding(["warm up"])
+        except Exception:
+            # the first search loads the model instead
+            logger.exception("failed to warm up the text model")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    app.state.ai_engine = AIEngine()
-    app.state.vectorstore = VectorStore()
+    app.state.ready = Event()
+    app.state.startup_error = None
+    app.state.scheduler = get_scheduler(settings)
+    app.state.watcher = None
+    app.state.job_runner = None
+    app.state.ai_engine = None
+    Thread(target=start_services, args=(app,), daemon=True).start()
     yield
-    app.state.ai_engine.release_models()
+    if app.state.job_runner is not None:
+        app.state.job_runner.shutdown()
+    if app.state.watcher is not None:
+        app.state.watcher.stop()
+    shutdown_scheduler()
+    if app.state.ai_engine is not None:
+        app.state.ai_engine.release_models()
 
 
 app = FastAPI(
@@ -59,8 +120,6 @@ app.include_router(database.router, prefix="/api/database")
 app.include_router(vectorstore.router, prefix="/api/vectorstore")
 app.include_router(common.router, prefix="/api/common")
 
-task_state: Dict[str, TaskData] = {}
-
 
 def custom_openapi():
     if app.openapi_schema:
@@ -81,7 +140,11 @@ app.openapi = custom_openapi  # type: ignore
 
 @app.exception_handler(StarletteHTTPException)
 async def http_exception_handler(request, exc):
-    return JSONResponse(status_code=exc.status_code, content=exc.detail)
+    return JSONResponse(
+        status_code=exc.status_code,
+        content=exc.detail,
+        headers=getattr(exc, "headers", None),
+    )
 
 
 @app.get("/api/ping", tags=["DEFAULT"])
@@ -104,4 +167,20 @@ async def swagger_ui_html():
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="127.0.0.1", port=270, reload=reload_state)
+    freeze_support()
+    workers = 1 if reload_state else max(1, settings.WEB_WORKERS)
+    tune = "--autotune" in argv or settings.AUTOTUNE
+    if tune or workers > 1:
+        from AI.engine import AIEngine  # type: ignore
+        from AI.autotune import tune_engine  # type: ignore
+
+        if tune:
+            # benchmark once, before the workers start and compete for the
+            # cores; they only apply the persisted result
+            tune_engine(AIEngine(), force="--autotune" in argv)
+        if workers > 1:
+            # convert the weights once, before the workers race to do it
+            AIEngine().convert_weights()
+    uvicorn.run(
+        "main:app", host="127.0.0.1", port=270, reload=reload_state, workers=workers
+    )
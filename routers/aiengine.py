@@ -1,3 +1,4 @@
+import numpy as np
 from api_schema import (  # type: ignore
     GetCaptionWithEmbeddingsRequest,
     GetCaptionWithEmbeddingsResponse,
@@ -5,19 +6,47 @@ from api_schema import (  # type: ignore
     GetImageCaptionResponse,
     GetImageEmbeddingsRequest,
     GetImageEmbeddingsResponse,
+    GetQueryCacheStatsResponse,
     GetTextEmbeddingsRequest,
     GetTextEmbeddingsResponse,
+    QueryCacheStats,
 )
-from fastapi import APIRouter, Request, HTTPException, status as HTTPStatus
+from fastapi import APIRouter, Depends, Request, HTTPException, status as HTTPStatus
+from dependencies import wait_for_startup  # type: ignore
+from api_responses import (  # type: ignore
+    ARRAY_MEDIA_TYPES,
+    NPZ_MEDIA_TYPE,
+    arrays_response,
+    binary_responses,
+    embeddings_response,
+    json_response,
+    negotiate,
+)
+from error import InferenceQueueFullError  # type: ignore
 
-router = APIRouter(tags=["AI ENGINE"])
+router = APIRouter(dependencies=[Depends(wait_for_startup)], tags=["AI ENGINE"])
 
 
-@router.post("/get_text_embeddings", response_model=GetTextEmbeddingsResponse)
+@router.post(
+    "/get_text_embeddings",
+    response_model=GetTextEmbeddingsResponse,
+    responses=binary_responses(*ARRAY_MEDIA_TYPES),
+)
 async def get_text_embeddings(r: Request, request: GetTextEmbeddingsRequest):
+    (media_type, dtype) = negotiate(r.headers.get("accept"), ARRAY_MEDIA_TYPES)
     try:
-        embeddings = r.app.state.ai_engine.generate_text_embedding(request.text)
-        return GetTextEmbeddingsResponse(embeddings=embeddings, error=None)
+        embeddings = await r.app.state.scheduler.run(
+            r.app.state.ai_engine.generate_text_embedding, request.text
+        )
+        return embeddings_response(embeddings, media_type, dtype)
+    except InferenceQueueFullError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_429_TOO_MANY_REQUESTS,
+            detail=GetTextEmbeddingsResponse(
+                embeddings=None, error=str(e)
+            ).model_dump(),
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         raise HTTPException(
             status_code=HTTPStatus.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -30,14 +59,23 @@ async def get_text_embeddings(r: Request, request: GetTextEmbeddingsRequest):
 @router.post(
     "/get_image_embeddings",
     response_model=GetImageEmbeddingsResponse,
+    responses=binary_responses(*ARRAY_MEDIA_TYPES),
 )
 async def get_image_embeddings(r: Request, request: GetImageEmbeddingsRequest):
+    (media_type, dtype) = negotiate(r.headers.get("accept"), ARRAY_MEDIA_TYPES)
     try:
-        img_emb_list = [
-            r.app.state.ai_engine.generate_image_embedding(image_path=img_path)
-            for img_path in request.image_paths
-        ]
-        return GetImageEmbeddingsResponse(embeddings=img_emb_list, error=None)
+        img_emb_array = await r.app.state.scheduler.run(
+            r.app.state.ai_engine.generate_image_embeddings, request.image_paths
+        )
+        return embeddings_response(img_emb_array, media_type, dtype)
+    except InferenceQueueFullError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_429_TOO_MANY_REQUESTS,
+            detail=GetImageEmbeddingsResponse(
+                embeddings=None, error=str(e)
+            ).model_dump(),
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         raise HTTPException(
             status_code=HTTPStatus.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -50,11 +88,16 @@ async def get_image_embeddings(r: Request, request: GetImageEmbeddingsRequest):
 @router.post("/get_image_caption", response_model=GetImageCaptionResponse)
 async def get_image_caption(r: Request, request: GetImageCaptionRequest):
     try:
-        img_cap_list = [
-            r.app.state.ai_engine.generate_caption(image_path=img_path)
-            for img_path in request.image_path
-        ]
+        img_cap_list = await r.app.state.scheduler.run(
+            r.app.state.ai_engine.generate_captions, request.image_path
+        )
         return GetImageCaptionResponse(caption=img_cap_list, error=None)
+    except InferenceQueueFullError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_429_TOO_MANY_REQUESTS,
+            detail=GetImageCaptionResponse(caption=None, error=str(e)).model_dump(),
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         raise HTTPException(
             status_code=HTTPStatus.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -65,11 +108,16 @@ async def get_image_caption(r: Request, request: GetImageCaptionRequest):
 @router.post("/get_experimental_image_caption", response_model=GetImageCaptionResponse)
 async def get_experimental_image_caption(r: Request, request: GetImageCaptionRequest):
     try:
-        img_cap_list = [
-            r.app.state.ai_engine.generate_experimental_caption(image_path=img_path)
-            for img_path in request.image_path
-        ]
+        img_cap_list = await r.app.state.scheduler.run(
+            r.app.state.ai_engine.generate_experimental_captions, request.image_path
+        )
         return GetImageCaptionResponse(caption=img_cap_list, error=None)
+    except InferenceQueueFullError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_429_TOO_MANY_REQUESTS,
+            detail=GetImageCaptionResponse(caption=None, error=str(e)).model_dump(),
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         raise HTTPException(
             status_code=HTTPStatus.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -80,25 +128,44 @@ async def get_experimental_image_caption(r: Request, request: GetImageCaptionReq
 @router.post(
     "/get_caption_with_embeddings",
     response_model=GetCaptionWithEmbeddingsResponse,
+    responses=binary_responses(NPZ_MEDIA_TYPE),
 )
 async def get_caption_with_embeddings(
     r: Request, request: GetCaptionWithEmbeddingsRequest
 ):
+    (media_type, dtype) = negotiate(r.headers.get("accept"), (NPZ_MEDIA_TYPE,))
     try:
-        img_cap_list = [
-            r.app.state.ai_engine.generate_caption(image_path=img_path)
-            for img_path in request.image_paths
-        ]
-        cap_text_emb_list = r.app.state.ai_engine.generate_text_embedding(img_cap_list)
-        img_emb_list = [
-            r.app.state.ai_engine.generate_image_embedding(image_path=img_path)
-            for img_path in request.image_paths
-        ]
-        return GetCaptionWithEmbeddingsResponse(
-            caption=img_cap_list,
-            text_embeddings=cap_text_emb_list,
-            image_embeddings=img_emb_list,
-            error=None,
+        (
+            img_cap_list,
+            cap_text_emb_list,
+            img_emb_array,
+        ) = await r.app.state.scheduler.run(
+            r.app.state.ai_engine.generate_captions_with_embeddings,
+            request.image_paths,
+        )
+        if media_type == NPZ_MEDIA_TYPE:
+            return arrays_response(
+                {
+                    "caption": np.array(img_cap_list, dtype=str),
+                    "text_embeddings": np.asarray(cap_text_emb_list, dtype=dtype),
+                    "image_embeddings": img_emb_array.astype(dtype),
+                }
+            )
+        return json_response(
+            {
+                "caption": img_cap_list,
+                "text_embeddings": cap_text_emb_list,
+                "image_embeddings": img_emb_array,
+                "error": None,
+            }
+        )
+    except InferenceQueueFullError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_429_TOO_MANY_REQUESTS,
+            detail=GetCaptionWithEmbeddingsResponse(
+                caption=None, text_embeddings=None, image_embeddings=None, error=str(e)
+            ).model_dump(),
+            headers={"Retry-After": str(e.retry_after)},
         )
     except Exception as e:
         raise HTTPException(
@@ -107,3 +174,15 @@ async def get_caption_with_embeddings(
                 caption=None, text_embeddings=None, image_embeddings=None, error=str(e)
             ).model_dump(),
         )
+
+
+@router.get("/query_cache_stats", response_model=GetQueryCacheStatsResponse)
+async def query_cache_stats(r: Request):
+    try:
+        stats = r.app.state.query_batcher.text_cache.stats()
+        return GetQueryCacheStatsResponse(data=QueryCacheStats(**stats), error=None)
+    except Exception as e:
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=GetQueryCacheStatsResponse(data=None, error=str(e)).model_dump(),
+        )
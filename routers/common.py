@@ -1,17 +1,23 @@
 from io import BytesIO
-from os import path, walk
+from json import dumps, loads
+from os import path
+from time import sleep
+from typing import Iterator
+from uuid import uuid4
 from fastapi import (
     APIRouter,
     Depends,
     Request,
-    BackgroundTasks,
     File,
     UploadFile,
     HTTPException,
     status as HTTPStatus,
 )
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from dependencies import get_db  # type: ignore
+from dependencies import get_db, wait_for_startup  # type: ignore
+from settings import Settings  # type: ignore
+from DATABASE.database import SessionLocal  # type: ignore
 from DATABASE import crud, schemas  # type: ignore
 from api_schema import (  # type: ignore
     BaseSearchResultResponse,
@@ -19,60 +25,42 @@ from api_schema import (  # type: ignore
     DeleteIndexResponse,
     IndexDirRequest,
     IndexDirResponse,
+    IndexStatusDict,
+    ReindexDirRequest,
     SearchByImageRequest,
     SearchByTextRequest,
     SearchResultDataResponse,
 )
-from checksumdir import dirhash
+from error import InferenceQueueFullError  # type: ignore
 
-from AI.engine import AIEngine  # type: ignore
-from VECTORSTORE.vectorstore import VectorStore  # type: ignore
-
-router = APIRouter(dependencies=[Depends(get_db)], tags=["COMMON"])
+router = APIRouter(
+    dependencies=[Depends(get_db), Depends(wait_for_startup)], tags=["COMMON"]
+)
+settings = Settings()
 
 
-def list_image_path(directory: str):
-    image_extensions = [".png", ".jpg", ".jpeg", ".ppm", ".gif", ".tiff", ".bmp"]
-    image_paths = []
+def progress_events(index_id: str) -> Iterator[str]:
+    db = SessionLocal()
     try:
-        for root, _, files in walk(directory):
-            for file in files:
-                if any(file.endswith(ext) for ext in image_extensions):
-                    image_paths.append(path.join(root, file))
-    except Exception as e:
-        raise e
-    return image_paths
-
-
-def create_index(
-    directory: str,
-    db: Session,
-    vs: VectorStore,
-    ae: AIEngine,
-    collection_name: str,
-):
-    try:
-        img_path_list = list_image_path(directory)
-        id_list = [str(hash(img_path)) for img_path in img_path_list]
-        caption_list = [ae.generate_caption(img_path) for img_path in img_path_list]
-        caption_emb_list = ae.generate_text_embedding(caption_list)
-        images_emb_list = [
-            ae.generate_image_embedding(img_path) for img_path in img_path_list
-        ]
-        metadata_list = [{"path": img_path} for img_path in img_path_list]
-        vs.upsert_to_collections(
-            id_list,
-            caption_list,
-            caption_emb_list,
-            images_emb_list,
-            metadata_list,
-            collection_name,
-        )
-        crud.update_index_state(db, collection_name, 0)
-    except Exception as e:
-        print(e)
-        crud.update_index_status(db, collection_name, -1)
-        raise e
+        while True:
+            db.expire_all()
+            status = crud.get_index_status(db, index_id)
+            if status is None:
+                yield f"event: error\ndata: {dumps({'error': 'Index deleted'})}\n\n"
+                return
+            data = {"status": status, "status_name": IndexStatusDict[status]}
+            # jobs checkpoint their stats to the database, so this works on
+            # every server worker, not only on the one running the job
+            job = crud.get_latest_index_job(db, index_id)
+            if job is not None and job.progress is not None:
+                data.update(loads(job.progress))
+            if status != 1:
+                yield f"event: done\ndata: {dumps(data)}\n\n"
+                return
+            yield f"event: progress\ndata: {dumps(data)}\n\n"
+            sleep(settings.PROGRESS_INTERVAL)
+    finally:
+        db.close()
 
 
 @router.post(
@@ -82,7 +70,6 @@ def create_index(
 def index_directory(
     request: IndexDirRequest,
     r: Request,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
 ):
     if not path.isdir(request.dir_path):
@@ -100,7 +87,7 @@ def index_directory(
             ).model_dump(),
         )
     try:
-        collection_name = dirhash(request.dir_path)
+        collection_name = uuid4().hex
         crud.create_index(
             db,
             schemas.IndexCreate(
@@ -109,15 +96,50 @@ def index_directory(
                 index_status=1,
             ),
         )
-        background_tasks.add_task(
-            create_index,
-            request.dir_path,
-            db,
-            r.app.state.vectorstore,
-            r.app.state.ai_engine,
-            collection_name,
+        job_id = r.app.state.job_runner.submit(collection_name, "index")
+        return IndexDirResponse(index_id=collection_name, job_id=job_id, error=None)
+    except Exception as e:
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=IndexDirResponse(index_id=None, error=str(e)).model_dump(),
+        )
+
+
+@router.post(
+    "/reindex_directory",
+    response_model=IndexDirResponse,
+)
+def reindex_directory(
+    request: ReindexDirRequest,
+    r: Request,
+    db: Session = Depends(get_db),
+):
+    if not crud.check_index_exist(db, request.index_id):
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_404_NOT_FOUND,
+            detail=IndexDirResponse(
+                index_id=None, error="Index does not exist"
+            ).model_dump(),
         )
-        return IndexDirResponse(index_id=collection_name, error=None)
+    if crud.get_index_status(db, request.index_id) == 1:
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_409_CONFLICT,
+            detail=IndexDirResponse(
+                index_id=request.index_id, error="Index is already being indexed"
+            ).model_dump(),
+        )
+    index = crud.get_index_path(db, request.index_id)
+    if not path.isdir(index.index_path):
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_404_NOT_FOUND,
+            detail=IndexDirResponse(
+                index_id=None, error="Invalid directory path"
+            ).model_dump(),
+        )
+    try:
+        crud.update_index_state(db, request.index_id, 1)
+        job_id = r.app.state.job_runner.submit(request.index_id, "reindex")
+        return IndexDirResponse(index_id=request.index_id, job_id=job_id, error=None)
     except Exception as e:
         raise HTTPException(
             status_code=HTTPStatus.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -125,6 +147,28 @@ def index_directory(
         )
 
 
+@router.get("/index_progress/{index_id}")
+def index_progress(index_id: str, db: Session = Depends(get_db)):
+    """Streams the progress of an index as server-sent events.
+
+    While the index is being built, a `progress` event carries the files
+    scanned, processed and failed, the overall rate and ETA, and the rate
+    of every pipeline stage. A `done` event ends the stream.
+    """
+    if not crud.check_index_exist(db, index_id):
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_404_NOT_FOUND,
+            detail=IndexDirResponse(
+                index_id=None, error="Index does not exist"
+            ).model_dump(),
+        )
+    return StreamingResponse(
+        progress_events(index_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
 @router.get("/search_by_text", response_model=BaseSearchResultResponse)
 def search_by_text(
     r: Request,
@@ -139,9 +183,7 @@ def search_by_text(
             ).model_dump(),
         )
     try:
-        text_emb = r.app.state.ai_engine.generate_text_embedding(
-            [request.search_string]
-        )
+        text_emb = r.app.state.query_batcher.embed_text(request.search_string)
         (img_paths, img_distances) = r.app.state.vectorstore.search_by_text(
             text_emb, request.index_name, request.limit
         )
@@ -151,6 +193,12 @@ def search_by_text(
             ),
             error=None,
         )
+    except InferenceQueueFullError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_429_TOO_MANY_REQUESTS,
+            detail=BaseSearchResultResponse(data=None, error=str(e)).model_dump(),
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         raise HTTPException(
             status_code=HTTPStatus.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -174,9 +222,7 @@ def search_by_image(
         )
     try:
         image_bytes = BytesIO(image.file.read())
-        image_emb = r.app.state.ai_engine.generate_image_embedding(
-            "", image=image_bytes
-        )
+        image_emb = r.app.state.query_batcher.embed_image(image_bytes)
         (img_paths, img_distances) = r.app.state.vectorstore.search_by_image(
             image_emb, request.index_name, request.limit
         )
@@ -186,6 +232,12 @@ def search_by_image(
             ),
             error=None,
         )
+    except InferenceQueueFullError as e:
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_429_TOO_MANY_REQUESTS,
+            detail=BaseSearchResultResponse(data=None, error=str(e)).model_dump(),
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         raise HTTPException(
             status_code=HTTPStatus.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -207,8 +259,18 @@ def delete_index(
             ).model_dump(),
         )
     try:
+        if r.app.state.watcher is not None:
+            r.app.state.watcher.unwatch(request.index_id)
+        # a job still embedding the directory would write the index back
+        if r.app.state.job_runner is not None:
+            r.app.state.job_runner.cancel(request.index_id)
+        try:
+            r.app.state.vectorstore.delete_collection(request.index_id)
+        except ValueError:
+            # nothing was committed to the index yet
+            pass
+        # the rows go last, so a failed delete can be retried
         crud.delete_index(db, request.index_id)
-        r.app.state.vectorstore.delete_collection(request.index_id)
         return DeleteIndexResponse(data="OK", error=None)
     except Exception as e:
         raise HTTPException(
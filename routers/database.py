@@ -2,7 +2,14 @@ from fastapi import APIRouter, Depends, HTTPException, status as HTTPStatus
 from sqlalchemy.orm import Session
 from dependencies import get_db  # type: ignore
 from DATABASE import crud, schemas  # type: ignore
-from api_schema import GetAllIndexResponse, GetIndexStatusResponse, IndexStatusDict  # type: ignore
+from api_schema import (  # type: ignore
+    GetAllIndexResponse,
+    GetIndexJobsResponse,
+    GetIndexStatusResponse,
+    GetJobResponse,
+    IndexStatusDict,
+    JobStatusDict,
+)
 
 router = APIRouter(dependencies=[Depends(get_db)], tags=["DATABASE"])
 
@@ -63,3 +70,37 @@ def get_only_indexed_indexes(db: Session = Depends(get_db)):
             status_code=HTTPStatus.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=GetAllIndexResponse(data=None, error=str(e)).model_dump(),
         )
+
+
+@router.get("/get_job/{job_id}", response_model=GetJobResponse)
+def get_job(job_id: str, db: Session = Depends(get_db)):
+    job = crud.get_job(db, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_404_NOT_FOUND,
+            detail=GetJobResponse(
+                data=None, status_name=None, error="Job does not exist"
+            ).model_dump(),
+        )
+    return GetJobResponse(
+        data=job, status_name=JobStatusDict[job.job_status], error=None
+    )
+
+
+@router.get("/get_index_jobs/{index_id}", response_model=GetIndexJobsResponse)
+def get_index_jobs(index_id: str, db: Session = Depends(get_db)):
+    if not crud.check_index_exist(db, index_id):
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_404_NOT_FOUND,
+            detail=GetIndexJobsResponse(
+                data=None, error="Index does not exist"
+            ).model_dump(),
+        )
+    try:
+        jobs = crud.get_index_jobs(db, index_id)
+        return GetIndexJobsResponse(data=jobs, error=None)
+    except Exception as e:
+        raise HTTPException(
+            status_code=HTTPStatus.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=GetIndexJobsResponse(data=None, error=str(e)).model_dump(),
+        )
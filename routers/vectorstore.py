@@ -1,8 +1,9 @@
 from typing import Sequence
-from chromadb import Collection
-from fastapi import APIRouter, Request, HTTPException, status as HTTPStatus
+from fastapi import APIRouter, Depends, Request, HTTPException, status as HTTPStatus
+from dependencies import wait_for_startup  # type: ignore
+from api_schema import IndexedCollection  # type: ignore
 
-router = APIRouter(tags=["VECTORSTORE"])
+router = APIRouter(dependencies=[Depends(wait_for_startup)], tags=["VECTORSTORE"])
 
 
 @router.get("/is_alive", response_model=int)
@@ -16,7 +17,7 @@ def is_alive(r: Request):
         )
 
 
-@router.get("/get_all_indexed", response_model=Sequence[Collection])
+@router.get("/get_all_indexed", response_model=Sequence[IndexedCollection])
 def get_all_indexed(r: Request):
     try:
         return r.app.state.vectorstore.get_list_collections()
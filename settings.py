@@ -1,4 +1,5 @@
 from os import path
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,3 +11,35 @@ class Settings(BaseSettings):
         extra="ignore",
     )
     ROOT_DIR: str = path.realpath(path.dirname(__file__))
+    CAPTION_BATCH_SIZE: int = 8
+    IMAGE_BATCH_SIZE: int = 16
+    INDEX_CHUNK_SIZE: int = 32
+    INDEX_QUEUE_SIZE: int = 32
+    DECODE_WORKERS: int = 0
+    SCAN_WORKERS: int = 8
+    MAX_CONCURRENT_JOBS: int = 1
+    PROGRESS_INTERVAL: float = 1.0
+    JOB_POLL_INTERVAL: float = 1.0
+    EMBEDDING_CACHE_SIZE_MB: int = 512
+    # opt-in, as it gives bursts of similar shots one caption
+    DEDUP_HAMMING_THRESHOLD: Optional[int] = None
+    DEDUP_WINDOW: int = 4096
+    MAX_DECODE_PIXELS: int = 100_000_000
+    MODEL_IDLE_TTL: float = 900.0
+    MMAP_WEIGHTS: bool = True
+    INFERENCE_BACKEND: str = "torch"
+    INFERENCE_PRECISION: str = "fp32"
+    INFERENCE_THREADS: int = 0
+    INFERENCE_INTEROP_THREADS: int = 0
+    AUTOTUNE: bool = False
+    SEARCH_BATCH_SIZE: int = 32
+    SEARCH_BATCH_WAIT_MS: float = 5.0
+    TEXT_QUERY_CACHE_SIZE: int = 1024
+    INFERENCE_WORKERS: int = 2
+    INTERACTIVE_QUEUE_SIZE: int = 64
+    BULK_QUEUE_SIZE: int = 2
+    WEB_WORKERS: int = 1
+    WATCH_ENABLED: bool = False
+    WATCH_BACKEND: str = "auto"
+    WATCH_DEBOUNCE: float = 2.0
+    WATCH_POLL_INTERVAL: float = 30.0
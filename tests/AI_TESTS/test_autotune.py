@@ -0,0 +1,55 @@
+from os import environ, path
+import json
+import pytest
+from ...AI import autotune  # type: ignore
+from ...AI.engine import AIEngine  # type: ignore
+
+
+@pytest.fixture
+def ai_engine():
+    return AIEngine()
+
+
+@pytest.fixture
+def tuned_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(autotune, "AUTOTUNE_PATH", str(tmp_path / "autotune.json"))
+    monkeypatch.setattr(autotune, "MIN_MEASURE_SECONDS", 0.0)
+    monkeypatch.setattr(autotune, "CAPTION_BATCH_SIZES", (1, 2))
+    monkeypatch.setattr(autotune, "IMAGE_BATCH_SIZES", (1, 4))
+    monkeypatch.setattr(autotune, "TEXT_BATCH_SIZES", (1, 4))
+    return str(tmp_path / "autotune.json")
+
+
+def test_autotune_persists_and_applies(ai_engine, tuned_path, monkeypatch):
+    for name in autotune.TUNED_SETTINGS:
+        value = getattr(ai_engine.settings, name)
+        monkeypatch.setattr(ai_engine.settings, name, value)
+        # explicitly configured settings are never overridden
+        if name not in ("CAPTION_BATCH_SIZE", "IMAGE_BATCH_SIZE"):
+            monkeypatch.setenv(name, str(value))
+    monkeypatch.delenv("CAPTION_BATCH_SIZE", raising=False)
+    monkeypatch.delenv("IMAGE_BATCH_SIZE", raising=False)
+    decode_workers = ai_engine.settings.DECODE_WORKERS
+    caption_batch_size = ai_engine.settings.CAPTION_BATCH_SIZE
+
+    # the benchmark takes minutes, so it only runs when asked for
+    assert not autotune.tune_engine(ai_engine)
+    assert not path.exists(tuned_path)
+
+    assert autotune.tune_engine(ai_engine, force=True)
+    assert path.exists(tuned_path)
+    # benchmarking leaves the engine as it was, the workers apply the result
+    assert ai_engine.settings.CAPTION_BATCH_SIZE == caption_batch_size
+    autotune.apply_persisted_autotune(ai_engine)
+    with open(tuned_path) as f:
+        config = json.load(f)["config"]
+    assert set(config) == set(autotune.TUNED_SETTINGS)
+    assert config["CAPTION_BATCH_SIZE"] in (1, 2)
+    assert ai_engine.settings.CAPTION_BATCH_SIZE == config["CAPTION_BATCH_SIZE"]
+    assert ai_engine.settings.IMAGE_BATCH_SIZE == config["IMAGE_BATCH_SIZE"]
+    assert ai_engine.settings.DECODE_WORKERS == decode_workers
+    assert "CAPTION_BATCH_SIZE" not in environ
+    assert autotune.load_autotune(ai_engine) == config
+
+    monkeypatch.setattr(ai_engine, "model_identity", "other models")
+    assert autotune.load_autotune(ai_engine) is None
@@ -1,6 +1,22 @@
-from os import path
+from os import path, utime
+from threading import Barrier
 import pytest
+import numpy as np
+import torch
+import torchvision.transforms as T  # type: ignore
+from PIL import Image  # type: ignore
+from concurrent.futures import ThreadPoolExecutor
+from ...AI.batcher import MicroBatcher, SearchQueryBatcher  # type: ignore
 from ...AI.engine import AIEngine  # type: ignore
+from ...AI.loader import ModelSlot  # type: ignore
+from ...AI.model import (  # type: ignore
+    Decoder,
+    Encoder,
+    freeze_captioner,
+    trim_at_end,
+)
+from ...AI.preprocess import decode_image  # type: ignore
+from ...AI.weights import safetensors_path  # type: ignore
 from ...settings import Settings
 
 
@@ -20,6 +36,12 @@ def test_generate_caption(ai_engine, settings):
     assert isinstance(caption, str)
 
 
+def test_generate_captions(ai_engine, settings):
+    img_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    captions = ai_engine.generate_captions([img_path, img_path, img_path], batch_size=2)
+    assert captions == [ai_engine.generate_caption(img_path)] * 3
+
+
 def test_generate_experimental_caption(ai_engine, settings):
     img_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
     caption = ai_engine.generate_experimental_caption(img_path)
@@ -36,3 +58,242 @@ def test_generate_image_embedding(ai_engine, settings):
     img_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
     embedding = ai_engine.generate_image_embedding(img_path)
     assert isinstance(embedding, list)
+
+
+def test_generate_image_embeddings(ai_engine, settings):
+    img_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    embeddings = ai_engine.generate_image_embeddings([img_path] * 3, batch_size=2)
+    assert embeddings.dtype == np.float32
+    assert embeddings.flags["C_CONTIGUOUS"]
+    assert embeddings.shape[0] == 3
+    assert np.allclose(
+        embeddings[2], ai_engine.generate_image_embedding(img_path), atol=1e-5
+    )
+
+
+def test_preprocessor_matches_processors(ai_engine, settings):
+    img_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    image = Image.open(img_path).convert("RGB")
+    (caption_pixels, image_pixels) = ai_engine.preprocessor(image)
+    expected_caption_pixels = ai_engine.caption_extractor(
+        images=image, return_tensors="np"
+    )["pixel_values"][0]
+    assert np.allclose(caption_pixels, expected_caption_pixels, atol=1e-5)
+    assert image_pixels.shape == (
+        3,
+        ai_engine.image_extractor.size["height"],
+        ai_engine.image_extractor.size["height"],
+    )
+
+
+def test_generate_experimental_captions_batched(ai_engine, settings):
+    img_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    caption = ai_engine.generate_experimental_caption(img_path)
+    assert caption == ai_engine.generate_experimental_caption(img_path)
+    captions = ai_engine.generate_experimental_captions([img_path] * 3, batch_size=2)
+    assert captions == [caption] * 3
+
+
+def test_decoder_sample_batch_matches_rows():
+    torch.manual_seed(0)
+    decoder = Decoder(embed_size=8, hidden_size=16, vocab_size=12).eval()
+    features = torch.randn(4, 1, 8)
+    with torch.no_grad():
+        batch = decoder.sample_batch(features, max_len=10)
+        rows = [decoder.sample(features[i : i + 1], max_len=10) for i in range(4)]
+    assert batch == rows
+    assert all(1 not in row and len(row) <= 10 for row in batch)
+
+
+def test_frozen_captioner_matches_modules():
+    torch.manual_seed(0)
+    encoder = Encoder(16, pretrained=False).eval()
+    decoder = Decoder(embed_size=16, hidden_size=32, vocab_size=12).eval()
+    with torch.no_grad():
+        encoder.batch_norm.running_mean.uniform_(-1, 1)
+        encoder.batch_norm.running_var.uniform_(0.5, 2)
+        images = torch.randn(3, 3, 224, 224)
+        expected = decoder.sample_batch(encoder(images).unsqueeze(1))
+        frozen = freeze_captioner(encoder, decoder)
+        assert trim_at_end(frozen(images).tolist()) == expected
+    assert "batch_norm" not in str(frozen.graph)
+
+
+def test_experimental_pixels_match_eval_transform(ai_engine, settings):
+    img_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    image = Image.open(img_path).convert("RGB")
+    transform = T.Compose(
+        [
+            T.Resize(256),
+            T.CenterCrop(224),
+            T.ToTensor(),
+            T.Normalize((0.485, 0.456, 0.406), (0.229, 0.224, 0.225)),
+        ]
+    )
+    assert np.allclose(
+        ai_engine.preprocessor.experimental_pixels(image),
+        transform(image).numpy(),
+        atol=1e-5,
+    )
+
+
+def test_captions_with_embeddings_decode_once(ai_engine, settings, monkeypatch):
+    img_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    expected_captions = ai_engine.generate_captions([img_path, img_path])
+    expected_embeddings = ai_engine.generate_image_embeddings([img_path, img_path])
+    decoded = []
+    decode = ai_engine.preprocessor.decode
+
+    def counting_decode(image):
+        decoded.append(image)
+        return decode(image)
+
+    monkeypatch.setattr(ai_engine.preprocessor, "decode", counting_decode)
+    (
+        captions,
+        caption_embeddings,
+        image_embeddings,
+    ) = ai_engine.generate_captions_with_embeddings([img_path, img_path], chunk_size=1)
+    assert decoded == [img_path, img_path]
+    assert captions == expected_captions
+    assert np.allclose(
+        caption_embeddings, ai_engine.generate_text_embedding(captions), atol=1e-5
+    )
+    assert np.allclose(image_embeddings, expected_embeddings, atol=1e-5)
+
+
+def test_decode_image_reduces_and_caps(tmp_path):
+    Image.new("RGB", (4000, 3000), "green").save(tmp_path / "large.jpg")
+    Image.new("RGB", (2000, 1000), "green").save(tmp_path / "large.png")
+    frames = [Image.new("RGB", (64, 64), color) for color in ("red", "blue")]
+    frames[0].save(tmp_path / "anim.gif", save_all=True, append_images=frames[1:])
+    jpeg = decode_image(str(tmp_path / "large.jpg"), min_size=384)
+    assert min(jpeg.size) >= 384 and jpeg.size[0] < 4000
+    png = decode_image(str(tmp_path / "large.png"), min_size=384)
+    assert png.size == (1000, 500)
+    gif = decode_image(str(tmp_path / "anim.gif"), min_size=384)
+    assert gif.mode == "RGB" and gif.getpixel((0, 0)) == (255, 0, 0)
+    with pytest.raises(Exception, match="exceeds 1000000 pixels"):
+        decode_image(str(tmp_path / "large.png"), max_pixels=1_000_000)
+
+
+def test_model_slot_loads_once_and_unloads_when_idle():
+    loads = []
+    slot = ModelSlot("test", lambda: loads.append(object()) or loads[-1])
+    assert not slot.loaded
+    with slot.acquire() as first:
+        assert not slot.unload()
+    with slot.acquire() as second:
+        assert first is second
+    assert len(loads) == 1
+    assert not slot.unload(idle_for=60)
+    assert slot.unload()
+    assert not slot.loaded
+
+
+def test_release_models_reloads_on_use(ai_engine):
+    ai_engine.release_models()
+    assert not any(slot.loaded for slot in ai_engine.slots)
+    assert len(ai_engine.generate_text_embedding(["a dog"])) == 1
+    assert ai_engine.text_slot.loaded
+    assert not ai_engine.caption_slot.loaded
+
+
+def test_micro_batcher_coalesces_concurrent_calls():
+    batches = []
+
+    def run_batch(items):
+        batches.append(list(items))
+        if "fail" in items:
+            raise ValueError("bad batch")
+        return [item.upper() for item in items]
+
+    batcher = MicroBatcher(run_batch, max_batch_size=8, max_wait=0.2)
+    barrier = Barrier(4)
+
+    def submit(item):
+        barrier.wait()
+        return batcher.submit(item)
+
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(submit, ["a", "b", "c", "d"]))
+    assert results == ["A", "B", "C", "D"]
+    assert len(batches) < 4
+    with pytest.raises(ValueError):
+        batcher.submit("fail")
+
+
+def test_search_batcher_matches_engine(ai_engine):
+    batcher = SearchQueryBatcher(ai_engine)
+    expected = ai_engine.generate_text_embedding(["a dog on a beach"])[0]
+    assert np.allclose(batcher.embed_text("a dog on a beach"), expected, atol=1e-5)
+
+
+def test_onnx_backend_matches_torch(ai_engine, settings, monkeypatch):
+    pytest.importorskip("onnxruntime")
+    monkeypatch.setenv("INFERENCE_BACKEND", "onnx")
+    # a second engine next to the singleton, running on ONNX Runtime
+    onnx_engine = object.__new__(AIEngine)
+    onnx_engine.__init__()
+    img_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    texts = ["a dog on a beach", "two cats sleeping on a couch"]
+    assert np.allclose(
+        onnx_engine.generate_text_embedding(texts),
+        ai_engine.generate_text_embedding(texts),
+        atol=1e-4,
+    )
+    assert np.allclose(
+        onnx_engine.generate_image_embeddings([img_path, img_path]),
+        ai_engine.generate_image_embeddings([img_path, img_path]),
+        atol=1e-4,
+    )
+    assert onnx_engine.generate_captions([img_path]) == ai_engine.generate_captions(
+        [img_path]
+    )
+
+
+def test_int8_engine_stays_close_to_fp32(ai_engine, settings, monkeypatch):
+    monkeypatch.setenv("INFERENCE_PRECISION", "int8")
+    int8_engine = object.__new__(AIEngine)
+    int8_engine.__init__()
+    assert int8_engine.model_identity != ai_engine.model_identity
+    img_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    (expected, actual) = (
+        ai_engine.generate_image_embeddings([img_path])[0],
+        int8_engine.generate_image_embeddings([img_path])[0],
+    )
+    cosine = expected @ actual / np.linalg.norm(expected) / np.linalg.norm(actual)
+    assert cosine > 0.99
+    assert isinstance(int8_engine.generate_caption(img_path), str)
+
+
+def test_mapped_weights_match_pretrained(ai_engine, settings, monkeypatch):
+    monkeypatch.setenv("MMAP_WEIGHTS", "false")
+    pickled_engine = object.__new__(AIEngine)
+    pickled_engine.__init__()
+    img_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    texts = ["a dog on a beach", "two cats sleeping on a couch"]
+    assert np.allclose(
+        pickled_engine.generate_text_embedding(texts),
+        ai_engine.generate_text_embedding(texts),
+    )
+    assert np.allclose(
+        pickled_engine.generate_image_embeddings([img_path]),
+        ai_engine.generate_image_embeddings([img_path]),
+    )
+    assert pickled_engine.generate_captions(
+        [img_path]
+    ) == ai_engine.generate_captions([img_path])
+    text_model_path = path.join(settings.ROOT_DIR, "AI", "model-text")
+    assert path.exists(safetensors_path(text_model_path))
+
+
+def test_safetensors_path_tells_fine_tuned_weights_apart(tmp_path):
+    weights = tmp_path / "pytorch_model.bin"
+    weights.write_bytes(b"\x00" * 64)
+    original = safetensors_path(str(tmp_path))
+    # fine-tuning keeps the architecture, and so the size of the checkpoint
+    weights.write_bytes(b"\x01" * 64)
+    stat = weights.stat()
+    utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert safetensors_path(str(tmp_path)) != original
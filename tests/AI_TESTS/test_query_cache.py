@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+from ...AI.batcher import SearchQueryBatcher  # type: ignore
+from ...AI.query_cache import QueryEmbeddingCache, normalize_query  # type: ignore
+from ...settings import Settings
+
+
+def test_query_cache_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(max_size=2)
+    cache.put("models", "dog", [1.0])
+    cache.put("models", "cat", [2.0])
+    assert cache.get("models", "dog") == [1.0]
+    cache.put("models", "bird", [3.0])
+    assert cache.get("models", "cat") is None
+    assert cache.get("models", "dog") == [1.0]
+    assert cache.get("other models", "dog") is None
+    assert cache.stats() == {
+        "size": 2,
+        "max_size": 2,
+        "hits": 2,
+        "misses": 2,
+        "hit_rate": 0.5,
+    }
+
+
+def test_normalize_query():
+    assert normalize_query("  A Dog\ton the   beach ") == "a dog on the beach"
+
+
+def test_repeated_query_skips_the_model():
+    calls = []
+
+    def generate_text_embedding(texts):
+        calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    ae = SimpleNamespace(
+        model_identity="models",
+        generate_text_embedding=generate_text_embedding,
+        embed_pixel_values=None,
+    )
+    batcher = SearchQueryBatcher(ae, Settings(TEXT_QUERY_CACHE_SIZE=8))
+    assert batcher.embed_text("A dog") == [5.0]
+    assert batcher.embed_text("a  dog ") == [5.0]
+    assert calls == [["a dog"]]
+    assert batcher.text_cache.stats()["hits"] == 1
@@ -0,0 +1,79 @@
+from threading import Event
+import pytest
+from ...AI.scheduler import (  # type: ignore
+    BULK,
+    INTERACTIVE,
+    InferenceQueueFullError,
+    InferenceScheduler,
+    get_scheduler,
+    shutdown_scheduler,
+)
+
+
+def test_interactive_work_runs_before_queued_bulk_work():
+    scheduler = InferenceScheduler(workers=1, max_interactive=4, max_bulk=4)
+    (started, release) = (Event(), Event())
+    order = []
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    first = scheduler.submit(blocker, priority=BULK)
+    assert started.wait(5)
+    bulk = [scheduler.submit(order.append, f"bulk{i}", priority=BULK) for i in range(2)]
+    interactive = scheduler.submit(order.append, "search")
+    release.set()
+    for future in [first, *bulk, interactive]:
+        future.result(5)
+    assert order == ["search", "bulk0", "bulk1"]
+    scheduler.shutdown()
+
+
+def test_bulk_work_leaves_a_worker_for_interactive_work():
+    scheduler = InferenceScheduler(workers=2, max_interactive=4, max_bulk=4)
+    release = Event()
+    bulk = [scheduler.submit(release.wait, 5, priority=BULK) for _ in range(2)]
+    assert scheduler.submit(lambda: "search").result(5) == "search"
+    release.set()
+    for future in bulk:
+        future.result(5)
+    scheduler.shutdown()
+
+
+def test_full_interactive_lane_is_rejected_with_retry_after():
+    scheduler = InferenceScheduler(workers=1, max_interactive=1, max_bulk=1)
+    (started, release) = (Event(), Event())
+
+    def blocker():
+        started.set()
+        release.wait(5)
+
+    running = scheduler.submit(blocker)
+    assert started.wait(5)
+    queued = scheduler.submit(lambda: None)
+    with pytest.raises(InferenceQueueFullError) as e:
+        scheduler.submit(lambda: None, priority=INTERACTIVE)
+    assert e.value.retry_after >= 1
+    release.set()
+    running.result(5)
+    queued.result(5)
+    scheduler.shutdown()
+
+
+def test_call_returns_the_result_and_raises_the_error():
+    scheduler = InferenceScheduler(workers=1)
+    assert scheduler.call(sum, [1, 2, 3]) == 6
+    with pytest.raises(ZeroDivisionError):
+        scheduler.call(lambda: 1 / 0)
+    scheduler.shutdown()
+
+
+def test_scheduler_restarts_after_shutdown():
+    scheduler = get_scheduler()
+    shutdown_scheduler()
+    with pytest.raises(RuntimeError):
+        scheduler.submit(lambda: None)
+    restarted = get_scheduler()
+    assert restarted is not scheduler
+    assert restarted.call(sum, [1, 2]) == 3
@@ -0,0 +1,29 @@
+from ...INDEXER.cache import CachedEmbedding, EmbeddingCache  # type: ignore
+
+
+def cached_embedding(caption):
+    return CachedEmbedding(caption, [0.5] * 4, [0.25] * 8)
+
+
+def test_cache_is_keyed_by_model_identity(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), 1024 * 1024)
+    cache.put_many("model-a", [("hash", cached_embedding("a dog"))])
+    assert cache.get("model-a", "hash") == cached_embedding("a dog")
+    assert cache.get("model-b", "hash") is None
+    reopened = EmbeddingCache(str(tmp_path / "cache.sqlite3"), 1024 * 1024)
+    assert reopened.size == cache.size
+    assert reopened.get_many("model-a", ["hash", "other"]) == {
+        "hash": cached_embedding("a dog")
+    }
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    entry_size = len("cap0") + 4 * 4 + 8 * 4
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), 2 * entry_size)
+    cache.put_many("model", [("hash0", cached_embedding("cap0"))])
+    cache.put_many("model", [("hash1", cached_embedding("cap1"))])
+    cache.get("model", "hash0")
+    cache.put_many("model", [("hash2", cached_embedding("cap2"))])
+    assert cache.get("model", "hash1") is None
+    assert cache.get("model", "hash0") is not None
+    assert cache.size <= 2 * entry_size
@@ -0,0 +1,57 @@
+from ...DATABASE import models  # type: ignore
+from ...INDEXER.catalog import (  # type: ignore
+    diff_catalog,
+    file_content_hash,
+    stat_entry,
+    vector_id,
+)
+
+
+def catalog_row(file_path, file_size, file_mtime, content_hash):
+    return models.IndexFile(
+        index_id="test",
+        file_path=file_path,
+        file_size=file_size,
+        file_mtime=file_mtime,
+        content_hash=content_hash,
+        vector_id=vector_id(file_path),
+    )
+
+
+def test_vector_id_is_stable():
+    assert vector_id("/photos/a.jpg") == vector_id("/photos/a.jpg")
+    assert vector_id("/photos/a.jpg") != vector_id("/photos/b.jpg")
+
+
+def test_diff_catalog(tmp_path):
+    for name in ["same", "touched", "modified", "added"]:
+        (tmp_path / f"{name}.jpg").write_bytes(name.encode())
+    entries = {
+        name: stat_entry(str(tmp_path / f"{name}.jpg"))
+        for name in ["same", "touched", "modified", "added"]
+    }
+    catalog = [
+        catalog_row(
+            entries["same"].path,
+            entries["same"].size,
+            entries["same"].mtime,
+            file_content_hash(entries["same"].path),
+        ),
+        catalog_row(
+            entries["touched"].path,
+            entries["touched"].size,
+            entries["touched"].mtime - 10,
+            file_content_hash(entries["touched"].path),
+        ),
+        catalog_row(
+            entries["modified"].path,
+            entries["modified"].size,
+            entries["modified"].mtime - 10,
+            "stale",
+        ),
+        catalog_row(str(tmp_path / "removed.jpg"), 1, 1.0, "removed"),
+    ]
+    (changed, touched, removed) = diff_catalog(entries.values(), catalog)
+    assert sorted(changed) == sorted([entries["modified"], entries["added"]])
+    assert touched == [entries["touched"]]
+    assert [row.file_path for row in removed] == [str(tmp_path / "removed.jpg")]
@@ -0,0 +1,33 @@
+from os import path
+from PIL import Image  # type: ignore
+from ...AI.preprocess import dhash  # type: ignore
+from ...INDEXER.cache import CachedEmbedding  # type: ignore
+from ...INDEXER.dedup import NearDuplicateIndex  # type: ignore
+from ...settings import Settings
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def test_dhash_matches_resized_copies():
+    demo_path = path.join(Settings().ROOT_DIR, "static", "demo.jpg")
+    image = Image.open(demo_path).convert("RGB")
+    resized = image.resize((image.width // 3, image.height // 3))
+    mirrored = image.transpose(Image.FLIP_LEFT_RIGHT)
+    assert hamming(dhash(image), dhash(resized)) <= 4
+    assert hamming(dhash(image), dhash(mirrored)) > 4
+
+
+def test_index_finds_hashes_within_threshold():
+    index = NearDuplicateIndex(threshold=4, capacity=2)
+    index.add(0b1111, "first")
+    index.set_result("first", CachedEmbedding("a dog", [0.5], [0.25]))
+    assert index.find(0b1111 ^ (1 << 63) ^ (1 << 40) ^ 1) == "first"
+    assert index.find(0b1111 ^ 0b11111 << 20) is None
+    assert index.get_result("first") == CachedEmbedding("a dog", [0.5], [0.25])
+    index.add(0xFF << 24, "second")
+    index.add(0xFFFF << 40, "third")
+    assert index.find(0b1111) is None
+    assert index.get_result("first") is None
+    assert index.find(0xFFFF << 40) == "third"
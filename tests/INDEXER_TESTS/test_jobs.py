@@ -0,0 +1,175 @@
+from json import loads
+from os import path
+from shutil import copyfile
+from time import monotonic, sleep
+from uuid import uuid4
+import numpy as np
+import pytest
+from PIL import Image  # type: ignore
+from ...AI.engine import AIEngine  # type: ignore
+from ...VECTORSTORE.vectorstore import VectorStore  # type: ignore
+from ...DATABASE import crud, models, schemas  # type: ignore
+from ...DATABASE.database import (  # type: ignore
+    SessionLocal,
+    add_missing_columns,
+    engine,
+)
+from ...INDEXER.catalog import stat_entry  # type: ignore
+from ...INDEXER.jobs import (  # type: ignore
+    JOB_COMPLETED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JobRunner,
+)
+from ...INDEXER.leader import LeaderLock  # type: ignore
+from ...INDEXER.pipeline import IndexingPipeline  # type: ignore
+from ...settings import Settings
+
+
+@pytest.fixture
+def db():
+    models.Base.metadata.create_all(bind=engine)
+    add_missing_columns(models.Base.metadata)
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def index_id(db):
+    index_id = uuid4().hex
+    yield index_id
+    crud.delete_index(db, index_id)
+    try:
+        VectorStore().delete_collection(index_id)
+    except ValueError:
+        # the test never committed a chunk
+        pass
+
+
+def wait_for_job(db, job_id, timeout=300):
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        db.expire_all()
+        job = crud.get_job(db, job_id)
+        if job.job_status not in (JOB_RUNNING, JOB_QUEUED):
+            return job
+        sleep(0.2)
+    raise TimeoutError(job_id)
+
+
+def test_resume_skips_committed_files(db, index_id, tmp_path):
+    settings = Settings()
+    demo_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    img_paths = [str(tmp_path / f"{i}.jpg") for i in range(3)]
+    for img_path in img_paths:
+        copyfile(demo_path, img_path)
+    (tmp_path / "broken.jpg").write_bytes(b"not an image")
+    (ae, vs) = (AIEngine(), VectorStore())
+    crud.create_index(
+        db,
+        schemas.IndexCreate(
+            index_id=index_id, index_path=str(tmp_path), index_status=1
+        ),
+    )
+    # a server stopped after committing the first file of the job and
+    # failing on the broken one
+    job = crud.create_job(
+        db,
+        schemas.IndexJobCreate(
+            job_id=uuid4().hex,
+            index_id=index_id,
+            job_type="index",
+            job_status=JOB_RUNNING,
+        ),
+    )
+    IndexingPipeline(ae, vs, index_id, db=db).run([stat_entry(img_paths[0])])
+    crud.update_job_progress(db, job.job_id, 1, 1)
+
+    runner = JobRunner(ae, vs, settings)
+    runner.resume()
+    job = wait_for_job(db, job.job_id)
+    runner.shutdown()
+
+    assert job.job_status == JOB_COMPLETED
+    # one file from the interrupted run plus the two it had not reached
+    assert job.files_done == 3
+    # the resumed run tried the broken file again
+    assert job.files_failed == 2
+    # the stats of the run are shared with every server worker
+    assert loads(job.progress)["processed"] == 2
+    assert crud.get_index_status(db, index_id) == 0
+    catalog = crud.get_index_files(db, index_id)
+    assert sorted(row.file_path for row in catalog) == img_paths
+
+
+def test_leader_lock_is_exclusive(tmp_path):
+    lock_path = str(tmp_path / "indexer.lock")
+    (first, second) = (LeaderLock(lock_path), LeaderLock(lock_path))
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+def test_only_the_leader_runs_recorded_jobs(db, index_id, tmp_path):
+    settings = Settings(JOB_POLL_INTERVAL=0.1)
+    copyfile(
+        path.join(settings.ROOT_DIR, "static", "demo.jpg"), str(tmp_path / "0.jpg")
+    )
+    (ae, vs) = (AIEngine(), VectorStore())
+    crud.create_index(
+        db,
+        schemas.IndexCreate(
+            index_id=index_id, index_path=str(tmp_path), index_status=0
+        ),
+    )
+    lock_path = str(tmp_path / "indexer.lock")
+    leader = JobRunner(ae, vs, settings, leader=LeaderLock(lock_path))
+    follower = JobRunner(ae, vs, settings, leader=LeaderLock(lock_path))
+    leader.start()
+    deadline = monotonic() + 10
+    while not leader.is_leader and monotonic() < deadline:
+        sleep(0.05)
+    follower.start()
+    job_id = follower.submit(index_id, "index")
+    job = wait_for_job(db, job_id)
+    assert not follower.is_leader
+    follower.shutdown()
+    leader.shutdown()
+    assert job.job_status == JOB_COMPLETED
+    assert job.files_done == 1
+
+
+def test_cancelled_job_leaves_nothing_behind(db, index_id, tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    for i in range(8):
+        pixels = rng.integers(0, 255, (64, 64, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(tmp_path / f"{i}.png")
+    (ae, vs) = (AIEngine(), VectorStore())
+    monkeypatch.setattr(ae.settings, "INDEX_CHUNK_SIZE", 1)
+    crud.create_index(
+        db,
+        schemas.IndexCreate(
+            index_id=index_id, index_path=str(tmp_path), index_status=0
+        ),
+    )
+    runner = JobRunner(ae, vs, Settings())
+    job_id = runner.submit(index_id, "index")
+    deadline = monotonic() + 300
+    while monotonic() < deadline:
+        db.expire_all()
+        if crud.get_job(db, job_id).files_done > 0:
+            break
+        sleep(0.05)
+    runner.cancel(index_id)
+    runner.shutdown()
+
+    db.expire_all()
+    # the job deleted the index it had written to
+    assert not crud.check_index_exist(db, index_id)
+    assert crud.get_job(db, job_id) is None
+    assert crud.get_index_files(db, index_id) == []
+    with pytest.raises(ValueError):
+        vs.delete_collection(index_id)
@@ -0,0 +1,122 @@
+from os import path
+from types import SimpleNamespace
+from shutil import copyfile
+import pytest
+from PIL import Image  # type: ignore
+from ...AI.engine import AIEngine  # type: ignore
+from ...VECTORSTORE.vectorstore import VectorStore  # type: ignore
+from ...INDEXER.catalog import FileEntry, stat_entry  # type: ignore
+from ...INDEXER import incremental  # type: ignore
+from ...INDEXER.pipeline import IndexingPipeline  # type: ignore
+from ...settings import Settings
+
+
+@pytest.fixture
+def settings():
+    return Settings()
+
+
+@pytest.fixture
+def vectorstore():
+    vs = VectorStore()
+    yield vs
+    try:
+        vs.delete_collection("test-pipeline")
+    except ValueError:
+        # the test never committed a chunk
+        pass
+
+
+@pytest.mark.parametrize("decode_workers", [0, 2])
+def test_pipeline_run(vectorstore, settings, tmp_path, decode_workers):
+    demo_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    img_paths = [str(tmp_path / f"{i}.jpg") for i in range(3)]
+    for img_path in img_paths:
+        copyfile(demo_path, img_path)
+    settings.INDEX_CHUNK_SIZE = 2
+    settings.DECODE_WORKERS = decode_workers
+    settings.EMBEDDING_CACHE_SIZE_MB = 0
+    settings.DEDUP_HAMMING_THRESHOLD = None
+    pipeline = IndexingPipeline(AIEngine(), vectorstore, "test-pipeline", settings)
+    entries = [stat_entry(img_path) for img_path in img_paths]
+    missing_entry = FileEntry(str(tmp_path / "missing.jpg"), 0, 0.0)
+    stats = pipeline.run(entries[:1] + [missing_entry] + entries[1:])
+    assert stats.scanned == 4
+    assert stats.processed == 3
+    assert stats.failed == 1
+    assert stats.stages["decode"].count == 3
+    assert stats.stages["upsert"].count == 3
+    result_paths, _ = vectorstore.search_by_image(
+        AIEngine().generate_image_embedding(demo_path), "test-pipeline", 3
+    )
+    assert sorted(result_paths) == img_paths
+
+
+def test_pipeline_serves_copies_from_cache(vectorstore, settings, tmp_path):
+    demo_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    img_paths = [str(tmp_path / f"{i}.jpg") for i in range(3)]
+    for img_path in img_paths:
+        copyfile(demo_path, img_path)
+    settings.INDEX_CHUNK_SIZE = 1
+    settings.DEDUP_HAMMING_THRESHOLD = None
+    ae = AIEngine()
+    pipeline = IndexingPipeline(ae, vectorstore, "test-pipeline", settings)
+    stats = pipeline.run([stat_entry(img_path) for img_path in img_paths])
+    assert stats.processed == 3
+    assert stats.cached >= 2
+    assert stats.stages["embed"].count == 3 - stats.cached
+
+
+def test_pipeline_reuses_near_duplicates(vectorstore, settings, tmp_path):
+    demo_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    image = Image.open(demo_path).convert("RGB")
+    image.save(tmp_path / "original.png")
+    image.resize((image.width // 2, image.height // 2)).save(tmp_path / "small.jpg")
+    settings.EMBEDDING_CACHE_SIZE_MB = 0
+    settings.DEDUP_HAMMING_THRESHOLD = 4
+    pipeline = IndexingPipeline(AIEngine(), vectorstore, "test-pipeline", settings)
+    stats = pipeline.run(
+        [stat_entry(str(tmp_path / name)) for name in ("original.png", "small.jpg")]
+    )
+    assert stats.processed == 2
+    assert stats.deduplicated == 1
+    assert stats.stages["embed"].count == 1
+
+
+def test_pipeline_embeds_duplicates_of_forgotten_results(
+    vectorstore, settings, tmp_path
+):
+    demo_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    image = Image.open(demo_path).convert("RGB")
+    image.save(tmp_path / "original.png")
+    image.resize((image.width // 2, image.height // 2)).save(tmp_path / "small.jpg")
+    settings.EMBEDDING_CACHE_SIZE_MB = 0
+    settings.INDEX_CHUNK_SIZE = 1
+    settings.DEDUP_HAMMING_THRESHOLD = 4
+    pipeline = IndexingPipeline(AIEngine(), vectorstore, "test-pipeline", settings)
+    pipeline.dedup.get_result = lambda file_hash: None
+    stats = pipeline.run(
+        [stat_entry(str(tmp_path / name)) for name in ("original.png", "small.jpg")]
+    )
+    assert stats.processed == 2
+    assert stats.deduplicated == 0
+    assert stats.stages["embed"].count == 2
+
+
+def test_apply_changes_deletes_removed_files_in_chunks(monkeypatch):
+    (db_calls, vs_calls) = ([], [])
+    monkeypatch.setattr(incremental, "_QUERY_CHUNK_SIZE", 2)
+    monkeypatch.setattr(
+        incremental.crud,
+        "delete_index_files",
+        lambda db, index_id, file_paths: db_calls.append(file_paths),
+    )
+    vs = SimpleNamespace(
+        delete_from_collections=lambda ids, index_id: vs_calls.append(ids)
+    )
+    removed = [
+        SimpleNamespace(file_path=f"/{i}.jpg", vector_id=f"id{i}") for i in range(5)
+    ]
+    incremental.apply_changes(None, vs, AIEngine(), "test-pipeline", [], [], removed)
+    assert db_calls == [["/0.jpg", "/1.jpg"], ["/2.jpg", "/3.jpg"], ["/4.jpg"]]
+    assert vs_calls == [["id0", "id1"], ["id2", "id3"], ["id4"]]
@@ -0,0 +1,15 @@
+from ...INDEXER.progress import PipelineStats  # type: ignore
+
+
+def test_snapshot_eta_and_stage_rates():
+    stats = PipelineStats()
+    stats.started -= 10
+    (stats.scanned, stats.processed, stats.failed) = (30, 18, 2)
+    stats.stages["decode"].add(20, 4.0)
+    snapshot = stats.snapshot()
+    assert snapshot["eta"] is None
+    assert snapshot["stages"]["decode"]["rate"] == 5.0
+    assert snapshot["stages"]["upsert"]["rate"] is None
+    stats.scan_done = True
+    assert 4.5 < stats.snapshot()["eta"] < 5.5
+
@@ -0,0 +1,22 @@
+import pytest
+from ...INDEXER.scanner import is_image_path, iter_image_entry  # type: ignore
+
+
+def test_is_image_path_ignores_case():
+    assert is_image_path("/photos/IMG_0001.JPG")
+    assert is_image_path("/photos/scan.TiFF")
+    assert not is_image_path("/photos/notes.txt")
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_iter_image_entry(tmp_path, workers):
+    for relative_path in ["a.jpg", "B.PNG", "notes.txt", "x/c.gif", "x/y/z/d.JPEG"]:
+        file_path = tmp_path / relative_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(b"data")
+    entries = list(iter_image_entry(str(tmp_path), workers=workers))
+    assert sorted(entry.path for entry in entries) == sorted(
+        str(tmp_path / relative_path)
+        for relative_path in ["a.jpg", "B.PNG", "x/c.gif", "x/y/z/d.JPEG"]
+    )
+    assert all(entry.size == 4 for entry in entries)
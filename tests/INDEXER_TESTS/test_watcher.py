@@ -0,0 +1,181 @@
+from os import path, remove, rename
+from shutil import copyfile
+from sys import platform
+from threading import Event, Thread
+from time import monotonic, sleep
+from uuid import uuid4
+import pytest
+from ...AI.engine import AIEngine  # type: ignore
+from ...VECTORSTORE.vectorstore import VectorStore  # type: ignore
+from ...DATABASE import crud, models, schemas  # type: ignore
+from ...DATABASE.database import (  # type: ignore
+    SessionLocal,
+    add_missing_columns,
+    engine,
+)
+from ...INDEXER.catalog import vector_id  # type: ignore
+from ...INDEXER.incremental import index_lock  # type: ignore
+from ...INDEXER.watcher import (  # type: ignore
+    IndexWatcher,
+    InotifyBackend,
+    PollingBackend,
+    WatchedIndex,
+)
+from ...settings import Settings
+
+
+@pytest.fixture
+def db():
+    models.Base.metadata.create_all(bind=engine)
+    add_missing_columns(models.Base.metadata)
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def index_id(db):
+    index_id = uuid4().hex
+    yield index_id
+    crud.delete_index(db, index_id)
+    try:
+        VectorStore().delete_collection(index_id)
+    except ValueError:
+        # the test never committed a chunk
+        pass
+
+
+def wait_until(condition, timeout=60):
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        if condition():
+            return
+        sleep(0.02)
+    raise TimeoutError()
+
+
+def catalog_paths(db, index_id):
+    db.expire_all()
+    return sorted(row.file_path for row in crud.get_index_files(db, index_id))
+
+
+def test_debounce_waits_for_quiet_paths():
+    watched = WatchedIndex("test", "/photos")
+    watched.emit("/photos/a.jpg", False)
+    watched.emit("/photos/sub", True)
+    assert watched.pop_ready(60) == ([], [], False)
+    sleep(0.05)
+    watched.emit("/photos/b.jpg", False)
+    assert watched.pop_ready(0.04) == (["/photos/a.jpg"], ["/photos/sub"], False)
+    sleep(0.05)
+    assert watched.pop_ready(0.04) == (["/photos/b.jpg"], [], False)
+
+
+def test_rescan_waits_for_pending_paths():
+    watched = WatchedIndex("test", "/photos")
+    watched.emit("/photos/a.jpg", False)
+    watched.emit(None, True)
+    assert watched.pop_ready(60) == ([], [], False)
+    assert watched.pop_ready(0) == (["/photos/a.jpg"], [], True)
+
+
+@pytest.mark.skipif(not platform.startswith("linux"), reason="inotify is Linux only")
+def test_inotify_backend_reports_changes(tmp_path):
+    (events, stop) = ([], Event())
+    backend = InotifyBackend(str(tmp_path), lambda *event: events.append(event))
+    Thread(target=backend.run, args=(stop,), daemon=True).start()
+    (a_path, b_path) = (str(tmp_path / "a.jpg"), str(tmp_path / "b.jpg"))
+    try:
+        (tmp_path / "a.jpg").write_bytes(b"created")
+        wait_until(lambda: (a_path, False) in events)
+        events.clear()
+        (tmp_path / "a.jpg").write_bytes(b"modified")
+        wait_until(lambda: (a_path, False) in events)
+        events.clear()
+        rename(a_path, b_path)
+        wait_until(lambda: {(a_path, False), (b_path, False)} <= set(events))
+        # files in new subdirectories are watched as well
+        (tmp_path / "sub").mkdir()
+        wait_until(lambda: (str(tmp_path / "sub"), True) in events)
+        (tmp_path / "sub" / "c.jpg").write_bytes(b"created")
+        wait_until(lambda: (str(tmp_path / "sub" / "c.jpg"), False) in events)
+        events.clear()
+        remove(b_path)
+        wait_until(lambda: (b_path, False) in events)
+    finally:
+        stop.set()
+
+
+def test_polling_backend_reports_changes(tmp_path):
+    (events, stop) = ([], Event())
+    (a_path, b_path) = (str(tmp_path / "a.jpg"), str(tmp_path / "b.jpg"))
+    (tmp_path / "a.jpg").write_bytes(b"created")
+    backend = PollingBackend(
+        str(tmp_path), lambda *event: events.append(event), interval=0.05
+    )
+    Thread(target=backend.run, args=(stop,), daemon=True).start()
+    try:
+        sleep(0.1)
+        assert events == []
+        (tmp_path / "a.jpg").write_bytes(b"modified, and longer")
+        wait_until(lambda: (a_path, False) in events)
+        events.clear()
+        rename(a_path, b_path)
+        wait_until(lambda: {(a_path, False), (b_path, False)} <= set(events))
+        events.clear()
+        remove(b_path)
+        wait_until(lambda: (b_path, False) in events)
+    finally:
+        stop.set()
+
+
+def test_watcher_syncs_changes_to_the_index(db, index_id, tmp_path, monkeypatch):
+    settings = Settings(
+        WATCH_BACKEND="polling", WATCH_POLL_INTERVAL=0.1, WATCH_DEBOUNCE=0.1
+    )
+    demo_path = path.join(settings.ROOT_DIR, "static", "demo.jpg")
+    (ae, vs) = (AIEngine(), VectorStore())
+    (upserted, deleted) = ([], [])
+    (upsert, delete) = (vs.upsert_to_collections, vs.delete_from_collections)
+    monkeypatch.setattr(
+        vs,
+        "upsert_to_collections",
+        lambda id_list, *args: upserted.extend(id_list) or upsert(id_list, *args),
+    )
+    monkeypatch.setattr(
+        vs,
+        "delete_from_collections",
+        lambda id_list, *args: deleted.extend(id_list) or delete(id_list, *args),
+    )
+    crud.create_index(
+        db,
+        schemas.IndexCreate(
+            index_id=index_id, index_path=str(tmp_path), index_status=0
+        ),
+    )
+    watcher = IndexWatcher(ae, vs, settings)
+    watcher.watch(index_id, str(tmp_path))
+    (a_path, b_path) = (str(tmp_path / "a.jpg"), str(tmp_path / "b.jpg"))
+    try:
+        copyfile(demo_path, a_path)
+        wait_until(lambda: catalog_paths(db, index_id) == [a_path])
+        assert upserted == [vector_id(a_path)]
+
+        rename(a_path, b_path)
+        wait_until(lambda: catalog_paths(db, index_id) == [b_path])
+        assert deleted == [vector_id(a_path)]
+        assert upserted[-1] == vector_id(b_path)
+
+        # events stay pending while a job holds the index
+        with index_lock(index_id):
+            remove(b_path)
+            sleep(0.5)
+            assert catalog_paths(db, index_id) == [b_path]
+        wait_until(lambda: catalog_paths(db, index_id) == [])
+        assert deleted[-1] == vector_id(b_path)
+
+        # an index deleted through another server worker is dropped
+        crud.delete_index(db, index_id)
+        wait_until(lambda: not watcher.is_watching(index_id))
+    finally:
+        watcher.stop()
@@ -0,0 +1,66 @@
+from io import BytesIO
+import numpy as np
+import orjson  # type: ignore
+import pytest
+from fastapi import HTTPException
+from ..api_responses import (  # type: ignore
+    ARRAY_MEDIA_TYPES,
+    EMBEDDING_DTYPES,
+    JSON_MEDIA_TYPE,
+    NPY_MEDIA_TYPE,
+    NPZ_MEDIA_TYPE,
+    RAW_MEDIA_TYPE,
+    arrays_response,
+    embeddings_response,
+    negotiate,
+)
+
+EMBEDDINGS = np.random.default_rng(0).random((3, 8), dtype=np.float32)
+
+
+def test_negotiate_defaults_to_json():
+    for accept in (None, "", "*/*", "application/json", "text/html"):
+        assert negotiate(accept, ARRAY_MEDIA_TYPES)[0] == JSON_MEDIA_TYPE
+    assert negotiate(NPZ_MEDIA_TYPE, ARRAY_MEDIA_TYPES)[0] == JSON_MEDIA_TYPE
+
+
+def test_negotiate_follows_quality_and_dtype():
+    accept = "application/json;q=0.5, application/octet-stream; dtype=float16"
+    assert negotiate(accept, ARRAY_MEDIA_TYPES) == (
+        RAW_MEDIA_TYPE,
+        EMBEDDING_DTYPES["float16"],
+    )
+    accept = "application/json, application/x-npy"
+    (media_type, _) = negotiate(accept, ARRAY_MEDIA_TYPES)
+    assert media_type == JSON_MEDIA_TYPE
+    with pytest.raises(HTTPException) as e:
+        negotiate("application/x-npy; dtype=int8", ARRAY_MEDIA_TYPES)
+    assert e.value.status_code == 406
+
+
+def test_embeddings_round_trip_in_every_format():
+    (float32, float16) = (EMBEDDING_DTYPES["float32"], EMBEDDING_DTYPES["float16"])
+    content = orjson.loads(
+        embeddings_response(EMBEDDINGS, JSON_MEDIA_TYPE, float32).body
+    )
+    assert content["error"] is None
+    embeddings = np.array(content["embeddings"], dtype=np.float32)
+    assert np.array_equal(embeddings, EMBEDDINGS)
+
+    response = embeddings_response(EMBEDDINGS, NPY_MEDIA_TYPE, float32)
+    assert np.array_equal(np.load(BytesIO(response.body)), EMBEDDINGS)
+
+    response = embeddings_response(EMBEDDINGS, RAW_MEDIA_TYPE, float16)
+    assert response.headers["X-Embedding-Shape"] == "3,8"
+    assert response.headers["X-Embedding-Dtype"] == "float16"
+    raw = np.frombuffer(response.body, dtype="<f2").reshape(3, 8)
+    assert np.allclose(raw, EMBEDDINGS, atol=1e-3)
+
+
+def test_arrays_response_keeps_captions():
+    response = arrays_response(
+        {"caption": np.array(["a dog", "a cat"], dtype=str), "embeddings": EMBEDDINGS}
+    )
+    archive = np.load(BytesIO(response.body))
+    assert archive["caption"].tolist() == ["a dog", "a cat"]
+    assert np.array_equal(archive["embeddings"], EMBEDDINGS)
@@ -1,7 +1,13 @@
+import subprocess
+import sys
+from os import path
+from uuid import uuid4
 from fastapi.testclient import TestClient
 from starlette.responses import RedirectResponse
 
 from ..main import app
+from ..DATABASE import crud, schemas  # type: ignore
+from ..DATABASE.database import SessionLocal  # type: ignore
 
 client = TestClient(app)
 
@@ -21,3 +27,38 @@ def test_swagger_ui_html():
     response = client.get("/docs")
     assert response.status_code == 200
     assert response.headers["content-type"] == "text/html; charset=utf-8"
+
+
+def test_import_leaves_heavy_modules_to_startup():
+    script = (
+        "import sys; sys.argv.append('dev'); import main; "
+        "heavy = {'torch', 'transformers', 'chromadb', 'nltk'}; "
+        "print(sorted(heavy & set(sys.modules)))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=path.dirname(path.dirname(path.realpath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert output.strip().splitlines()[-1] == "[]"
+
+
+def test_get_job_reads_a_cancelled_job():
+    db = SessionLocal()
+    job_id = uuid4().hex
+    try:
+        # delete_index leaves cancelled jobs in place while their runs stop
+        crud.create_job(
+            db,
+            schemas.IndexJobCreate(
+                job_id=job_id, index_id=uuid4().hex, job_type="index", job_status=-2
+            ),
+        )
+        response = client.get(f"/api/database/get_job/{job_id}")
+        assert response.status_code == 200
+        assert response.json()["status_name"] == "CANCELLED"
+    finally:
+        crud.delete_index(db, crud.get_job(db, job_id).index_id)
+        db.close()